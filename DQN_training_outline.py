@@ -9,9 +9,12 @@ Need to do:
     - Figure out what they mean by error clipping.
     -
 """
-from collections import deque #list like container with faster appends and pops. Can set a fixed length so new appends drop first elements.
 import time
 import os
+
+import numpy as np
+
+from replay_buffer import ReplayBuffer #preallocated ring arrays for (s,a,r,s',done), see replay_buffer.py
 if not os.path.isdir("../models/"):
     os.makedirs("models")
 
@@ -23,6 +26,8 @@ AGGREGATE_STATS_EVERY =  20 #How many cubes to solve before getting some aggrega
 REPLAY_MEMORY_SIZE = 10_000 #Total amount of experiences to hold onto (I felt that)
 MIN_EXPERIENCE_SIZE = 500 #Minimum number of experiences before you start training
 MINIBATCH_SIZE = 64 #WHAT TO DO BRO
+OBSERVATION_SHAPE = (36, 36, 3) #The Environment's visualize() image, 0-255 pixels so they fit in uint8 without loss
+PRIORITIZED_REPLAY = False #Sample experiences by TD error (see replay_buffer.py), the loss then gets scaled by importance weights
 
 UPDATE_TARGET_MODEL_EVERY = 10 #Update the target model every 10 cubes?
 
@@ -31,6 +36,21 @@ MIN_EPSILON = 0.05 #the minimum amount of exploration you will allow
 EPSILON_DECAY = 0.9 #Multiply your epsilon by this every episode or (variable) times: Deepmind actually uses linear decay.
 DISCOUNT_FACTOR = 0.99 #Used throughout.
 
+def bellman_targets(current_qs, future_qs, actions, rewards, dones, discount = DISCOUNT_FACTOR):
+    '''
+    The y of DQNAgent._hidden_train for a whole minibatch with array operations instead of a python loop.
+
+    Row i is current_qs[i] with the column of the action taken replaced by
+        rewards[i] + discount * max(future_qs[i])    if the experience didn't end the episode
+        rewards[i]                                    if it did
+    so only the chosen action contributes to the loss.
+    '''
+    y = np.array(current_qs, dtype = np.float32)
+    max_future_q = np.max(future_qs, axis = 1)
+    #Terminal states have no future reward
+    y[np.arange(len(y)), actions] = rewards + discount * max_future_q * ~np.asarray(dones, dtype = bool)
+    return y
+
 class DQNAgent:
     def __init__(self):
         #Main model_defined here. TODO: define create_model function
@@ -43,9 +63,9 @@ class DQNAgent:
         self.target_model.set_weights(self.model.get_weights())
 
         #Define the size of our memory of "experiences"
-        #An experience is a 4-tuple of (s,a,r,s'). We'll randomly sample from experiences
-        #To update the model weights
-        self.experience_memory = deque(maxlen = REPLAY_MEMORY_SIZE)
+        #An experience is a 4-tuple of (s,a,r,s') (plus done). We'll randomly sample from experiences
+        #To update the model weights. States are the observations the environment hands back, stored as uint8.
+        self.experience_memory = ReplayBuffer(REPLAY_MEMORY_SIZE, state_shape = OBSERVATION_SHAPE, prioritized = PRIORITIZED_REPLAY)
         #counter to determine when to update our target model "set our weights in stone" if you will
         self.target_update_counter = 0
 
@@ -96,37 +116,30 @@ class DQNAgent:
 
         Put another way, we're trying to make q_a1 = q*_a1. This loss is actually across the whole batch of experiences that we randomly sampled.
         '''
-        # Get a minibatch of experiences
-        minibatch = random.sample(self.experience_memory, MINIBATCH_SIZE)
-        # Get the current states from a minibatch and query model for q-values
-        current_states = np.array([experience[0] for experience in minibatch])
+        # Get a minibatch of experiences, already stacked into arrays
+        if PRIORITIZED_REPLAY:
+            #Also where they sit in memory (to give them new priorities) and how much each counts in the loss
+            current_states, actions, rewards, new_states, dones, indices, weights = self.experience_memory.sample(MINIBATCH_SIZE)
+        else:
+            current_states, actions, rewards, new_states, dones = self.experience_memory.sample(MINIBATCH_SIZE)
+            weights = None
+        # Query model for q-values of the current states
         current_qs_list = self.model.predict(current_states)
 
-        #Get future states from minibatch, get the maximum argument of the target_model
-        new_states = np.array([experience[3] for experience in minibatch])
+        #Get the maximum argument of the target_model on the future states
         future_qs_list = self.target_model.predict(new_states)
 
         #We have the q's of our model for the current states, and the q's of the temporary model's next state.
-        #Now we can build our X and Y described previously
-        X = []
-        y = []
-        for index, (current_state, action, reward, new_state, done) in enumerate(minibatch):
-            #If we're not in a terminal state, we get new_state to calculate expected future reward of the new state
-            if not done:
-                max_future_q = np.max(future_qs_list[index])
-                y_i = reward + DISCOUNT * max_future_q
-            #Otherwise, we use the reward as the y_i
-            else:
-                y_i = reward
-            #Build the y_vector we saw in the
-            qs_we_want = current_qs_list.copy()
-            qs_we_want[index] = y_i
-            #Finally, add them to our training data
-            X.append(current_state)
-            y.append(qs_we_want)
-        #Now that we've done that mess, we can actually fit our model to this batch.
+        #Now we can build our X and Y described previously, for the whole minibatch at once (see bellman_targets)
+        y = bellman_targets(current_qs_list, future_qs_list, actions, rewards, dones)
+        #Now we can actually fit our model to this batch, weighting each experience's loss in prioritized replay.
         #Could put tensorboard in here.
-        self.model.fit(np.array(X), np.array(y), batch_size = MINIBATCH_SIZE, verbose=0)
+        self.model.fit(current_states, y, sample_weight = weights, batch_size = MINIBATCH_SIZE, verbose=0)
+        if PRIORITIZED_REPLAY:
+            #The TD error of the action taken is how surprising each experience was, that is its new priority
+            rows = np.arange(len(actions))
+            td_errors = y[rows, actions] - current_qs_list[rows, actions]
+            self.experience_memory.update_priorities(indices, td_errors)
         #Update your target update counter every episode (full rubik's cube you solve)
         self.target_update_counter += 1
         #If update counter reaches threshold, you actually update the target model.
@@ -165,11 +178,11 @@ class DQNAgent:
                 episode_reward += reward
                 #Save experience into  memory
                 #TODO make sure that if new_state is solved that returned done is actually TRUE
-                self.experience_memory.append( (current_state, action, reward, new_state, done) )
+                self.experience_memory.add(current_state, action, reward, next_state, done)
                 if len(self.experience_memory) > MIN_EXPERIENCE_SIZE:
                     self._hidden_train(done)
                     step += 1
-                current_state = new_state
+                current_state = next_state
             ep_rewards.append(episode_reward)
             #This is where you might aggregate stats here.
             #Plot your min/max/average episode rewards every something episodes
@@ -187,3 +200,27 @@ class DQNAgent:
                 epsilon *= EPSILON_DECAY
         print(training_history)
         return(training_history)
+
+
+if __name__ == "__main__":
+    #Microbenchmark: the per-experience loop _hidden_train used to run against bellman_targets
+    import timeit
+    ACTIONS = 12
+    for batch_size in (64, 256, 1024, 4096):
+        current_qs = np.random.random((batch_size, ACTIONS)).astype(np.float32)
+        future_qs = np.random.random((batch_size, ACTIONS)).astype(np.float32)
+        actions = np.random.randint(0, ACTIONS, size = batch_size)
+        rewards = np.random.random(batch_size).astype(np.float32)
+        dones = np.random.random(batch_size) < 0.1
+        def looped():
+            y = []
+            for index in range(batch_size):
+                y_i = rewards[index] if dones[index] else rewards[index] + DISCOUNT_FACTOR * np.max(future_qs[index])
+                qs_we_want = current_qs.copy()
+                qs_we_want[index] = y_i
+                y.append(qs_we_want)
+            return np.array(y)
+        number = max(1, 256 // batch_size)
+        loop_time = timeit.timeit(looped, number = number)/number
+        vector_time = timeit.timeit(lambda: bellman_targets(current_qs, future_qs, actions, rewards, dones), number = 100)/100
+        print("Batch " + str(batch_size) + ": loop " + str(round(loop_time*1000, 2)) + "ms, vectorized " + str(round(vector_time*1000, 3)) + "ms")
@@ -1,6 +1,8 @@
 from abstract_cube import AbstractCube
 
 from cubefactory import cube_factory
+from sticker_cube import StickerCube, _goal_keys, sticker_colors
+from visualize_stickered_cube import color_lookup_table, sticker_layout
 
 import numpy as np
 import random
@@ -12,35 +14,110 @@ class EnsembleStickerCube(AbstractCube):
 
     By default constructs all 24 orientations of a rubik's cube!
     Has option for only 2 cubes, and apply a move only to one cube.
+
+    With single_state = True the 24 cubes aren't kept at all. Every orientation is the same cube with its stickers relabeled,
+    so the ensemble keeps one 54 element gather index (the moves applied so far, self.permutation) and the 24 rotated solved states:
+    cube i is rotated_solved[i][permutation]. A turn is then one permutation of 54 indices instead of 24 cube turns,
+    and visualize builds the whole mosaic with one gather through a precomputed index.
     """
     orientations = [None, "x", "x2", "x'", "z", "x y", "z' y2", "z x'", "z2", "x y2", "y2", "x' y2",
              "z'", "z' x", "z y2","z' x'", "y", "x z'", "y' z2", "z y", "z' y'", "y'", "z y'", "z' y"]
-    def __init__(self, default = True, randomize_representation = False):
+    def __init__(self, default = True, randomize_representation = False, single_state = False):
         self.default = default
         self.random = randomize_representation
-        if default:
+        self.single_state = single_state
+        if single_state:
+            if not default:
+                raise ValueError("single_state only works for the default 24 cube ensemble")
+            self._build_index_maps()
+            self.permutation = list(range(54))
+            #Which orientation sits in each of the 24 slots of the mosaic, shuffled by visualize when randomize_representation is on
+            self.order = np.arange(24)
+        elif default:
             self.cubes = [cube_factory("string") for x in range(24)]
             self._reorient_all()
         else:
             self.cubes = [cubefactory("string") for x in range(2)]
 
     def __str__(self):
+        if self.single_state:
+            out = "So far the moves performed are: " + str(self.history) + " \n"
+            out += "".join(str(state) + " \n" for state in self.states())
+            return out
         out = "".join([cube.__str__() for cube in self.cubes])
         return out
 
-    @AbstractCube.recursively_remap
+    def _build_index_maps(self):
+        """
+        Precomputes, for the current StickerCube.solved_state, the 24 rotated solved states (as sticker codes) and the index
+        that gathers the (36, 36) mosaic out of them.
+        """
+        rotated = []
+        for orientation in EnsembleStickerCube.orientations:
+            #Running the rotation over the sticker indices gives the relabeling it applies
+            index_cube = StickerCube()
+            index_cube.current_state = list(range(54))
+            if orientation is not None:
+                index_cube(orientation)
+            rotated.append([StickerCube.solved_state[x] for x in index_cube.current_state])
+        self.rotated_solved = rotated
+        codes = dict((x, i) for i, x in enumerate(sticker_colors))
+        self._rotated_codes = np.array([[codes[x] for x in state] for state in rotated], dtype = np.intp)
+        #Same integer pixels as StickerCube.visualize
+        self._palette = color_lookup_table(dtype = np.int64)
+        #Pixel (r, c) of the mosaic shows sticker sticker_layout[r % 6][c % 9] of the cube in slot 6*(c // 9) + r // 6
+        rows, columns = np.meshgrid(np.arange(36), np.arange(36), indexing = "ij")
+        self._mosaic_slots = 6*(columns // 9) + rows // 6
+        self._mosaic_stickers = np.array(sticker_layout)[rows % 6, columns % 9]
+
+    def states(self):
+        """
+        The 24 sticker lists (cube i in orientations[i]), built from the single state.
+        """
+        if not self.single_state:
+            return [cube.current_state for cube in self.cubes]
+        return [[solved[x] for x in self.permutation] for solved in self.rotated_solved]
+
     def turn(self, letter):
         """Applies turn to every cube object"""
+        if self.single_state:
+            self.permutation = list(StickerCube._move_table[letter](self.permutation))
+        else:
+            self._turn_each(letter)
+
+    def snapshot(self):
+        '''
+        The single state's permutation, or a snapshot of every cube, for the history's checkpoints.
+        '''
+        if self.single_state:
+            return self.permutation.copy()
+        return [cube.snapshot() for cube in self.cubes]
+
+    def restore(self, snapshot):
+        if self.single_state:
+            self.permutation = snapshot.copy()
+            return
+        for cube, state in zip(self.cubes, snapshot):
+            cube.restore(state)
+
+    @AbstractCube.recursively_remap
+    def _turn_each(self, letter):
         for cube in self.cubes:
             cube.turn(letter)
 
     def reset(self):
+        if self.single_state:
+            del self.history
+            self.permutation = list(range(54))
+            return
         for cube in self.cubes:
             cube.reset()
         if self.default:
             self._reorient_all()
 
     def is_solved(self):
+        if self.single_state:
+            return tuple(self.rotated_solved[0][x] for x in self.permutation) in _goal_keys(tuple(StickerCube.solved_state))
         for cube in self.cubes:
             solved = cube.is_solved()
             break
@@ -63,6 +140,12 @@ class EnsembleStickerCube(AbstractCube):
 
         no implementation for non-default arguments.
         """
+        if self.single_state:
+            if self.random:
+                np.random.shuffle(self.order)
+            #Rotated solved sticker of every pixel, read through the current permutation, then colored
+            codes = self._rotated_codes[self.order[self._mosaic_slots], np.array(self.permutation)[self._mosaic_stickers]]
+            return self._palette[codes]
         if self.random:
             self.cubes = random.sample(self.cubes, len(self.cubes))
         sticker_arrays = [cube.visualize() for cube in self.cubes]
@@ -74,3 +157,16 @@ class EnsembleStickerCube(AbstractCube):
             return out
         else:
             return np.concatenate(sticker_arrays)
+
+
+if __name__ == "__main__":
+    import timeit
+    ensemble = EnsembleStickerCube()
+    single = EnsembleStickerCube(single_state = True)
+    scramble = "L2 B D B' R' L' U F L' U' R2 U B2 L2 D2 B2 R2 U2 F2 U B2"
+    ensemble(scramble)
+    single(scramble)
+    print("Single state agrees with 24 cubes: " + str(ensemble.states() == single.states() and (ensemble.visualize() == single.visualize()).all()))
+    for name, cubes in (("24 cubes", ensemble), ("single state", single)):
+        step = timeit.timeit(lambda: (cubes.turn("R"), cubes.visualize()), number = 500)/500
+        print(name + ": " + str(round(step*1e6)) + "us per turn + visualize")
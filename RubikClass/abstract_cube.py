@@ -1,9 +1,17 @@
 #base
-from functools import wraps
-import pickle
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from functools import lru_cache, wraps
+from itertools import chain, compress
+from operator import not_
+import re
+import warnings
+import zlib
 
 #custom
-from commutator_parser import parse_comm
+from commutator_parser import inverse_move, parse_comm, parse_moves
+from table_cache import load_or_build_bytes
 
 #factory
 #interfaces -- implements
@@ -27,7 +35,45 @@ def make_turn_recursively_remap(turn_method):
     return wrapper
 
 
-common_mistakes = pickle.load(open("common_mistakes.pckl", "rb"))
+class LazyClassAttribute:
+    """
+    Class attribute that is only built, by calling func(cls), the first time it is looked up (on the class or an instance).
+    The result then replaces the descriptor on that class, so every later lookup is a plain attribute lookup:
+
+        class StickerCube(AbstractCube):
+            @LazyClassAttribute
+            def turn_to_cycle(cls):
+                ...
+    """
+    def __init__(self, func):
+        self.func = func
+        self.name = getattr(func, "__name__", None)
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner):
+        value = self.func(owner)
+        setattr(owner, self.name, value)
+        return value
+
+
+#Bump when the basic turns or the way a representation traces them change, so stale move tables in the cache are never read
+move_table_version = 1
+
+#What AbstractCube.compile returns: the normalized moves (kept for the history) and the single composed transform that performs them.
+#codes are the moves as the bytes of their move_codes, what the history records
+CompiledMoves = namedtuple("CompiledMoves", ["moves", "transform", "codes"])
+
+@lru_cache(maxsize = 4096)
+def _compile_moves(cube_class, moves):
+    """
+    Cached body of AbstractCube.compile. Keyed on the representation and the normalized tuple of moves,
+    so an algorithm is only ever composed once per representation (until it falls out of the cache).
+    """
+    basic_turns = [basic for move in moves for basic in AbstractCube.resolve_remap(move)]
+    return CompiledMoves(moves, cube_class._compose_moves(basic_turns), bytes(move_codes[x] for x in moves))
+
 
 class AbstractCube:
     """Abstract Rubik's Cube class. All other representations of a Rubik's cube will inheret from this class.
@@ -39,13 +85,19 @@ class AbstractCube:
 
         recursively_remap: A function that can be used to wrap any subclass's turn method to recursively remap moves if they aren't implemented.
 
-        string_parse: function to parse a string into a list of moves -- replaces common mistakes and parses commutator notation.
+        compile_moves: Alternative to recursively_remap, composes every legal move into one transform ahead of time (see _compose_moves).
+                       Happens the first time a representation's _move_table is used, from the table cache when possible (see load_move_table).
+
+        compile(): turns a string or list of moves into a single (cached) transform, apply() then performs the whole thing in one step.
 
-        _common_mistakes: Dictionary of common mistakes in notation that we'll replace.
+        string_parse: function to parse a string into a list of moves -- splits run-together moves, reports anything illegible and parses commutator notation.
 
         __call__(): accepts lists of turns or strings of moves. Performs these moves on the current cube. No return.
 
-        history: string to keep track of the cube's history.
+        history: MoveHistory of the moves performed through __call__ and apply, prints like a string of moves.
+                 undo(), redo() and seek(k) step back and forth through it.
+
+        push() and pop(): perform and take back moves in place for tree search, outside of the history.
 
 
     Every cube representation must implement these methods:
@@ -54,6 +106,8 @@ class AbstractCube:
 
 
     """
+    #No per instance attributes here, so that representations declaring __slots__ really are dict-free.
+    __slots__ = ()
     #A collection of turns that we commonly see that we remap to turns we can perform.
     _remap = {  'x': ['R', "M'", "L'"], 'x2': ['R2', 'M2', 'L2'], "x'": ["R'", 'M', 'L'], 'y': ['U', "E'", "D'"],
                 'y2': ['U2', 'E2', 'D2'], "y'": ["U'", 'E', 'D'], 'z': ['F', 'S', "B'"], 'z2': ['F2', 'S2', 'B2'],
@@ -72,62 +126,184 @@ class AbstractCube:
                 "l3'": 'l', "f3'": 'f', "U3'": 'U', 'Bw3': "Bw'", "Bw3'": 'Bw', 'R3': "R'", "E2'": 'E2', "u2'": 'u2', "Bw2'": 'Bw2',
                 'B3': "B'", 'y3': "y'", 'Fw3': "Fw'", "Fw2'": 'Fw2', 'E3': "E'", "x2'": 'x2', "Dw3'": 'Dw', 'D3': "D'", 'M3': "M'",
                 "E3'": 'E', "Uw3'": 'Uw', "B2'": 'B2', "F2'": 'F2'}
-    #common mistakes are accidental pairs of moves, and some other things.
-    _common_mistakes = common_mistakes
-    history = ""
+    #Every token string_parse lets through, the commutator punctuation plus every move we know how to perform (directly or through _remap).
+    _legal = {",", ":", "[", "]",
+            'M2', 'U2', 'b2', 'L2', "y3'", 'D', "Lw3'", 'Bw2', 'x', 'F2', "M3'", 'l', 'b3', 'r3', 'f2', "Uw2'", 'R', 'd',
+            "D'", 'Fw', 'D3', "F2'", "D3'", "b3'", 'U3', 'Dw3', "r2'", 'L3', "Dw2'", "l3'", 'E3', "l'", "Rw3'", "Rw'", "Dw'",
+            "Bw3'", "M2'", "D2'", "Uw'", "S'", 'S', "z3'", 'M', 'Lw2', "u3'", "F'", "r3'", 'u2', "Fw3'", 'Uw3', 'l3', "x3'",
+            'r2', 'f3', "L'", 'y', 'U', "Fw'", 'F', 'd2', 'Uw', 'l2', 'u3', "R3'", "d3'", "d2'", "R'", "L3'", "Bw'", "r'", "f3'",
+            "S2'", "x'", "E2'", "d'", 'Bw', "u'", 'S3', "Bw2'", "E'", 'x3', 'R3', 'R2', "M'", "U3'", "B2'", "U'", "Fw2'", 'x2',
+            "l2'", 'y3', 'S2', "u2'", 'b', 'u', 'd3', "Dw3'", 'z3', 'B2', 'y2', "Uw3'", "B3'", "R2'", "Lw'", 'E2', "b2'", 'F3',
+            'Lw3', 'Lw', "y'", 'Fw2', 'Dw2', "f2'", "L2'", 'L', "x2'", 'z', 'B', 'M3', "B'", 'E', 'Dw', "z'", "F3'", 'Rw3', "S3'",
+            "Rw2'", 'D2', 'Bw3', "f'", 'z2', "b'", 'B3', "z2'", "U2'", 'Rw2', "Lw2'", 'Uw2', 'f', 'Fw3', "y2'", 'Rw', 'r', "E3'"}
+    #The history stores a snapshot of the state every this many moves, so seek never replays more than this many
+    checkpoint_interval = 64
 
     #Put all methods that are common between every cube. Commutator Parser, string parser, etc.
     def __call__(self, moves):
-        if isinstance(moves, (list, tuple)):
-            self.history += " "+" ".join(moves)
-            for move in moves:
-                self.turn(move)
-        elif isinstance(moves, str):
+        if isinstance(moves, str):
             moves = self.string_parse(moves)
-            self.history += " "+" ".join(moves)
-            for move in moves:
-                self.turn(move)
-        else:
+        elif not isinstance(moves, (list, tuple)):
             print("This can only accept lists of turns, or strings that can be appropriately parsed")
+            return
+        history = self.history
+        history._start(self)
+        for move in moves:
+            self.turn(move)
+            history._record(self, move_codes[move])
+
+    @property
+    def history(self):
+        """
+        The cube's MoveHistory, made the first time it's needed. Assigning a string or list of moves ("" to clear it) starts a new one.
+        """
+        try:
+            return self._history
+        except AttributeError:
+            self._history = MoveHistory()
+            return self._history
+
+    @history.setter
+    def history(self, moves):
+        self._history = MoveHistory(moves.split() if isinstance(moves, str) else moves)
+
+    @history.deleter
+    def history(self):
+        """Forgets the history without making a new one, the next move starts it again."""
+        try:
+            del self._history
+        except AttributeError:
+            pass
+
+    def undo(self):
+        """
+        Takes back the last move of the history by performing its inverse and returns it (None if there's nothing to undo).
+        The move stays around for redo() until a new move is performed.
+        """
+        history = self.history
+        if history.position == 0:
+            return None
+        history.position -= 1
+        code = history.codes[history.position]
+        self.turn(move_names[inverse_codes[code]])
+        return move_names[code]
+
+    def redo(self):
+        """Performs the last undone move again and returns it (None if there's nothing to redo)."""
+        history = self.history
+        if history.position == len(history.codes):
+            return None
+        code = history.codes[history.position]
+        self.turn(move_names[code])
+        history.position += 1
+        return move_names[code]
+
+    def seek(self, k):
+        """
+        Puts the cube in its state after the first k moves of the history, undone moves included (so this can also redo).
 
-    def string_parse(self, string):
-        '''
-        Method to parse input strings. Replaces anything with parenthesis, commas, newlines, forward or backslashes with spaces. Removes any illegible turns which would be comments or empty strings.
+        Restores the last checkpoint at or before move k and replays the moves from there, or just carries on from the current
+        state when that's closer, so it never performs more than checkpoint_interval moves. Needs snapshot() and restore().
+        """
+        history = self.history
+        if not 0 <= k <= len(history.codes):
+            raise IndexError("Can't seek to move " + str(k) + " of a history of " + str(len(history.codes)) + " moves")
+        index = bisect_right(history._positions, k) - 1
+        if index < 0:
+            raise ValueError("No checkpoint at or before move " + str(k))
+        checkpoint = history._positions[index]
+        start = history.position
+        if not checkpoint <= start <= k:
+            self.restore(history.checkpoints[checkpoint])
+            start = checkpoint
+        for code in history.codes[start:k]:
+            self.turn(move_names[code])
+        history.position = k
+
+    def push(self, move):
+        """
+        Performs a move in place for a tree search, without recording it in the history. pop() takes back the last pushed move,
+        so a depth first search can walk the whole tree with one cube instead of copying a cube per node:
+
+            def search(cube, depth):
+                for move in moves:
+                    cube.push(move)
+                    search(cube, depth - 1)
+                    cube.pop()
+        """
+        self._apply(self._move_table[move])
+        try:
+            self._stack.append(move)
+        except AttributeError:
+            self._stack = [move]
+
+    def pop(self):
+        """Takes back the last pushed move with its precomputed inverse transform, and returns it."""
+        try:
+            move = self._stack.pop()
+        except (AttributeError, IndexError):
+            raise IndexError("pop from a cube with no pushed moves") from None
+        self._apply(self._inverse_table[move])
+        return move
+
+    #Transform of every move's inverse, move -> the transform of inverse_move(move), for pop
+    _inverse_table = LazyClassAttribute(lambda cls: dict((x, cls._move_table[inverse_move(x)]) for x in move_names))
+
+    def snapshot(self):
+        """Must implement snapshot() to use seek. Returns a copy of the raw state buffers that restore() can put back."""
+        raise NotImplementedError(AbstractCube.snapshot.__doc__)
+
+    def restore(self, snapshot):
+        """Must implement restore(snapshot) to use seek. Puts the state saved by snapshot() back."""
+        raise NotImplementedError(AbstractCube.restore.__doc__)
+
+    def compile(self, moves):
+        """
+        Composes a whole string or list of moves (e.g. a PLL) into one transform for this representation.
 
-        Returns a list of turns.
+        Strings are normalized through string_parse first. The result is cached on the normalized moves in a bounded LRU cache
+        (see compile_cache_info), so compiling the same algorithm again is a lookup. Perform it with apply().
+        """
+        if isinstance(moves, str):
+            moves = self.string_parse(moves)
+        return _compile_moves(type(self), tuple(moves))
+
+    def apply(self, compiled):
+        """
+        Performs moves compiled by compile() in one step: one transform, and the history takes the precompiled move codes in one go,
+        so a 17 move algorithm costs less than performing a single move through __call__.
+        """
+        history = self.history
+        history._start(self)
+        self._apply(compiled.transform)
+        history._record_many(self, compiled.codes)
 
+    @staticmethod
+    def compile_cache_info():
+        """Hits, misses, maxsize and currsize of the cache behind compile()."""
+        return _compile_moves.cache_info()
 
-        Todo:
+    def string_parse(self, string, strict = False):
+        '''
+        Method to parse input strings. Parenthesis, newlines, forward and backslashes separate turns like spaces do, and run-together
+        turns (RUR'U', U'M', Rw2') are split apart, see tokenize_moves.
 
-        - Parse strings without spaces between turns.
+        Anything illegible (comments, typos) is left out and reported: a warning by default, a ValueError listing the spans if strict.
 
+        Returns a list of turns.
         '''
-        #replace common things we'll find with spaces
-        replacements = [("\n"," "), ("("," "), (")"," "), ("/"," "), ("\\", " "), ("["," [ "), ("]"," ] "), (","," , "), (":"," : ")]
-        for item, replacement in replacements:
-            string = string.replace(item, replacement)
-        moves = string.split(" ")
-        legal = {",", ":", "[", "]",
-                'M2', 'U2', 'b2', 'L2', "y3'", 'D', "Lw3'", 'Bw2', 'x', 'F2', "M3'", 'l', 'b3', 'r3', 'f2', "Uw2'", 'R', 'd',
-                "D'", 'Fw', 'D3', "F2'", "D3'", "b3'", 'U3', 'Dw3', "r2'", 'L3', "Dw2'", "l3'", 'E3', "l'", "Rw3'", "Rw'", "Dw'",
-                "Bw3'", "M2'", "D2'", "Uw'", "S'", 'S', "z3'", 'M', 'Lw2', "u3'", "F'", "r3'", 'u2', "Fw3'", 'Uw3', 'l3', "x3'",
-                'r2', 'f3', "L'", 'y', 'U', "Fw'", 'F', 'd2', 'Uw', 'l2', 'u3', "R3'", "d3'", "d2'", "R'", "L3'", "Bw'", "r'", "f3'",
-                "S2'", "x'", "E2'", "d'", 'Bw', "u'", 'S3', "Bw2'", "E'", 'x3', 'R3', 'R2', "M'", "U3'", "B2'", "U'", "Fw2'", 'x2',
-                "l2'", 'y3', 'S2', "u2'", 'b', 'u', 'd3', "Dw3'", 'z3', 'B2', 'y2', "Uw3'", "B3'", "R2'", "Lw'", 'E2', "b2'", 'F3',
-                'Lw3', 'Lw', "y'", 'Fw2', 'Dw2', "f2'", "L2'", 'L', "x2'", 'z', 'B', 'M3', "B'", 'E', 'Dw', "z'", "F3'", 'Rw3', "S3'",
-                "Rw2'", 'D2', 'Bw3', "f'", 'z2', "b'", 'B3', "z2'", "U2'", 'Rw2', "Lw2'", 'Uw2', 'f', 'Fw3', "y2'", 'Rw', 'r', "E3'"}
-        #replace all common spacing mistakes in the list
-        moves = [AbstractCube._common_mistakes[x] if x in AbstractCube._common_mistakes else x for x in moves]
-        moves = " ".join(moves).split(" ") #combine and then split it on space to remove any illegal moves
-        legal_moves = [x for x in moves if x in legal]
-        commutator_remains = " ".join(legal_moves) #make a string for parse_comm
-        #Hopefully nobody uses stuff like Rw in a commutator, otherwise we'll need to update the inverse function
-        #We will find out when we test out the database.
-        last_cleaning = parse_comm(commutator_remains)
-        #This will remove any duplicate spaces introduced by parsing the commutator
-        out = [x for x in last_cleaning.split(" ") if x != ""]
-        #join on spaces and pass it off
-        return out
+        tokens, invalid = tokenize_moves(string)
+        if invalid:
+            message = "Could not parse " + ", ".join(repr(string[start:end]) + " at " + str(start) for start, end in invalid)
+            if strict:
+                raise ValueError(message)
+            warnings.warn(message, stacklevel = 2)
+        if _moves.issuperset(tokens):
+            return tokens
+        if _plain_groups.issuperset(tokens):
+            return [x for x in tokens if x in _moves]
+        #Commutators, conjugates or repeated groups to expand
+        return expand_moves(tokens)
 
     def reset(self):
         """Must implement a reset method on any representation."""
@@ -135,6 +311,77 @@ class AbstractCube:
 
     #Functions that allows child class to decorate a basic turn so that it'll recursively remap unperformable turns
     recursively_remap = lambda func: make_turn_recursively_remap(func)
+
+    @staticmethod
+    def resolve_remap(letter):
+        """
+        Follows _remap all the way down to the basic turns, e.g. "Rw'" becomes ["R'", "M"] and "x" becomes ["R", "M'", "L'"].
+
+        Does the same walk as recursively_remap, but only once, so that the result can be compiled into a table.
+        """
+        if letter not in AbstractCube._remap:
+            return [letter]
+        remapped = AbstractCube._remap[letter]
+        if not isinstance(remapped, (list, tuple)):
+            remapped = [remapped]
+        return [basic for lett in remapped for basic in AbstractCube.resolve_remap(lett)]
+
+    @classmethod
+    def compile_moves(cls):
+        """
+        One time compile step: resolves every legal move through _remap and composes its basic turns into a single transform.
+
+        The results are stored in the class's _move_table (move -> transform), so that any notation costs one table application in turn.
+        A representation opts in by implementing _trace_moves and _transform_from_trace, see _compose_moves.
+        """
+        cls._move_table = dict((move, cls._compose_moves(AbstractCube.resolve_remap(move))) for move in AbstractCube._legal_moves())
+        return cls._move_table
+
+    @classmethod
+    def load_move_table(cls):
+        """
+        Same table as compile_moves, but the traces of every move are read from (or saved to) the table cache, memory-mapped,
+        so a new process only has to turn the bytes back into transforms. This is what fills _move_table on first use.
+
+        The cached file is named after the representation, move_table_version and a checksum of the legal moves and _remap.
+        """
+        moves = AbstractCube._legal_moves()
+        checksum = zlib.crc32(repr((moves, sorted(AbstractCube._remap.items()))).encode())
+        name = cls.__name__ + "_moves_v" + str(move_table_version) + "_" + format(checksum, "08x")
+        traces = load_or_build_bytes(name, lambda: b"".join(cls._trace_moves(AbstractCube.resolve_remap(x)) for x in moves))
+        size = len(traces)//len(moves)
+        if size*len(moves) != len(traces) or size == 0:
+            return cls.compile_moves()
+        cls._move_table = dict((move, cls._transform_from_trace(traces[i*size:(i + 1)*size])) for i, move in enumerate(moves))
+        return cls._move_table
+
+    #Filled in by load_move_table the first time a turn needs it, so importing a representation doesn't build anything
+    _move_table = LazyClassAttribute(lambda cls: cls.load_move_table())
+
+    @staticmethod
+    def _legal_moves():
+        """Every legal move without the commutator punctuation, sorted (the order of the cached move tables)."""
+        return sorted(x for x in AbstractCube._legal if x not in {",", ":", "[", "]"})
+
+    @classmethod
+    def _compose_moves(cls, letters):
+        """One transform performing all of the basic turns in order, built from the representation's _trace_moves."""
+        return cls._transform_from_trace(cls._trace_moves(letters))
+
+    @classmethod
+    def _trace_moves(cls, letters):
+        """Must implement _trace_moves(basic_turns) to use compile_moves and compile. Returns bytes of the same length for any basic turns, describing their combined effect."""
+        raise NotImplementedError(AbstractCube._trace_moves.__doc__)
+
+    @classmethod
+    def _transform_from_trace(cls, trace):
+        """Must implement _transform_from_trace(trace) to use compile_moves and compile. Turns bytes from _trace_moves into the transform _apply performs."""
+        raise NotImplementedError(AbstractCube._transform_from_trace.__doc__)
+
+    def _apply(self, transform):
+        """Must implement _apply(transform) to use apply. Performs a transform built by _compose_moves on the current state."""
+        raise NotImplementedError(AbstractCube._apply.__doc__)
+
     def turn(self, move):
         """
         Every Representation (or child) of an AbstractCube must implement a turn method.
@@ -167,3 +414,238 @@ class AbstractCube:
     def solved_state(self):
         """Must implement a solved state field within any representation of a Rubik's Cube"""
         raise NotImplementedError(AbstractCube.solved_state.__doc__)
+
+
+#Every legal move as a one byte code (its index in move_names), and the code of its inverse
+move_names = AbstractCube._legal_moves()
+move_codes = dict((move, i) for i, move in enumerate(move_names))
+inverse_codes = bytes(move_codes[inverse_move(x)] for x in move_names)
+#The 24 orientations of a whole cube as rotations from the usual one: which face goes on top, then a turn about the new vertical axis
+whole_cube_rotations = [[x for x in (first, second) if x] for first in ("", "x", "x2", "x'", "z", "z'") for second in ("", "y", "y'", "y2")]
+
+
+class MoveHistory:
+    """
+    The moves a cube performed, one byte per move (its code in move_codes) in an array, so recording a move is an O(1) append.
+    They only become a string when printed: str(history) is "R U R' U'".
+
+    position is how many of the moves are currently performed, the ones after it were undone and can be redone until a new move
+    is performed. Every checkpoint_interval moves the cube's snapshot() is kept in checkpoints (position -> snapshot) for seek.
+    """
+    __slots__ = ("codes", "position", "checkpoints", "_positions")
+
+    def __init__(self, moves = ()):
+        self.codes = array("B", [move_codes[x] for x in moves])
+        self.position = len(self.codes)
+        self.checkpoints = {}
+        #Sorted keys of checkpoints
+        self._positions = []
+
+    def __len__(self):
+        return self.position
+
+    def __iter__(self):
+        return (move_names[x] for x in self.codes[:self.position])
+
+    def __str__(self):
+        return " ".join(self)
+
+    def __repr__(self):
+        return "MoveHistory(" + repr(str(self)) + ")"
+
+    def moves(self):
+        """The performed moves as a list."""
+        return list(self)
+
+    def _checkpoint(self, cube):
+        if self.position not in self.checkpoints:
+            try:
+                self.checkpoints[self.position] = cube.snapshot()
+            except NotImplementedError:
+                #Representations without snapshot() still get undo and redo, just not seek
+                return
+            self._positions.append(self.position)
+
+    def _start(self, cube):
+        """
+        Called before performing new moves: forgets the undone moves (and their checkpoints), and checkpoints the state
+        the history starts from.
+        """
+        if self.position < len(self.codes):
+            del self.codes[self.position:]
+            while self._positions and self._positions[-1] > self.position:
+                del self.checkpoints[self._positions.pop()]
+        if not self._positions:
+            self._checkpoint(cube)
+
+    def _record(self, cube, code):
+        self.codes.append(code)
+        self.position += 1
+        if self.position % cube.checkpoint_interval == 0:
+            self._checkpoint(cube)
+
+    def _record_many(self, cube, codes):
+        """Moves performed in one step by apply (their codes as bytes), checkpointed once at the end if they crossed a multiple of checkpoint_interval."""
+        before = self.position
+        self.codes.frombytes(codes)
+        self.position += len(codes)
+        if self.position//cube.checkpoint_interval != before//cube.checkpoint_interval:
+            self._checkpoint(cube)
+
+
+_moves = set(AbstractCube._legal_moves())
+#Moves in parenthesis without repetitions, which don't need parsing
+_plain_groups = _moves | {"(", ")"}
+#Spells out _moves: a face (maybe wide), slice, lower case wide turn or rotation, then 2, 3, 2', 3' or ' (never on its own)
+_move = r"(?:[URFLBD]w?|[urfldbMESxyz])(?:[23]'?|')?"
+_separators = r"\s()/\\\[\],:"
+#Commutator punctuation, groups (( and then ) with its repetition: )2, )' or )2') and words, anything between separators
+_word_pattern = re.compile(r"[\[\],:(]|\)\d*'?|[^" + _separators + r"]+")
+_run_pattern = re.compile("(?:" + _move + ")+")
+_move_pattern = re.compile(_move)
+#Tokens of every word seen so far (up to _word_cache_size of them), False for illegible words
+_words = dict((x, (x,)) for x in "[],:(")
+_word_cache_size = 1 << 16
+_match_text = re.Match.group
+
+def _split_word(word):
+    """The tokens of a word: a run of moves split apart, a group ending as it is, or False when it's illegible."""
+    if word[0] == ")":
+        tokens = (word,)
+    elif _run_pattern.fullmatch(word):
+        tokens = tuple(_move_pattern.findall(word))
+    else:
+        tokens = False
+    if len(_words) < _word_cache_size:
+        _words[word] = tokens
+    return tokens
+
+def tokenize_moves(string):
+    """
+    Splits a string into moves, commutator punctuation and groups ("(" and ")", ")2", ")'" or ")2'") in one pass over it,
+    without resolving them (commutator_parser.parse_moves does that).
+
+    A word (anything between whitespace, parenthesis, slashes or commutator punctuation) is either entirely moves, which may be
+    run together ("RUR'U'" is R U R' U'), or illegible as a whole ("OLL", "R'." or "sexy").
+
+    Returns (tokens, invalid), invalid being the (start, end) span in string of every illegible word.
+    """
+    matches = list(_word_pattern.finditer(string))
+    #Words are looked up whole, reconstructions use the same few over and over
+    splits = list(map(_words.get, map(_match_text, matches)))
+    invalid = []
+    #Only new words and illegible ones need a look of their own
+    for i in compress(range(len(splits)), map(not_, splits)):
+        tokens = splits[i]
+        if tokens is None:
+            tokens = _split_word(matches[i].group())
+        if tokens is False:
+            invalid.append(matches[i].span())
+            tokens = ()
+        splits[i] = tokens
+    return list(chain.from_iterable(splits)), invalid
+
+def _repeat(group, end):
+    """A group's moves repeated and/or inverted as its end token says, like parse_moves does with )2, )' or )2'."""
+    group = group*int(end[1:].rstrip("'") or 1)
+    if end.endswith("'"):
+        group = [inverse_move(x) for x in reversed(group)]
+    return group
+
+@lru_cache(maxsize = 4096)
+def _expand_brackets(tokens):
+    """The moves of one outermost pair of brackets (a tuple of tokens), the same commutators keep coming back in reconstructions."""
+    return tuple(parse_moves(tokens).expand())
+
+def expand_moves(tokens):
+    """
+    Expands tokens from tokenize_moves into moves, the same as parse_moves(tokens).expand(), but groups are expanded in place
+    and only the outermost brackets go through parse_moves, so a long reconstruction with the odd commutator doesn't become a MoveTree.
+    """
+    moves = []
+    #Where the groups still open started in moves
+    starts = []
+    depth = 0
+    #tokens before done are already in moves (or in brackets being parsed)
+    done = 0
+    #Only the tokens that aren't moves need a look, the moves between them are copied over in slices
+    for i in compress(range(len(tokens)), map(not_, map(_moves.__contains__, tokens))):
+        token = tokens[i]
+        if depth:
+            if token == "[":
+                depth += 1
+            elif token == "]":
+                depth -= 1
+                if not depth:
+                    moves += _expand_brackets(tuple(tokens[bracket:i + 1]))
+                    done = i + 1
+            continue
+        moves += tokens[done:i]
+        done = i + 1
+        if token == "(":
+            starts.append(len(moves))
+        elif token[0] == ")":
+            #An unmatched ) is skipped, like parse_moves does
+            if starts:
+                start = starts.pop()
+                if token != ")":
+                    moves[start:] = _repeat(moves[start:], token)
+        elif token == "[":
+            depth = 1
+            bracket = i
+        else:
+            #A , or : outside of brackets splits the whole thing, or a stray ]
+            return parse_moves(tokens).expand()
+    if depth:
+        #Raises about the unclosed [
+        return parse_moves(tokens).expand()
+    moves += tokens[done:]
+    return moves
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    print(tokenize_moves("RUR'U' Rw2'U'M' // sexy (R U R' U')2 [R, U']"))
+
+    #The old string_parse: nine replace passes, then a dict of every concatenated pair of moves, then a filter against _legal
+    common_mistakes = dict((x + y, x + " " + y) for x in AbstractCube._legal for y in AbstractCube._legal)
+    def old_string_parse(string):
+        replacements = [("\n"," "), ("("," "), (")"," "), ("/"," "), ("\\", " "), ("["," [ "), ("]"," ] "), (","," , "), (":"," : ")]
+        for item, replacement in replacements:
+            string = string.replace(item, replacement)
+        moves = [common_mistakes[x] if x in common_mistakes else x for x in string.split(" ")]
+        moves = [x for x in " ".join(moves).split(" ") if x in AbstractCube._legal]
+        return [x for x in parse_comm(" ".join(moves)).split(" ") if x != ""]
+
+    #Reconstruction-like lines: spaced and run-together moves, triggers in parenthesis, comments and the odd commutator
+    random.seed(0)
+    moves = sorted(_moves)
+    def reconstruction(commented):
+        steps = []
+        for step in range(8):
+            words = random.choices(moves, k = random.randint(4, 14))
+            if random.random() < 0.3:
+                words = ["".join(words[i:i + 4]) for i in range(0, len(words), 4)]
+            line = " ".join(words)
+            if random.random() < 0.3:
+                line = "(" + line + ")"
+            if random.random() < 0.1:
+                line += " [R, U'] [R U R': D]"
+            if commented and random.random() < 0.5:
+                line += " // step " + str(step)
+            steps.append(line)
+        return "\n".join(steps)
+    cube = AbstractCube()
+    warnings.simplefilter("ignore")
+    for commented in (False, True):
+        corpus = [reconstruction(commented) for x in range(20000)]
+        characters = sum(len(x) for x in corpus)
+        print(str(len(corpus)) + " reconstructions" + (" with comments" if commented else "") + ", " + str(round(characters/2**20, 1)) + "MB")
+        for name, parse in (("old string_parse", old_string_parse), ("tokenizer string_parse", cube.string_parse)):
+            start = time.perf_counter()
+            total = sum(len(parse(x)) for x in corpus)
+            elapsed = time.perf_counter() - start
+            print("    " + name + ": " + str(total) + " moves, " + str(round(len(corpus)/elapsed)) + " reconstructions per second, "
+                  + str(round(characters/elapsed/2**20, 2)) + "MB per second")
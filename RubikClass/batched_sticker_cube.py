@@ -0,0 +1,164 @@
+import numpy as np
+
+from abstract_cube import AbstractCube, LazyClassAttribute
+from goals import goal_progress, reached_goals
+from sticker_cube import StickerCube, sticker_colors
+from state_keys import solved_sticker_states, sticker_state_keys
+from visualize_stickered_cube import render_stickers
+
+_sticker_codes = dict((x, i) for i, x in enumerate(sticker_colors))
+
+
+def encode_stickers(stickers):
+    '''
+    Converts a 54 element sticker list (or a list of them) into uint8 codes, e.g. ['w', 'b', ...] becomes [0, 1, ...]
+    '''
+    if len(stickers) and isinstance(stickers[0], str):
+        return np.array([_sticker_codes[x] for x in stickers], dtype=np.uint8)
+    return np.array([[_sticker_codes[x] for x in row] for row in stickers], dtype=np.uint8).reshape(-1, 54)
+
+def decode_stickers(codes):
+    '''
+    Inverse of encode_stickers. A single row of codes gives back a sticker list, a 2D array gives back a list of sticker lists.
+    '''
+    codes = np.asarray(codes)
+    if codes.ndim == 1:
+        return [sticker_colors[x] for x in codes]
+    return [[sticker_colors[x] for x in row] for row in codes]
+
+
+class BatchedStickerCube(AbstractCube):
+    """
+    A whole batch of sticker cubes held in a single (N, 54) uint8 array, one cube per row.
+
+    Uses the same sticker layout as StickerCube (see its docstring), with every color replaced by its index in sticker_colors.
+
+    Every legal move is flattened into a 54 element gather index (the basic turns straight from StickerCube.turn_to_cycle,
+    the rest from StickerCube's compiled move table), so a move is one fancy-index gather over the whole batch:
+
+        rubiks = BatchedStickerCube(10000)
+        rubiks("R U R' U'")                     #every cube gets the same moves
+        rubiks.turn_each(np.random.randint(0, len(rubiks.moves), size = 10000))   #one move per cube
+
+    Turning through __call__ or turn applies to every row, turn_each applies a (possibly different) move per row.
+    """
+    #Every legal move, the basic turns first so that their indices don't depend on the remapped ones. Built on first use, like StickerCube's tables.
+    moves = LazyClassAttribute(lambda cls: list(StickerCube.turn_to_cycle) + sorted(set(StickerCube._move_table) - set(StickerCube.turn_to_cycle)))
+    move_index = LazyClassAttribute(lambda cls: dict((x, i) for i, x in enumerate(cls.moves)))
+    #Row i is the gather index for moves[i]. Remapped moves come already composed from StickerCube's compiled table.
+    move_table = LazyClassAttribute(lambda cls: np.array([StickerCube._move_table[x](range(54)) for x in cls.moves], dtype=np.intp))
+    #The same rows by move, what push and pop perform
+    _move_table = LazyClassAttribute(lambda cls: dict(zip(cls.moves, cls.move_table)))
+    solved_state = encode_stickers(StickerCube.solved_state)
+    #An (N,) array of goal ids (see goals.py), one goal per cube for is_solved and goal_progress. None checks every cube against solved_state.
+    goal_ids = None
+
+    def __init__(self, number_of_cubes):
+        self.current_state = np.tile(BatchedStickerCube.solved_state, (number_of_cubes, 1))
+        #Second buffer so that turning the whole batch doesn't allocate
+        self._buffer = np.empty_like(self.current_state)
+
+    def __len__(self):
+        return len(self.current_state)
+
+    def __str__(self):
+        out = ""
+        out += "So far the moves performed are: " + str(self.history) + " \n"
+        out += "The batch holds " + str(len(self)) + " cubes, " + str(int(self.is_solved().sum())) + " of them are solved. \n"
+        return out
+
+    def turn(self, letter):
+        '''
+        Applies a single turn (any legal move, rotations and wide moves included) to every cube in the batch.
+        '''
+        self._apply(self.move_table[self.move_index[letter]])
+
+    def _apply(self, transform):
+        '''
+        Gathers every row through one 54 element index.
+        '''
+        np.take(self.current_state, transform, axis = 1, out = self._buffer)
+        self.current_state, self._buffer = self._buffer, self.current_state
+
+    def snapshot(self):
+        '''
+        A copy of the whole (N, 54) batch, for the history's checkpoints.
+        '''
+        return self.current_state.copy()
+
+    def restore(self, snapshot):
+        np.copyto(self.current_state, snapshot)
+
+    @classmethod
+    def _compose_moves(cls, letters):
+        '''
+        Composes basic turns into a single gather index, the same one StickerCube uses.
+        '''
+        return np.array(StickerCube._compose_moves(letters)(range(54)), dtype = np.intp)
+
+    def turn_each(self, moves):
+        '''
+        Applies one move to each cube. moves is an array of length N of indices into BatchedStickerCube.moves,
+        so row i is turned by moves[moves[i]].
+
+        Not recorded in the history, since every cube has a different one.
+        '''
+        index = self.move_table[np.asarray(moves)]
+        self.current_state = np.take_along_axis(self.current_state, index, axis = 1)
+
+    def state_keys(self):
+        '''
+        Packed key of every cube, an (N,) array of 21 byte voids that matches StickerCube.state_key (see state_keys.py).
+        '''
+        return sticker_state_keys(self.current_state)
+
+    def visualize(self, color = True, dtype = np.uint8, out = None):
+        '''
+        Images of every cube, (N, 6, 9, 3) in color or (N, 6, 9, 1) in black and white, laid out like StickerCube.visualize.
+        See visualize_stickered_cube.render_stickers.
+        '''
+        return render_stickers(self.current_state, bandw = not color, dtype = dtype, out = out)
+
+    def reset(self, rows = None):
+        '''
+        Resets every cube (or only the cubes in rows, which can be indices or a boolean mask) to the solved state.
+        '''
+        if rows is None:
+            del self.history
+            self.current_state[:] = BatchedStickerCube.solved_state
+        else:
+            self.current_state[rows] = BatchedStickerCube.solved_state
+
+    def is_solved(self):
+        '''
+        Returns a boolean array, True for every cube that is solved_state in one of the 24 orientations, like StickerCube.is_solved.
+        See state_keys.solved_sticker_states. With goal_ids set, every cube is checked against its own goal instead (goals.reached_goals).
+        '''
+        if self.goal_ids is not None:
+            return reached_goals(self.current_state, self.goal_ids)
+        return solved_sticker_states(self.current_state, decode_stickers(self.solved_state))
+
+    def goal_progress(self):
+        '''
+        Fraction of every cube's goal stickers that are in place (goal_ids, or the full solve when it isn't set), see goals.goal_progress.
+        '''
+        return goal_progress(self.current_state, 0 if self.goal_ids is None else self.goal_ids)
+
+
+if __name__ == "__main__":
+    import timeit
+    scramble = "L2 B D B' R' L' U F L' U' R2 U B2 L2 D2 B2 R2 U2 F2 U B2"
+    rubiks = BatchedStickerCube(4)
+    rubiks(scramble)
+    single = StickerCube()
+    single(scramble)
+    print("Batch agrees with StickerCube: " + str(all(x == single.current_state for x in decode_stickers(rubiks.current_state))))
+
+    number = 10000
+    rubiks = BatchedStickerCube(number)
+    actions = np.random.randint(0, len(BatchedStickerCube.moves), size = number)
+    batched = timeit.timeit(lambda: rubiks.turn_each(actions), number = 100)/100
+    cubes = [StickerCube() for x in range(number)]
+    looped = timeit.timeit(lambda: [cube.turn("R") for cube in cubes], number = 3)/3
+    print("Stepping " + str(number) + " cubes: " + str(round(looped*1000, 2)) + "ms looping StickerCube, "
+          + str(round(batched*1000, 2)) + "ms batched, " + str(round(number/batched)) + " cube steps per second.")
@@ -1,49 +1,228 @@
+'''
+Parser for commutator notation: sequences of moves with conjugates [A: B] (A B A'), commutators [A, B] (A B A' B'),
+groups in parenthesis (A) and repetitions (A)2, (A)' or (A)2' of a group.
+
+The moves are parsed once into a MoveTree, where every distinct subexpression is stored a single time, so repeated pieces
+(the [R, U] in [[R, U]: [R, U]]) are only ever expanded or composed once. A tree can then be expanded into a list of moves,
+or composed straight into a permutation without expanding it (see MoveTree.compose).
+'''
+from functools import lru_cache
+from itertools import chain
+from operator import itemgetter
+import re
+
+#Brackets, commutator punctuation, the start and end of a group (with its repetition) and everything else as moves
+_token_pattern = re.compile(r"[\[\],:(]|\)\d*'?|[^\s\[\],:()]+")
+
+
+def inverse_move(move):
+    '''
+    Inverts a single move, keeping its notation: R and R', Rw and Rw', R3 and R3' swap, half turns (R2, R2', x2) are their own inverse.
+    '''
+    if move.endswith("'"):
+        return move[:-1]
+    if move.endswith("2"):
+        return move
+    return move + "'"
+
+#inverse_move with every answer kept, for inverting long expansions
+_inverse_moves = lru_cache(maxsize = None)(inverse_move)
+
 def inverse(A):
     '''
     Inverts a sequence of turns:
     R U R' becomes R U' R'
     '''
-    x = A.split(" ")
-    x = [p for p in x if p != ""]
-    reformatted = [l+"'" if len(l) == 1 else l if "2" in l else l[0] for l in x]
-    reformatted = reformatted[::-1]
-    return " ".join(reformatted)
+    return " ".join(inverse_move(x) for x in reversed(A.split(" ")) if x != "")
+
+def _compose(a, b):
+    '''
+    a then b for gathers (new_state[i] = old_state[a[i]]).
+    '''
+    return itemgetter(*b)(a) if len(b) > 1 else tuple(a[x] for x in b)
+
+def _compose_all(permutations):
+    out = permutations[0]
+    for x in permutations[1:]:
+        out = _compose(out, x)
+    return out
+
+def _invert(a):
+    out = [0]*len(a)
+    for i, x in enumerate(a):
+        out[x] = i
+    return tuple(out)
+
+def _power(a, count, identity):
+    '''
+    a composed with itself count times, by squaring.
+    '''
+    out = identity
+    while count:
+        if count & 1:
+            out = _compose(out, a)
+        a = _compose(a, a)
+        count >>= 1
+    return out
+
+
+class MoveTree:
+    """
+    A parsed sequence of moves. nodes[i] is one of
+        ("move", move)
+        ("sequence", (child, child, ...))
+        ("conjugate", A, B)         [A: B] = A B A'
+        ("commutator", A, B)        [A, B] = A B A' B'
+        ("repeat", child, count)    (A)3
+        ("inverse", child)          (A)'
+    where children are indices of earlier nodes, and no node appears twice. root is the index of the whole thing.
+
+    Build one with parse_moves.
+    """
+    def __init__(self):
+        self.nodes = []
+        self._index = {}
+        self.root = None
+
+    def _node(self, *node):
+        '''
+        Index of node, adding it if it's new.
+        '''
+        if node not in self._index:
+            self._index[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self._index[node]
+
+    def _evaluate(self, leaf, combine, invert, power):
+        '''
+        Evaluates every node once, children first, with leaf(move), combine([a, b, ...]) (a then b then ...), invert(a) and power(a, count).
+        Inverses are memoized too, as [A: B] and [A, B] need them.
+        '''
+        values = []
+        inverses = {}
+        def inverse_of(i):
+            if i not in inverses:
+                inverses[i] = invert(values[i])
+            return inverses[i]
+        for node in self.nodes:
+            kind = node[0]
+            if kind == "move":
+                value = leaf(node[1])
+            elif kind == "sequence":
+                value = combine([values[x] for x in node[1]]) if node[1] else power(None, 0)
+            elif kind == "conjugate":
+                value = combine([values[node[1]], values[node[2]], inverse_of(node[1])])
+            elif kind == "commutator":
+                value = combine([values[node[1]], values[node[2]], inverse_of(node[1]), inverse_of(node[2])])
+            elif kind == "repeat":
+                value = power(values[node[1]], node[2])
+            else:
+                value = inverse_of(node[1])
+            values.append(value)
+        return values[self.root]
+
+    def expand(self):
+        '''
+        The moves the whole tree stands for, as a list.
+        '''
+        return list(self._evaluate(lambda move: (move,), lambda parts: tuple(chain.from_iterable(parts)),
+                                   lambda a: tuple(map(_inverse_moves, reversed(a))),
+                                   lambda a, count: a*count if count else ()))
+
+    def compose(self, move_permutation, size = None):
+        '''
+        Composes the tree straight into one gather (new_state[i] = old_state[permutation[i]]) without expanding it:
+        every distinct subexpression is composed once, inverses are inverted permutations and repetitions are done by squaring.
+
+        move_permutation(move) gives the gather for a single move, e.g. lambda x: StickerCube._move_table[x](range(54)).
+        size is the length of the permutations, only needed when the tree has no moves at all.
+        '''
+        permutations = {}
+        def leaf(move):
+            if move not in permutations:
+                permutations[move] = tuple(move_permutation(move))
+            return permutations[move]
+        if size is None:
+            size = next((len(leaf(node[1])) for node in self.nodes if node[0] == "move"), 0)
+        identity = tuple(range(size))
+        return self._evaluate(leaf, _compose_all, _invert, lambda a, count: identity if count == 0 else _power(a, count, identity))
+
+
+def parse_moves(tokens):
+    '''
+    Parses a list of tokens (moves, "[", "]", ",", ":", "(" and ")" followed by a repetition like ")2", ")'" or ")2'")
+    into a MoveTree. A , or : splits the brackets (or the whole thing) it's in into A and B.
+
+    Unbalanced parenthesis are forgiven (reconstructions are full of them), an unmatched ")" is skipped and an unclosed "(" ends with the moves,
+    or with the brackets it's in.
+    Anything else that doesn't fit raises a ValueError.
+    '''
+    tree = MoveTree()
+    position = 0
+    #The token that closed the last group, ")" when it was never closed
+    group_end = ")"
+
+    def body(closing):
+        nonlocal position, group_end
+        parts = [[]]
+        separators = []
+        while position < len(tokens):
+            token = tokens[position]
+            position += 1
+            if token == "[":
+                parts[-1].append(body("]"))
+            elif token == "(":
+                group = body(")")
+                parts[-1].append(_repetition(group, group_end))
+            elif token in (",", ":"):
+                separators.append(token)
+                parts.append([])
+            elif token == "]" or token.startswith(")"):
+                if closing == token[0]:
+                    group_end = token
+                    return _combine(parts, separators)
+                if token == "]":
+                    if closing == ")":
+                        #An unclosed ( ends at the brackets it's in, which still have to see their ]
+                        position -= 1
+                        group_end = ")"
+                        return _combine(parts, separators)
+                    raise ValueError("Unmatched ] in " + " ".join(tokens))
+                #unmatched ), skip it
+            else:
+                parts[-1].append(tree._node("move", token))
+        if closing == "]":
+            raise ValueError("Unclosed [ in " + " ".join(tokens))
+        group_end = ")"
+        return _combine(parts, separators)
+
+    def _repetition(group, end):
+        count = int(end[1:].rstrip("'") or 1)
+        if count != 1:
+            group = tree._node("repeat", group, count)
+        if end.endswith("'"):
+            group = tree._node("inverse", group)
+        return group
+
+    def _combine(parts, separators):
+        sequences = [tree._node("sequence", tuple(x)) if len(x) != 1 else x[0] for x in parts]
+        if len(separators) == 0:
+            return sequences[0]
+        if len(separators) > 1:
+            raise ValueError("More than one , or : in the same brackets in " + " ".join(tokens))
+        return tree._node("commutator" if separators[0] == "," else "conjugate", sequences[0], sequences[1])
+
+    tree.root = body(None)
+    return tree
 
 def parse_comm(s):
-    shortcut = set([",",":","[", "]"]).intersection(set(s))
-    if len(shortcut) == 0:
-        return(s)
-    start = 0
-    count = 0
-    out = []
-    for i in range(len(s)):
-        l = s[i]
-        if l == "[":
-            if count == 0:
-                out.append(s[start:i])
-                start = i+1
-            count += 1
-        elif l == "]":
-            count -= 1
-            if count == 0:
-                out.append(s[start:i])
-                start = i+1
-        elif (l == "," or l == ":") and count == 0:
-            a = " ".join([parse_comm(x) for x in out]) + s[start: i]
-            b = s[i+1:len(s)]
-            a, b = parse_comm(a), parse_comm(b)
-            if l == ",":
-                comm_out = a + b + " "+ inverse(a) +" "+ inverse(b)
-            if l == ":":
-                comm_out = a + b + " " +inverse(a)
-            return comm_out
-    if len(out) == 0:
-        return s
-    else:
-        if start < len(s):
-            out.append(s[start:len(s)])
-        out = [parse_comm(x) for x in out]
-        return " ".join(out)
+    '''
+    Expands the commutators, conjugates and repetitions in a string of space separated moves, returns the moves as a string.
+    '''
+    tokens = _token_pattern.findall(s)
+    if not set("[],:()").intersection(s):
+        return " ".join(tokens)
+    return " ".join(parse_moves(tokens).expand())
 
 if __name__ == "__main__":
     # This runs tests on the commutator parser.
@@ -53,20 +232,75 @@ if __name__ == "__main__":
             7 : "[R: U]",
             4 : " F [R U: R' [x, y] F]",
             5 : "[ F R: [M', U2]] [[r: U], D2]",
-            6 : "[ F R: [[M', U2]: [[r:U], D2]]]"}
-    #print(wow[5])
-    def io_verbose(func):
-        def wrapper(s):
-            print("Processing substring: " + s)
-            x = func(s)
-            print("Output is: " + x)
-            return func(s)
-        return wrapper
-    #parse_comm = io_verbose(parse_comm)
-    #print(parse_comm(wow[5]))
-    #'''
+            6 : "[ F R: [[M', U2]: [[r:U], D2]]]",
+            8 : "[Rw' U: ([R, U])2]",
+            9 : "(R U R' U')3 (R U)' [Rw, U']"}
     for thingy in wow.values():
         print(thingy)
         print("becomes")
         print(parse_comm(thingy) + "\n")
-    #'''
+
+    import time
+    from sticker_cube import StickerCube
+
+    #Composing straight into a permutation gives the same stickers as performing the expanded moves
+    move_permutation = lambda x: StickerCube._move_table[x](range(54))
+    for thingy in wow.values():
+        tree = parse_moves(_token_pattern.findall(thingy))
+        cube = StickerCube()
+        cube(tree.expand())
+        if [StickerCube.solved_state[x] for x in tree.compose(move_permutation)] != cube.current_state:
+            print("Composed permutation disagrees on " + thingy)
+
+    #The old parser, re-scanning and re-slicing strings all the way down
+    def old_inverse(A):
+        x = [p for p in A.split(" ") if p != ""]
+        return " ".join([l+"'" if len(l) == 1 else l if "2" in l else l[0] for l in x][::-1])
+    def old_parse_comm(s):
+        if len(set([",",":","[", "]"]).intersection(set(s))) == 0:
+            return(s)
+        start = 0
+        count = 0
+        out = []
+        for i in range(len(s)):
+            l = s[i]
+            if l == "[":
+                if count == 0:
+                    out.append(s[start:i])
+                    start = i+1
+                count += 1
+            elif l == "]":
+                count -= 1
+                if count == 0:
+                    out.append(s[start:i])
+                    start = i+1
+            elif (l == "," or l == ":") and count == 0:
+                a = " ".join([old_parse_comm(x) for x in out]) + s[start: i]
+                b = s[i+1:len(s)]
+                a, b = old_parse_comm(a), old_parse_comm(b)
+                if l == ",":
+                    return a + b + " "+ old_inverse(a) +" "+ old_inverse(b)
+                return a + b + " " +old_inverse(a)
+        if len(out) == 0:
+            return s
+        if start < len(s):
+            out.append(s[start:len(s)])
+        return " ".join([old_parse_comm(x) for x in out])
+
+    #[[A: [[R, U], [R, U]]]: ...] nested deeper and deeper, the same pieces over and over
+    nested = "[R, U]"
+    for depth in range(1, 7):
+        nested = "[[F: [" + nested + ", " + nested + "]]: D]"
+        start = time.perf_counter()
+        old = old_parse_comm(nested).split()
+        old_time = time.perf_counter() - start
+        start = time.perf_counter()
+        tree = parse_moves(_token_pattern.findall(nested))
+        new = tree.expand()
+        new_time = time.perf_counter() - start
+        start = time.perf_counter()
+        tree.compose(move_permutation)
+        compose_time = time.perf_counter() - start
+        print("Depth " + str(depth) + ", " + str(len(nested)) + " characters, " + str(len(new)) + " moves (" + str(len(tree.nodes)) + " distinct pieces): "
+              + "old " + str(round(old_time*1000, 2)) + "ms, tree " + str(round(new_time*1000, 2)) + "ms, composed " + str(round(compose_time*1000, 2)) + "ms"
+              + ("" if old == new else " (outputs differ)"))
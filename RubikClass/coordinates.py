@@ -0,0 +1,195 @@
+'''
+Coordinate encodings of GroupCube and their move tables.
+
+A coordinate is a small integer describing one aspect of the cube (see GroupCube.corner_twist and friends), and a move table maps
+(coordinate, move) -> coordinate for the 18 face turns in GroupCube.face_turns. Once the tables are built, moves are applied entirely
+in coordinate space:
+
+    tables = move_tables()
+    twist = tables["corner_twist"][twist, GroupCube.face_turns.index("R")]
+
+Everything here works on whole numpy arrays of coordinates at once, which is how the tables themselves are built.
+
+The full edge permutation (12! values) is too large for a table, so its moves go through edge_permutation_move instead.
+'''
+from functools import lru_cache
+from math import comb, factorial
+
+import numpy as np
+
+from groupcube import GroupCube
+
+#Column j of every move table is the move GroupCube.face_turns[j]
+face_turns = GroupCube.face_turns
+#Number of values each coordinate takes
+coordinate_sizes = {"corner_twist": 3**7, "edge_flip": 2**11, "corner_permutation": factorial(8), "ud_slice": comb(12, 4)}
+
+
+def rank_permutations(perms):
+    '''
+    Vectorized rank_permutation, an (N, n) array of permutations of range(n) becomes an (N,) array of ranks.
+    '''
+    perms = np.asarray(perms)
+    n = perms.shape[1]
+    ranks = np.zeros(len(perms), dtype = np.int64)
+    for i in range(n - 1):
+        smaller = (perms[:, i+1:] < perms[:, i:i+1]).sum(axis = 1)
+        ranks += smaller * factorial(n - 1 - i)
+    return ranks
+
+def unrank_permutations(ranks, n):
+    '''
+    Vectorized unrank_permutation, an (N,) array of ranks becomes an (N, n) array of permutations.
+    '''
+    ranks = np.array(ranks, dtype = np.int64)
+    #Lehmer digits first, then each digit picks from the values not used yet.
+    digits = np.empty((len(ranks), n), dtype = np.int64)
+    for i in range(n):
+        digits[:, i], ranks = np.divmod(ranks, factorial(n - 1 - i))
+    out = np.empty((len(digits), n), dtype = np.int64)
+    used = np.zeros((len(digits), n), dtype = bool)
+    for i in range(n):
+        #The digit-th unused value is the first value with digit+1 unused values up to and including it
+        unused_so_far = np.cumsum(~used, axis = 1)
+        value = np.argmax((unused_so_far == digits[:, i:i+1] + 1) & ~used, axis = 1)
+        out[:, i] = value
+        used[np.arange(len(digits)), value] = True
+    return out
+
+def orientations_to_coordinate(orientations, base):
+    '''
+    Position-keyed orientations (N, n) into the twist (base 3) or flip (base 2) coordinate, ignoring the implied last position.
+    '''
+    orientations = np.asarray(orientations, dtype = np.int64)
+    coordinate = np.zeros(len(orientations), dtype = np.int64)
+    for position in range(orientations.shape[1] - 1):
+        coordinate = base*coordinate + orientations[:, position]
+    return coordinate
+
+def coordinate_to_orientations(coordinate, base, n):
+    '''
+    Inverse of orientations_to_coordinate, the last position is filled in so the orientations sum to 0 mod base.
+    '''
+    coordinate = np.array(coordinate, dtype = np.int64)
+    out = np.empty((len(coordinate), n), dtype = np.int64)
+    for position in range(n - 2, -1, -1):
+        coordinate, out[:, position] = np.divmod(coordinate, base)
+    out[:, n-1] = -out[:, :n-1].sum(axis = 1) % base
+    return out
+
+def _binomials(n, k):
+    '''
+    math.comb(n, k) for an array of k between 0 and 4.
+    '''
+    k = np.asarray(k)
+    return np.array([comb(n, x) for x in range(5)], dtype = np.int64)[k]
+
+def occupancy_to_slice(occupied):
+    '''
+    An (N, 12) boolean array, True where a position holds an E slice edge, into the ud_slice coordinate.
+    '''
+    #Count positions from 4 so that the solved slice ranks to 0, see GroupCube.ud_slice
+    occupied = np.roll(np.asarray(occupied, dtype = bool), -4, axis = 1)
+    seen = np.cumsum(occupied, axis = 1)
+    binomials = np.array([[comb(q, k) for k in range(5)] for q in range(12)], dtype = np.int64)
+    return (occupied * binomials[np.arange(12), seen]).sum(axis = 1)
+
+def slice_to_occupancy(coordinate):
+    '''
+    Inverse of occupancy_to_slice.
+    '''
+    coordinate = np.array(coordinate, dtype = np.int64)
+    occupied = np.zeros((len(coordinate), 12), dtype = bool)
+    #Greedy colex unranking, the largest slot first
+    remaining = 4
+    for q in range(11, -1, -1):
+        take = (remaining > 0) & (_binomials(q, remaining) <= coordinate)
+        coordinate = np.where(take, coordinate - _binomials(q, remaining), coordinate)
+        occupied[:, q] = take
+        remaining = remaining - take
+    return np.roll(occupied, 4, axis = 1)
+
+@lru_cache(maxsize = None)
+def face_turn_transforms():
+    '''
+    The compiled GroupCube transform of every face turn as arrays:
+    (corner source (18, 8), corner twist by starting position (18, 8), edge source (18, 12), edge flip by starting position (18, 12)).
+    '''
+    corner_source, corner_twist, edge_source, edge_flip = [], [], [], []
+    for move in face_turns:
+        corners, twists, edges, flips, centers = GroupCube._move_table[move]
+        corner_source.append(corners(range(8)))
+        twist = [0]*8
+        for position, lookup in twists:
+            twist[position] = lookup[0]
+        corner_twist.append(twist)
+        edge_source.append(edges(range(12)))
+        edge_flip.append([int(x in flips) for x in range(12)])
+    return tuple(np.array(x, dtype = np.int64) for x in (corner_source, corner_twist, edge_source, edge_flip))
+
+@lru_cache(maxsize = None)
+def move_tables():
+    '''
+    Builds (once) the (coordinate, move) -> coordinate tables for corner_twist, edge_flip, corner_permutation and ud_slice.
+
+    Returns a dict of name -> (size, 18) uint16 array. A move sends the cubie in its source position to the target,
+    and position-keyed orientations pick up the twist collected at the source.
+    '''
+    corner_source, corner_twist, edge_source, edge_flip = face_turn_transforms()
+    twists = coordinate_to_orientations(np.arange(coordinate_sizes["corner_twist"]), 3, 8)
+    flips = coordinate_to_orientations(np.arange(coordinate_sizes["edge_flip"]), 2, 12)
+    corners = unrank_permutations(np.arange(coordinate_sizes["corner_permutation"]), 8)
+    slices = slice_to_occupancy(np.arange(coordinate_sizes["ud_slice"]))
+    tables = dict((name, np.empty((size, len(face_turns)), dtype = np.uint16)) for name, size in coordinate_sizes.items())
+    for move in range(len(face_turns)):
+        source = corner_source[move]
+        tables["corner_twist"][:, move] = orientations_to_coordinate((twists[:, source] + corner_twist[move][source]) % 3, 3)
+        tables["corner_permutation"][:, move] = rank_permutations(corners[:, source])
+        source = edge_source[move]
+        tables["edge_flip"][:, move] = orientations_to_coordinate((flips[:, source] + edge_flip[move][source]) % 2, 2)
+        tables["ud_slice"][:, move] = occupancy_to_slice(slices[:, source])
+    return tables
+
+def edge_permutation_move(edge_permutation, move):
+    '''
+    Applies a face turn (index into face_turns) to edge permutation ranks, without a table since there are 12! of them.
+    '''
+    source = face_turn_transforms()[2][move]
+    edges = unrank_permutations(np.atleast_1d(edge_permutation), 12)
+    return rank_permutations(edges[:, source])
+
+def apply_moves(coordinates, moves):
+    '''
+    Applies face turns (names or indices into face_turns) to a dict of coordinates, e.g. {"corner_twist": 0, "ud_slice": 0},
+    entirely in coordinate space. Values can be integers or arrays of coordinates. Returns a new dict.
+    '''
+    tables = move_tables()
+    out = dict(coordinates)
+    for move in moves:
+        if isinstance(move, str):
+            move = face_turns.index(move)
+        for name, value in out.items():
+            if name == "edge_permutation":
+                out[name] = edge_permutation_move(value, move)
+            else:
+                out[name] = tables[name][value, move]
+    return out
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    start = time.perf_counter()
+    tables = move_tables()
+    print("Built move tables in " + str(round(time.perf_counter() - start, 2)) + "s: "
+          + ", ".join(name + " " + str(table.shape) for name, table in tables.items()))
+
+    #Coordinates tracked through the tables agree with the ones read off a cube
+    moves = [random.choice(face_turns) for x in range(50)]
+    rubik = GroupCube()
+    rubik(moves)
+    tracked = apply_moves({"corner_twist": 0, "edge_flip": 0, "corner_permutation": 0, "ud_slice": 0, "edge_permutation": 0}, moves)
+    read = {"corner_twist": rubik.corner_twist(), "edge_flip": rubik.edge_flip(), "corner_permutation": rubik.corner_permutation(),
+            "ud_slice": rubik.ud_slice(), "edge_permutation": rubik.edge_permutation()}
+    print("Move tables agree with GroupCube: " + str(all(int(np.squeeze(tracked[x])) == read[x] for x in read)))
+    print("Round trip through coordinates: " + str(GroupCube.from_coordinates(*rubik.coordinates()).basic_state_vector() == rubik.basic_state_vector()))
@@ -3,29 +3,33 @@ from sticker_cube import StickerCube
 
 
 def decorate_cube_factory(func):
-    '''Extends the functionality of cube factory so that we can change the default solve_state, but only once for consistency.'''
-    def wrapper(cube_type = "string", new_solved_state = None, replace_solved_state = set()):
+    '''Extends the functionality of cube factory so that a cube can get its own solved_state or goal.'''
+    def wrapper(cube_type = "string", new_solved_state = None, goal = None):
         """
         Function that produces cubes of various types depending on cube_type argument.
 
         Parameters:
             cube_type: "string" and "group" strings to return the respective representations of a Rubik's cube.
 
-            new_solved_state: Replaces the cube_type's class attribute with this variable. Cannot replace twice.
+            new_solved_state: A (masked) solved state for this cube only, it starts in it and is_solved checks against it.
+                              Other cubes, made before or after, keep the class's solved_state.
 
-            replace_solved_state: mutable object to keep track of classes with replaced solved_state
+            goal: A goals.Goal (or the name of one in goals.goals) that is_solved checks this cube against, the cube starts solved.
         """
-        if cube_type in replace_solved_state:
-            return func(cube_type)
-        else:
-            if new_solved_state is None:
-                return func(cube_type)
-            else:
-                cube = func(cube_type)
-                cube.__class__.solved_state = new_solved_state
-                cube = func(cube_type) #have to get a new cube because class attribute is old.
-                replace_solved_state.add(cube_type)
-                return cube
+        cube = func(cube_type)
+        if new_solved_state is None and goal is None:
+            return cube
+        if not isinstance(cube, StickerCube):
+            raise ValueError("Only string cubes can have their own solved state or goal, not " + str(cube_type))
+        if new_solved_state is not None:
+            cube.solved_state = list(new_solved_state)
+            cube.reset()
+        if goal is not None:
+            if isinstance(goal, str):
+                from goals import goals
+                goal = goals[goal]
+            cube.goal = goal
+        return cube
     return wrapper
 
 @decorate_cube_factory
@@ -36,5 +40,3 @@ def cube_factory(cube_type):
         return GroupCube()
     else:
         raise ValueError("Can only accept: string and group, and definitely not: " + str(cube_type))
-
-        
\ No newline at end of file
@@ -0,0 +1,196 @@
+'''
+Batched state encoders for neural networks.
+
+Every encoder writes float32 into a contiguous buffer it owns and returns a view of the first N rows, so encoding a batch allocates
+nothing new and the result can go straight to torch.from_numpy (the buffer is reused, so copy or consume it before the next call):
+
+    encoder = StickerOneHotEncoder(max_batch = 4096)
+    x = torch.from_numpy(encoder(rubiks.current_state))        #(N, 324) from a BatchedStickerCube
+
+    encoder = CubieOneHotEncoder(max_batch = 4096)
+    x = encoder(group_state_array(cubes))                      #(N, 480) from GroupCubes
+
+The functions underneath (sticker_one_hot, cubie_one_hot, basic_state_vectors) take an out array instead, for callers managing their own buffers
+(and cubie_one_hot a scratch from cubie_scratch, to allocate nothing either).
+'''
+import numpy as np
+
+from state_keys import group_state_array
+
+_face_colors = np.arange(6, dtype = np.uint8)
+#(start, end) column pairs of a group state row (see state_keys.group_state_array) in basic_state_vector order:
+#corner orient, corner perm, edge orient, edge perm
+_basic_columns = ((20, 28), (0, 8), (28, 40), (8, 20))
+#For the 20 cubies of cubie_one_hot (8 corners then 12 edges): the column of their permutation group in a row of positions,
+#where their 24 placements start in a row of out, and for the 20 slots their position times the orientations there are
+_cubie_offsets = np.array([0]*8 + [8]*12, dtype = np.intp)
+_cubie_starts = np.arange(0, 480, 24, dtype = np.intp)
+_slot_placements = np.r_[0:24:3, 0:24:2].astype(np.intp)
+_one = np.ones(1, dtype = np.float32)
+
+
+def _group_states(states):
+    '''
+    GroupCubes or an (N, 46) array of group states, as the array (the array itself when it already is uint8).
+    '''
+    if len(states) and not isinstance(states, np.ndarray) and hasattr(states[0], "current_state"):
+        return group_state_array(states)
+    return np.asarray(states, dtype = np.uint8).reshape(-1, 46)
+
+def sticker_one_hot(codes, out):
+    '''
+    (N, 54) sticker codes into out, an (N, 54, 6) float32 array: one entry per sticker for each face color.
+    Masked stickers ('e' and '') are all zeros.
+    '''
+    codes = np.asarray(codes).reshape(-1, 54)
+    np.equal(codes[:, :, None], _face_colors, out = out)
+    return out
+
+def cubie_scratch(max_batch):
+    '''
+    Work arrays for cubie_one_hot on up to max_batch states, all (max_batch, 20) intp: two to work in, then the start of each row's
+    cubies in a flat (max_batch, 20) array of positions and in a flat out. Passing the same ones to every call keeps cubie_one_hot
+    from allocating (numpy buffers broadcasting and mixed dtypes, so everything it adds up is a full intp array).
+    '''
+    rows = np.arange(max_batch, dtype = np.intp)[:, None]
+    return (np.empty((max_batch, 20), dtype = np.intp), np.empty((max_batch, 20), dtype = np.intp),
+            rows*20 + _cubie_offsets, rows*480 + _cubie_starts)
+
+def cubie_one_hot(states, out, scratch = None):
+    '''
+    (N, 46) group states into out, an (N, 20, 24) float32 array: for each of the 8 corner and then 12 edge cubies,
+    a one-hot of where it is and how it is turned (position*3 + twist for corners, position*2 + flip for edges).
+
+    scratch is from cubie_scratch, made for this call when None.
+    '''
+    states = _group_states(states)
+    number = len(states)
+    if scratch is None:
+        scratch = cubie_scratch(number)
+    index, placement, row_positions, row_out = (x[:number] for x in scratch)
+    #Position of every cubie is the inverse of the permutation: scatter each slot to the cubie in it
+    np.copyto(index, states[:, 0:20])
+    np.add(index, row_positions, out = index)
+    np.put(placement, index, _slot_placements)
+    #Plus its orientation and where it is in out
+    np.copyto(index, states[:, 20:40])
+    np.add(index, placement, out = index)
+    np.add(index, row_out, out = index)
+    out.fill(0)
+    np.put(out, index, _one)
+    return out
+
+def basic_state_vectors(states, out):
+    '''
+    (N, 46) group states into out, an (N, 40) float32 array laid out like GroupCube.basic_state_vector.
+    '''
+    states = _group_states(states)
+    column = 0
+    for start, end in _basic_columns:
+        out[:, column:column + end - start] = states[:, start:end]
+        column += end - start
+    return out
+
+
+class Encoder:
+    """
+    Owns a (max_batch, *shape) float32 buffer and encodes into it, see the module docstring.
+    Subclasses set shape and encode (one of the functions above), and scratch when encode takes work arrays (made once for max_batch).
+    """
+    shape = ()
+    encode = None
+    scratch = None
+
+    def __init__(self, max_batch):
+        self.buffer = np.zeros((max_batch,) + self.shape, dtype = np.float32)
+        self.work = None if self.scratch is None else type(self).scratch(max_batch)
+
+    @property
+    def size(self):
+        '''
+        Number of floats per state, the network's input size.
+        '''
+        return int(np.prod(self.shape))
+
+    def __call__(self, states, flat = True):
+        '''
+        Encodes a batch of states and returns a view of the buffer, (N, size) when flat, otherwise (N, *shape).
+        '''
+        number = len(states)
+        if number > len(self.buffer):
+            raise ValueError("The buffer holds " + str(len(self.buffer)) + " states, got " + str(number))
+        if self.work is None:
+            out = type(self).encode(states, self.buffer[:number])
+        else:
+            out = type(self).encode(states, self.buffer[:number], self.work)
+        return out.reshape(number, -1) if flat else out
+
+
+class StickerOneHotEncoder(Encoder):
+    """
+    54 stickers x 6 colors, from (N, 54) sticker codes.
+    """
+    shape = (54, 6)
+    encode = staticmethod(sticker_one_hot)
+
+
+class CubieOneHotEncoder(Encoder):
+    """
+    20 cubies x 24 placements, from GroupCubes or (N, 46) group states.
+    """
+    shape = (20, 24)
+    encode = staticmethod(cubie_one_hot)
+    scratch = staticmethod(cubie_scratch)
+
+
+class BasicStateEncoder(Encoder):
+    """
+    GroupCube.basic_state_vector as floats, from GroupCubes or (N, 46) group states.
+    """
+    shape = (40,)
+    encode = staticmethod(basic_state_vectors)
+
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+    from batched_sticker_cube import BatchedStickerCube
+    from groupcube import GroupCube
+    from StickerEnsemble import EnsembleStickerCube
+
+    cube = GroupCube()
+    cube("R U R' U' F2 D")
+    print("Matches basic_state_vector: " + str(BasicStateEncoder(1)([cube])[0].tolist() == cube.basic_state_vector()))
+
+    number = 4096
+    rubiks = BatchedStickerCube(number)
+    for i in range(20):
+        rubiks.turn_each(np.random.randint(0, 18, size = number))
+    cubes = [GroupCube() for x in range(number)]
+    for cube in cubes[:256]:
+        cube(" ".join(np.random.choice(["U", "R'", "F2", "L", "D'", "B", "x", "y'"], size = 20)))
+    states = group_state_array(cubes)
+
+    #The out= path with a reused scratch should allocate nothing that grows with the batch, only a few Python objects
+    encoder = CubieOneHotEncoder(number)
+    encoder(states)
+    tracemalloc.start()
+    encoder(states)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("CubieOneHotEncoder allocates " + str(peak) + " bytes for " + str(number) + " states, no arrays: " + str(peak < 4096))
+
+    #Today's pipeline, one (36, 36, 3) = 3888 float image of the 24 cube ensemble per state
+    ensemble = EnsembleStickerCube()
+    start = time.perf_counter()
+    for i in range(200):
+        image = ensemble.visualize().astype(np.float32)
+    per_state = (time.perf_counter() - start)/200
+    print("Ensemble visualize(): " + str(round(1/per_state)) + " states per second")
+
+    for encoder, batch in ((StickerOneHotEncoder(number), rubiks.current_state), (CubieOneHotEncoder(number), states), (BasicStateEncoder(number), states)):
+        start = time.perf_counter()
+        for i in range(20):
+            encoder(batch)
+        per_state = (time.perf_counter() - start)/(20*number)
+        print(type(encoder).__name__ + " (" + str(encoder.size) + " floats): " + str(round(1/per_state)) + " states per second")
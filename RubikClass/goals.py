@@ -0,0 +1,262 @@
+'''
+Goals: which stickers have to be in place for a cube to count as solved, so one batch can train on a mix of them
+(full solve, cross, F2L, CMLL) without touching StickerCube.solved_state.
+
+A Goal is a mask (the stickers that matter) plus the colors they should have. Any of the 24 orientations counts, and the orientation
+is read off the centers, so checking a goal is one comparison. A goal can read it off some of the centers only (CMLL ignores the
+M slice, so only the L and R centers), then every orientation those centers allow is tried.
+
+A Goal on its own is for single cubes. Batch rows carry goal ids instead, the index of a registered goal in registered_goals
+(register or goal_id gives it). The same mask, colors and orientation faces always get the same id, so goals made per cube don't pile up:
+
+    cube = StickerCube()
+    cube.goal = goals["f2l"]
+    cube.is_solved()
+
+    goal_ids = np.array([goal_ids["solved"], goal_ids["cross"], ...])      #one per row of a BatchedStickerCube
+    reached_goals(rubiks.current_state, goal_ids)      #(N,) bool
+    goal_progress(rubiks.current_state, goal_ids)      #(N,) fraction of each row's goal stickers in place
+
+All registered goals are compiled into one stacked table of comparison arrays (see compiled_goals), so mixed goals cost the same as one.
+'''
+from operator import itemgetter
+
+import numpy as np
+
+from sticker_cube import StickerCube, sticker_colors
+
+_codes = dict((x, i) for i, x in enumerate(sticker_colors))
+#Sticker index of the center of each face
+_centers = [face*9 + 4 for face in range(6)]
+
+#Every registered Goal, a goal's id is its index here
+registered_goals = []
+#(mask, colors, orientation faces) -> id of the registered goal
+_interned = {}
+#The stacked table of registered_goals, rebuilt when a goal is added (see compiled_goals)
+_table = None
+
+
+class Goal:
+    """
+    The stickers that matter (mask, 54 booleans) and the colors they should have (colors, 54 stickers, StickerCube.solved_state by default).
+    The centers of colors decide which orientation a cube is in, so they should be the usual face colors even when they're masked.
+    orientation_faces are the faces (U, B, R, F, L, D = 0..5) whose centers are read, all six by default.
+    """
+    def __init__(self, mask, colors = None, name = None, orientation_faces = None):
+        if colors is None:
+            colors = StickerCube.solved_state
+        if len(mask) != 54 or len(colors) != 54:
+            raise ValueError("A goal needs a mask and colors for all 54 stickers")
+        self.mask = [bool(x) for x in mask]
+        self.colors = list(colors)
+        self.name = name
+        self.orientation_faces = tuple(range(6)) if orientation_faces is None else tuple(sorted(orientation_faces))
+        #Set by register
+        self.id = None
+        self._key_centers = [_centers[x] for x in self.orientation_faces]
+        positions = [i for i, x in enumerate(self.mask) if x]
+        #Per orientation (whole_cube_rotations order): which stickers have to be which color, and the orientations their centers allow
+        self._orientations = {}
+        self._getters, self._targets = [], []
+        for orientation, gather in enumerate(StickerCube.rotation_gathers):
+            rotated = [self.colors[i] for i in gather]
+            self._orientations.setdefault(tuple(rotated[i] for i in self._key_centers), []).append(orientation)
+            rotated_positions = sorted(gather.index(i) for i in positions)
+            getter = itemgetter(*rotated_positions) if len(rotated_positions) > 1 else (lambda x, i = tuple(rotated_positions): tuple(x[j] for j in i))
+            self._getters.append(getter)
+            self._targets.append(getter(rotated))
+
+    @classmethod
+    def from_solved_state(cls, solved_state, name = None):
+        '''
+        The goal of a masked solved state like cube_factory's new_solved_state: every sticker that isn't a face color ('e', '', ' ')
+        doesn't matter, the rest has to be the color it has there.
+        '''
+        face_colors = set(sticker_colors[:6])
+        mask = [x in face_colors for x in solved_state]
+        colors = [x if keep else solved for x, keep, solved in zip(solved_state, mask, StickerCube.solved_state)]
+        return cls(mask, colors, name)
+
+    @classmethod
+    def fixed_by(cls, moves, name = None):
+        '''
+        The goal of every sticker that none of the moves disturb, e.g. fixed_by(["U"]) is F2L.
+        '''
+        mask = [True]*54
+        for move in moves:
+            for i, x in enumerate(StickerCube._move_table[move](range(54))):
+                if i != x:
+                    mask[i] = False
+        return cls(mask, name = name)
+
+    @classmethod
+    def of_cubies(cls, cubies, faces, name = None, orientation_faces = None):
+        '''
+        The goal of every sticker of the cubies (names in StickerCube.cubie_lookup, like "DL" or "URF") and of the centers of faces.
+        '''
+        mask = [False]*54
+        for i in [x for cubie in cubies for x in StickerCube.cubie_lookup[cubie].default_value] + [_centers[x] for x in faces]:
+            mask[i] = True
+        return cls(mask, name = name, orientation_faces = orientation_faces)
+
+    def __repr__(self):
+        return "Goal(" + repr(self.name) + ", " + str(sum(self.mask)) + " stickers)"
+
+    def orientation(self, stickers):
+        '''
+        Index in whole_cube_rotations of the orientation a cube's stickers are in: the one the goal is reached in, otherwise the first
+        one its centers allow (None when they match no orientation).
+        '''
+        candidates = self._orientations.get(tuple(stickers[i] for i in self._key_centers))
+        if candidates is None:
+            return None
+        return next((x for x in candidates if self._getters[x](stickers) == self._targets[x]), candidates[0])
+
+    def is_reached(self, stickers):
+        '''
+        True when every sticker of the goal is in place, in an orientation the centers allow.
+        '''
+        for orientation in self._orientations.get(tuple(stickers[i] for i in self._key_centers), ()):
+            if self._getters[orientation](stickers) == self._targets[orientation]:
+                return True
+        return False
+
+    def compile(self):
+        '''
+        The comparison arrays of this goal: (targets, masks, center keys, key mask), (24, 54) uint8 color codes, (24, 54) bool,
+        (24,) int64 and an int, one row per orientation. A center key packs the codes of the 6 centers, 3 bits each, and only the bits of
+        the orientation_faces (the key mask) count.
+        '''
+        gathers = np.array(StickerCube.rotation_gathers, dtype = np.intp)
+        codes = np.array([_codes[x] for x in self.colors], dtype = np.uint8)
+        targets = codes[gathers]
+        masks = np.array(self.mask, dtype = bool)[gathers]
+        key_mask = sum(7 << (3*x) for x in self.orientation_faces)
+        return targets, masks, _center_keys(targets) & key_mask, key_mask
+
+    def key(self):
+        '''What register interns goals by: the mask, colors and orientation faces.'''
+        return (tuple(self.mask), tuple(self.colors), self.orientation_faces)
+
+
+def register(goal):
+    '''
+    Registers goal for batches (see compiled_goals) and returns its id. A goal with the same key as a registered one gets that one's id,
+    nothing is added.
+    '''
+    if goal.id is None:
+        key = goal.key()
+        if key not in _interned:
+            _interned[key] = len(registered_goals)
+            registered_goals.append(goal)
+        goal.id = _interned[key]
+    return goal.id
+
+def _center_keys(codes):
+    return (codes[..., _centers].astype(np.int64) << np.arange(0, 18, 3)).sum(axis = -1)
+
+def compiled_goals():
+    '''
+    Every registered goal stacked into (targets (G, 24, 54) uint8, masks (G, 24, 54) bool, center keys (G, 24) int64, key masks (G,),
+    sticker counts (G,)), indexed by goal id. Built once and again only when a goal has been registered since.
+    '''
+    global _table
+    if _table is None or len(_table[0]) != len(registered_goals):
+        targets, masks, keys, key_masks = (np.stack(x) for x in zip(*[goal.compile() for goal in registered_goals]))
+        _table = (targets, masks, keys, key_masks, masks[:, 0].sum(axis = 1))
+    return _table
+
+def _oriented(states, goal_ids):
+    '''
+    For every row, its goal's targets and mask in each orientation its centers allow: yields (rows, targets, masks) once per round,
+    rows being the rows with an orientation still left to try. Goals that read all six centers only have the one round.
+    '''
+    targets, masks, keys, key_masks, counts = compiled_goals()
+    goal_ids = np.broadcast_to(np.asarray(goal_ids, dtype = np.intp), (len(states),))
+    same_centers = keys[goal_ids] == (_center_keys(states) & key_masks[goal_ids])[:, None]
+    rows = np.flatnonzero(same_centers.any(axis = 1))
+    same_centers = same_centers[rows]
+    while len(rows):
+        orientation = np.argmax(same_centers, axis = 1)
+        #Every row takes part in the first round as a rule, a slice spares copying them
+        index = slice(None) if len(rows) == len(states) else rows
+        yield index, targets[goal_ids[index], orientation], masks[goal_ids[index], orientation]
+        same_centers[np.arange(len(rows)), orientation] = False
+        left = same_centers.any(axis = 1)
+        rows, same_centers = rows[left], same_centers[left]
+
+def reached_goals(states, goal_ids):
+    '''
+    Batched Goal.is_reached: an (N,) bool array for an (N, 54) array of sticker codes, row i checked against registered_goals[goal_ids[i]]
+    (goal_ids can be a single id for every row).
+    '''
+    states = np.asarray(states, dtype = np.uint8).reshape(-1, 54)
+    reached = np.zeros(len(states), dtype = bool)
+    for rows, targets, masks in _oriented(states, goal_ids):
+        reached[rows] |= ((states[rows] == targets) | ~masks).all(axis = 1)
+    return reached
+
+def goal_progress(states, goal_ids):
+    '''
+    Partial credit: the fraction of each row's goal stickers that are in place (in the orientation with the most), an (N,) float32 array
+    (1 where the goal is reached).
+    '''
+    states = np.asarray(states, dtype = np.uint8).reshape(-1, 54)
+    counts = compiled_goals()[-1][np.broadcast_to(np.asarray(goal_ids, dtype = np.intp), (len(states),))]
+    in_place = np.zeros(len(states), dtype = np.int64)
+    for rows, targets, masks in _oriented(states, goal_ids):
+        in_place[rows] = np.maximum(in_place[rows], ((states[rows] == targets) & masks).sum(axis = 1))
+    return (in_place/np.maximum(counts, 1)).astype(np.float32)
+
+def _cross_mask():
+    '''
+    The centers, the D face edges and the side stickers next to them.
+    '''
+    d_moves = StickerCube._move_table["D"](range(54))
+    d_layer = set(i for i, x in enumerate(d_moves) if i != x)
+    edges = set(face*9 + x for face in range(6) for x in (1, 3, 5, 7))
+    return [i in _centers or (i in d_layer and i in edges) for i in range(54)]
+
+#The usual goals, registered first so their ids never change: 0 solved, 1 cross, 2 F2L (everything U doesn't move),
+#3 CMLL (the two Roux blocks and all the corners, any M slice offset, so the orientation is read off the L and R centers only)
+goals = {"solved": Goal([True]*54, name = "solved"),
+         "cross": Goal(_cross_mask(), name = "cross"),
+         "f2l": Goal.fixed_by(["U"], name = "f2l"),
+         "cmll": Goal.of_cubies(["DL", "LF", "LB", "DR", "RF", "RB", "DLF", "DLB", "DRF", "DRB", "ULF", "ULB", "URF", "URB"], [2, 4],
+                                name = "cmll", orientation_faces = [2, 4])}
+goal_ids = dict((name, register(goal)) for name, goal in goals.items())
+
+def goal_id(goal):
+    '''
+    The id of a Goal (registering it if it isn't yet), a goal's name in goals, or an id.
+    '''
+    if isinstance(goal, Goal):
+        return register(goal)
+    if isinstance(goal, str):
+        return goal_ids[goal]
+    return int(goal)
+
+
+if __name__ == "__main__":
+    import time
+    from batched_sticker_cube import BatchedStickerCube, decode_stickers
+
+    number = 100000
+    generator = np.random.default_rng(0)
+    rubiks = BatchedStickerCube(number)
+    for i in range(3):
+        rubiks.turn_each(generator.integers(0, 18, size = number))
+    mixed = generator.integers(0, len(goals), size = number)
+    stickers = decode_stickers(rubiks.current_state[:10000])
+    start = time.perf_counter()
+    looped = [registered_goals[goal].is_reached(state) for goal, state in zip(mixed, stickers)]
+    single = (time.perf_counter() - start)/len(stickers)
+    for name, ids in (("one goal", 0), ("mixed goals", mixed)):
+        start = time.perf_counter()
+        reached = reached_goals(rubiks.current_state, ids)
+        progress = goal_progress(rubiks.current_state, ids)
+        elapsed = (time.perf_counter() - start)/number
+        print(name + ": " + str(int(reached.sum())) + " of " + str(number) + " reached, mean progress " + str(round(float(progress.mean()), 3))
+              + ", " + str(round(elapsed*1e9)) + "ns per cube for both checks")
+    print("Goal.is_reached one cube at a time: " + str(round(single*1e6, 2)) + "us per cube, agrees: " + str(looped == reached_goals(rubiks.current_state[:10000], mixed[:10000]).tolist()))
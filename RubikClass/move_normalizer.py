@@ -0,0 +1,184 @@
+'''
+Cancels and merges redundant moves, one move at a time.
+
+Moves on the same axis (R, L, M, r, l and x all turn around the R-L axis) commute, so a run of them is collected into one group that
+keeps the total amount of every kind of move: R R' vanishes, U U U becomes U', U2 U' becomes U and R L R' becomes L.
+When a group ends up doing nothing at all (R R', or r R' M that only looks different), it disappears and the group before it can
+keep merging with the moves that come next. Each push touches only the last group, so keeping a normalized history is O(1) per move:
+
+    normalizer = MoveNormalizer()
+    for move in "R U U' R' L R L".split():
+        normalizer.push(move)
+    normalizer.moves()          #["R", "L2"]
+    normalizer.htm              #2
+
+Moves are only merged with moves of the same kind, R with R and r with r, so R M' stays R M' and isn't turned into r.
+The same works on the integer face turn codes of GroupCube.face_turns (and coordinates/optimal_solver), see normalize_codes.
+'''
+import re
+
+import numpy as np
+
+from groupcube import GroupCube
+
+#Per axis, the kinds of moves in the order they are written out: the two faces, the slice, the two wide moves and the rotation
+axis_moves = (("R", "L", "M", "r", "l", "x"),
+              ("U", "D", "E", "u", "d", "y"),
+              ("F", "B", "S", "f", "b", "z"))
+#Quarter turns each kind adds to the three layers of its axis (first face, middle, second face), counted in the first face's direction.
+#M and E follow the second face, S follows the first one (F).
+_layers = tuple(((1, 0, 0), (0, 0, -1), (0, slice_direction, 0), (1, 1, 0), (0, -1, -1), (1, 1, 1)) for slice_direction in (-1, -1, 1))
+#(htm, qtm, stm, moves) of each kind per quarter turns: rotations are free, slices are two face turns in htm and qtm
+_costs = tuple(((0, 0, 0, 0), (htm, qtm, stm, 1), (htm, 2*qtm, stm, 1), (htm, qtm, stm, 1))
+               for htm, qtm, stm in ((1, 1, 1), (1, 1, 1), (2, 2, 1), (1, 1, 1), (1, 1, 1), (0, 0, 0)))
+#How they change when a kind goes from one amount to another, _changes[kind][before][after]
+_changes = tuple(tuple(tuple(tuple(y - x for x, y in zip(costs[before], costs[after])) for after in range(4)) for before in range(4)) for costs in _costs)
+_suffixes = ("", "", "2", "'")
+
+#Wide moves can also be written Rw, Uw, ...
+_kinds = dict((letter, (axis, kind)) for axis, letters in enumerate(axis_moves) for kind, letter in enumerate(letters))
+_kinds.update((letter.upper() + "w", _kinds[letter]) for letter in "rludfb")
+_move_pattern = re.compile(r"([URFLBDMESxyzrlufdb]w?)(2'|3'|2|3|')?$")
+_amounts = {None: 1, "2": 2, "2'": 2, "'": 3, "3": 3, "3'": 1}
+
+#Face turn codes: code//3 is the face in GroupCube.face_turns order (U, R, L, F, B, D), code%3 + 1 the quarter turns
+_face_kinds = [_kinds[x[0]] for x in GroupCube.face_turns[::3]]
+_code_moves = [_face_kinds[code//3] + (code % 3 + 1,) for code in range(18)]
+
+
+def parse_move(move):
+    '''
+    (axis, kind, quarter turns) of a move, where axis_moves[axis][kind] is the move without its suffix.
+    '''
+    match = _move_pattern.match(move)
+    if match is None or match.group(1) not in _kinds:
+        raise ValueError("Can't normalize " + repr(move))
+    axis, kind = _kinds[match.group(1)]
+    return axis, kind, _amounts[match.group(2)]
+
+
+class MoveNormalizer:
+    """
+    A normalized move sequence that grows one move at a time, see the module docstring.
+
+    htm, qtm and stm are the length of the normalized sequence in the half turn, quarter turn and slice turn metric
+    (rotations are free, slices are two face turns in htm and qtm, wide moves count like face turns) and len() is its number of moves.
+    All of them are kept up to date on every push.
+    """
+    def __init__(self, moves = ()):
+        #One [axis, amounts, effect] per group: the quarter turns (mod 4) of each kind of move on the axis, and of each layer
+        self.groups = []
+        self.htm = self.qtm = self.stm = self._length = 0
+        for move in moves:
+            self.push(move)
+
+    def __len__(self):
+        return self._length
+
+    def push(self, move):
+        '''
+        Adds a move, a string like "R2'" or "Rw" or an (axis, kind, quarter turns) tuple from parse_move.
+        '''
+        axis, kind, amount = parse_move(move) if isinstance(move, str) else move
+        groups = self.groups
+        if groups and groups[-1][0] == axis:
+            group = groups[-1]
+        else:
+            group = [axis, [0]*6, [0, 0, 0]]
+            groups.append(group)
+        amounts, effect = group[1], group[2]
+        before = amounts[kind]
+        after = amounts[kind] = (before + amount) & 3
+        htm, qtm, stm, moves = _changes[kind][before][after]
+        first, middle, last = _layers[axis][kind]
+        effect[0] = (effect[0] + first*amount) & 3
+        effect[1] = (effect[1] + middle*amount) & 3
+        effect[2] = (effect[2] + last*amount) & 3
+        if not (effect[0] or effect[1] or effect[2]):
+            #The whole group does nothing
+            groups.pop()
+            for kind, amount in enumerate(amounts):
+                change = _changes[kind][amount][0]
+                htm, qtm, stm, moves = htm + change[0], qtm + change[1], stm + change[2], moves + change[3]
+        self.htm += htm
+        self.qtm += qtm
+        self.stm += stm
+        self._length += moves
+
+    def push_code(self, code):
+        '''
+        Adds a face turn code (an index into GroupCube.face_turns).
+        '''
+        self.push(_code_moves[code])
+
+    def moves(self):
+        '''
+        The normalized sequence, as a list of moves.
+        '''
+        return [axis_moves[axis][kind] + _suffixes[amount] for axis, amounts, effect in self.groups for kind, amount in enumerate(amounts) if amount]
+
+    def codes(self):
+        '''
+        The normalized sequence as face turn codes, only for sequences of face turns (anything else raises a ValueError).
+        '''
+        out = []
+        for axis, amounts, effect in self.groups:
+            for kind, amount in enumerate(amounts):
+                if amount:
+                    if kind > 1:
+                        raise ValueError(axis_moves[axis][kind] + " isn't a face turn")
+                    out.append(_face_kinds.index((axis, kind))*3 + amount - 1)
+        return out
+
+
+def normalize_moves(moves):
+    '''
+    Normalizes a list of moves (or a string of space separated moves), returns the normalized list.
+    '''
+    if isinstance(moves, str):
+        moves = moves.split()
+    return MoveNormalizer(moves).moves()
+
+def normalize_codes(codes):
+    '''
+    Normalizes an array of face turn codes (indices into GroupCube.face_turns), returns the normalized codes as an int64 array.
+    '''
+    normalizer = MoveNormalizer()
+    for code in np.asarray(codes).ravel().tolist():
+        normalizer.push_code(code)
+    return np.array(normalizer.codes(), dtype = np.int64)
+
+
+if __name__ == "__main__":
+    import time
+    from sticker_cube import StickerCube
+
+    for sequence in ("R R'", "U U U", "U2 U'", "R L R'", "R U U' R' L R L", "r R' M x", "Rw2' M2 R2 x2'", "f B S' z'", "R M' r' F"):
+        normalizer = MoveNormalizer(sequence.split())
+        print(sequence + " -> " + " ".join(normalizer.moves()) + " (htm " + str(normalizer.htm) + ", qtm " + str(normalizer.qtm)
+              + ", stm " + str(normalizer.stm) + ")")
+
+    #Normalized sequences leave the cube exactly where the originals do
+    random_moves = sorted(x for x in StickerCube._move_table if _move_pattern.match(x))
+    generator = np.random.default_rng(0)
+    agree = True
+    for i in range(400):
+        #Half of them on just two axes, so that there is plenty to merge and cancel
+        moves = random_moves if i % 2 else [x for x in random_moves if parse_move(x)[0] != i % 3]
+        sequence = list(generator.choice(moves, size = 30))
+        a, b = StickerCube(), StickerCube()
+        a(sequence)
+        b(normalize_moves(sequence))
+        agree &= a.current_state == b.current_state
+    print("Normalized sequences do the same thing: " + str(agree))
+
+    #A random agent on the 18 face turns, one step at a time
+    steps = 1_000_000
+    codes = generator.integers(0, 18, size = steps)
+    start = time.perf_counter()
+    normalizer = MoveNormalizer()
+    for code in codes.tolist():
+        normalizer.push_code(code)
+    elapsed = time.perf_counter() - start
+    print(str(steps) + " random face turns normalized to " + str(len(normalizer)) + " (htm " + str(normalizer.htm) + ", qtm " + str(normalizer.qtm)
+          + ") in " + str(round(elapsed, 2)) + "s, " + str(round(elapsed/steps*1e9)) + "ns per step")
@@ -0,0 +1,268 @@
+'''
+Optimal solver for GroupCube: IDA* over the 18 face turns, pruned with pattern databases (Korf's method).
+
+The pattern databases hold the exact number of moves needed to solve part of the cube:
+    - corners: every corner permutation and twist, 8!*3^7 entries
+    - edges: the positions and flips of 6 of the edges, 12*11*10*9*8*7*2^6 entries, once for edges 0-5 and once for edges 6-11
+The largest of the three never overestimates, so IDA* with it finds shortest solutions.
+
+Distances fit in 4 bits, so the databases are stored two entries per byte (about 86MB in total, plus 60MB of edge move tables) in the
+table cache (see table_cache.py). Building them takes around a minute the first time, afterwards they are memory mapped and startup is instant.
+
+    solver = OptimalSolver()
+    solution = solver.solve("R U2 F' D L2 B")     #or a GroupCube
+    rubik(solution)                                #solves the cube
+'''
+import time
+
+import numpy as np
+
+from coordinates import face_turn_transforms, face_turns, move_tables
+from groupcube import GroupCube
+from table_cache import load_or_build
+
+#Corner database index is corner permutation*2187 + corner twist
+corner_pdb_size = 40320*2187
+#Edge database index is (rank of the positions of the 6 tracked edges)*64 + their flips
+edge_positions = 12*11*10*9*8*7
+edge_pdb_size = edge_positions*64
+edge_groups = ((0, 1, 2, 3, 4, 5), (6, 7, 8, 9, 10, 11))
+#Unvisited entries while building
+_unknown = 255
+#How many entries a build step works on at once, to keep memory bounded
+_chunk = 1 << 22
+
+
+def rank_edge_positions(positions):
+    '''
+    Ranks (N, 6) arrays of distinct positions (0-11) of the tracked edges, 0..665279.
+    Each position is counted among the positions not taken by an earlier edge, read as a mixed radix 12, 11, ..., 7 number.
+    '''
+    positions = np.asarray(positions, dtype = np.int64)
+    rank = np.zeros(len(positions), dtype = np.int64)
+    for i in range(6):
+        digit = positions[:, i] - (positions[:, :i] < positions[:, i:i+1]).sum(axis = 1)
+        rank = rank*(12 - i) + digit
+    return rank
+
+def unrank_edge_positions(ranks):
+    '''
+    Inverse of rank_edge_positions.
+    '''
+    ranks = np.array(ranks, dtype = np.int64)
+    digits = np.empty((len(ranks), 6), dtype = np.int64)
+    for i in range(5, -1, -1):
+        ranks, digits[:, i] = np.divmod(ranks, 12 - i)
+    positions = np.empty((len(ranks), 6), dtype = np.int64)
+    used = np.zeros((len(ranks), 12), dtype = bool)
+    for i in range(6):
+        unused_so_far = np.cumsum(~used, axis = 1)
+        position = np.argmax((unused_so_far == digits[:, i:i+1] + 1) & ~used, axis = 1)
+        positions[:, i] = position
+        used[np.arange(len(ranks)), position] = True
+    return positions
+
+def build_edge_position_moves():
+    '''
+    (665280, 18) table: the rank of the tracked edge positions after each face turn.
+    Only depends on positions, so both edge groups share it.
+    '''
+    edge_source = face_turn_transforms()[2]
+    positions = unrank_edge_positions(np.arange(edge_positions))
+    table = np.empty((edge_positions, len(face_turns)), dtype = np.uint32)
+    for move in range(len(face_turns)):
+        #The edge at position s goes to destination[s]
+        destination = np.argsort(edge_source[move])
+        table[:, move] = rank_edge_positions(destination[positions])
+    return table
+
+def build_edge_flip_moves():
+    '''
+    (665280, 18) table: bit i is set when the i-th tracked edge flips during the face turn, so new flips = flips ^ table[positions, move].
+    '''
+    edge_flip = face_turn_transforms()[3]
+    positions = unrank_edge_positions(np.arange(edge_positions))
+    table = np.empty((edge_positions, len(face_turns)), dtype = np.uint8)
+    bits = 1 << np.arange(6)
+    for move in range(len(face_turns)):
+        table[:, move] = (edge_flip[move][positions]*bits).sum(axis = 1)
+    return table
+
+def breadth_first_depths(size, start, neighbours, moves):
+    '''
+    Distance from start to every index below size, where neighbours(indices, move) gives the index each index moves to.
+
+    Expands the frontier forwards while it is smaller than what is left to visit, and then flips to checking every unvisited
+    index for a neighbour in the frontier, which is much cheaper for the last few (huge) levels.
+    '''
+    depth = np.full(size, _unknown, dtype = np.uint8)
+    depth[start] = 0
+    level, frontier, unvisited = 0, 1, size - 1
+    while frontier:
+        for block in range(0, size, _chunk):
+            if frontier < unvisited:
+                indices = np.flatnonzero(depth[block:block + _chunk] == level) + block
+                for move in range(moves):
+                    after = neighbours(indices, move)
+                    depth[after[depth[after] == _unknown]] = level + 1
+            else:
+                indices = np.flatnonzero(depth[block:block + _chunk] == _unknown) + block
+                reached = np.zeros(len(indices), dtype = bool)
+                for move in range(moves):
+                    reached |= depth[neighbours(indices, move)] == level
+                depth[indices[reached]] = level + 1
+        found = int(np.count_nonzero(depth == level + 1))
+        level, frontier, unvisited = level + 1, found, unvisited - found
+    return depth
+
+def pack_nibbles(depth):
+    '''
+    Two 4 bit entries per byte, entry i is in the low nibble of byte i//2 when i is even and the high nibble when it is odd.
+    '''
+    return (depth[0::2] & 15) | (depth[1::2] << 4)
+
+def build_corner_pdb():
+    tables = move_tables()
+    permutation_moves = tables["corner_permutation"].astype(np.int64)
+    twist_moves = tables["corner_twist"].astype(np.int64)
+    def neighbours(indices, move):
+        permutation, twist = np.divmod(indices, 2187)
+        return permutation_moves[permutation, move]*2187 + twist_moves[twist, move]
+    return pack_nibbles(breadth_first_depths(corner_pdb_size, 0, neighbours, len(face_turns)))
+
+def build_edge_pdb(group):
+    position_moves = load_or_build("edge_position_moves", build_edge_position_moves).astype(np.int64)
+    flip_moves = load_or_build("edge_flip_moves", build_edge_flip_moves).astype(np.int64)
+    def neighbours(indices, move):
+        positions, flips = np.divmod(indices, 64)
+        return position_moves[positions, move]*64 + (flips ^ flip_moves[positions, move])
+    solved = int(rank_edge_positions([edge_groups[group]])[0])*64
+    return pack_nibbles(breadth_first_depths(edge_pdb_size, solved, neighbours, len(face_turns)))
+
+
+class OptimalSolver:
+    """
+    IDA* over GroupCube's 18 face turns with the corner and two edge pattern databases as the heuristic.
+
+    After a solve, nodes (positions generated) and search_time (seconds) describe the last search.
+    """
+    def __init__(self):
+        tables = move_tables()
+        #memoryviews index straight to python ints, which is much faster than indexing numpy arrays one element at a time
+        self._corner_permutation_moves = memoryview(np.ascontiguousarray(tables["corner_permutation"]).ravel())
+        self._corner_twist_moves = memoryview(np.ascontiguousarray(tables["corner_twist"]).ravel())
+        self._edge_position_moves = memoryview(load_or_build("edge_position_moves", build_edge_position_moves).ravel())
+        self._edge_flip_moves = memoryview(load_or_build("edge_flip_moves", build_edge_flip_moves).ravel())
+        self._corner_pdb = memoryview(load_or_build("corner_pdb", build_corner_pdb))
+        self._edge_pdbs = [memoryview(load_or_build("edge_pdb_" + str(x), lambda group = x: build_edge_pdb(group))) for x in range(len(edge_groups))]
+        self.nodes = 0
+        self.search_time = 0.0
+
+    def _start(self, cube):
+        '''
+        Coordinates the search runs on: (corner permutation, corner twist, positions of each edge group, flips of each edge group).
+        '''
+        if isinstance(cube, str):
+            scramble = cube
+            cube = GroupCube()
+            cube(scramble)
+        if bytes(cube._center) != GroupCube.solved_state[4]:
+            raise ValueError("The solver only uses face turns, so the cube has to be in its original orientation (centers solved).")
+        where = [0]*12
+        for position, cubie in enumerate(cube._edge_perm):
+            where[cubie] = position
+        groups = []
+        for group in edge_groups:
+            flips = sum(cube._edge_orient[x] << i for i, x in enumerate(group))
+            groups.append((int(rank_edge_positions([[where[x] for x in group]])[0]), flips))
+        return cube.corner_permutation(), cube.corner_twist(), groups[0], groups[1]
+
+    def solve(self, cube, max_depth = 20):
+        '''
+        Returns a shortest solution (face turns only, in the notation AbstractCube.__call__ accepts) for a GroupCube or scramble string,
+        or None if there is none within max_depth moves.
+        '''
+        start = time.perf_counter()
+        self.nodes = 0
+        corner_permutation, corner_twist, (positions_a, flips_a), (positions_b, flips_b) = self._start(cube)
+        corner_permutation_moves, corner_twist_moves = self._corner_permutation_moves, self._corner_twist_moves
+        edge_position_moves, edge_flip_moves = self._edge_position_moves, self._edge_flip_moves
+        corner_pdb, (edge_pdb_a, edge_pdb_b) = self._corner_pdb, self._edge_pdbs
+        moves = len(face_turns)
+        #The face of move m is m // 3, faces in face_turns are ordered U R L F B D
+        opposite = (5, 2, 1, 4, 3, 0)
+        path = []
+
+        def lookup(pdb, index):
+            byte = pdb[index >> 1]
+            return byte >> 4 if index & 1 else byte & 15
+
+        def search(corner_permutation, corner_twist, positions_a, flips_a, positions_b, flips_b, depth, bound, last_face):
+            #Returns the smallest f over the bound, or -1 when solved
+            h = max(lookup(corner_pdb, corner_permutation*2187 + corner_twist),
+                    lookup(edge_pdb_a, positions_a*64 + flips_a),
+                    lookup(edge_pdb_b, positions_b*64 + flips_b))
+            if h == 0:
+                return -1
+            if depth + h > bound:
+                return depth + h
+            smallest = 100
+            for move in range(moves):
+                face = move // 3
+                #Never turn the same face twice in a row, and only turn opposite faces in one order
+                if face == last_face or (opposite[face] == last_face and face < last_face):
+                    continue
+                self.nodes += 1
+                c = corner_permutation*moves + move
+                t = corner_twist*moves + move
+                a = positions_a*moves + move
+                b = positions_b*moves + move
+                path.append(move)
+                found = search(corner_permutation_moves[c], corner_twist_moves[t], edge_position_moves[a], flips_a ^ edge_flip_moves[a],
+                               edge_position_moves[b], flips_b ^ edge_flip_moves[b], depth + 1, bound, face)
+                if found == -1:
+                    return -1
+                path.pop()
+                smallest = min(smallest, found)
+            return smallest
+
+        bound = 0
+        solution = None
+        while bound <= max_depth:
+            found = search(corner_permutation, corner_twist, positions_a, flips_a, positions_b, flips_b, 0, bound, -1)
+            if found == -1:
+                solution = " ".join(face_turns[x] for x in path)
+                break
+            bound = found
+        self.search_time = time.perf_counter() - start
+        return solution
+
+
+if __name__ == "__main__":
+    import random
+    start = time.perf_counter()
+    solver = OptimalSolver()
+    print("Pattern databases ready in " + str(round(time.perf_counter() - start, 2)) + "s")
+
+    #Fixed benchmark set of random face turn scrambles, never turning the same face twice in a row
+    generator = random.Random(2020)
+    scrambles = []
+    for length in (8, 9, 10, 11, 12, 13):
+        scramble = []
+        while len(scramble) < length:
+            move = generator.choice(face_turns)
+            if not scramble or move[0] != scramble[-1][0]:
+                scramble.append(move)
+        scrambles.append(" ".join(scramble))
+    total_nodes, total_time = 0, 0.0
+    for scramble in scrambles:
+        solution = solver.solve(scramble)
+        rubik = GroupCube()
+        rubik(scramble)
+        rubik(solution)
+        total_nodes += solver.nodes
+        total_time += solver.search_time
+        print(scramble + "\n    solved by " + solution + " (" + str(len(solution.split())) + " moves, " + str(rubik.is_solved()) + ") in "
+              + str(round(solver.search_time, 3)) + "s, " + str(solver.nodes) + " nodes, "
+              + str(round(solver.nodes/max(solver.search_time, 1e-9))) + " nodes/s")
+    print("Total: " + str(round(total_time, 2)) + "s, " + str(total_nodes) + " nodes, " + str(round(total_nodes/total_time)) + " nodes/s")
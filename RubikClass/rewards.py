@@ -0,0 +1,286 @@
+'''
+Reward shaping, vectorized over whole batches.
+
+Sticker rewards take an (N, 54) array of sticker codes (BatchedStickerCube.current_state):
+    face_color_counts   per face histogram of the colors
+    majority_colors     count of the most common color on each face, summed over the faces (the notebook's _get_reward without its solved bonus)
+    stickers_in_place   stickers that have the color of their face's center
+
+Cubie rewards take GroupCube coordinates, a dict of coordinate arrays like coordinates.apply_moves uses, or an (N, 46) array of
+group states (state_keys.group_state_array), which group_coordinates turns into one:
+    oriented_pieces     corners without a twist plus edges without a flip, 0..20
+    solved_cubies       corners and edges in their home position with their orientation solved, 0..20
+    phase1_distance     lower bound on the moves left, from the two-phase solver's phase 1 pruning tables
+
+An environment takes any reward(states, solved) -> (N,) function (see VecCubeEnv(reward = ...)), such as notebook_reward or one made by
+weighted_reward. A reward object with update(before, after, moves) and reset_rows(rows, states) is also told about every move and reset,
+which is how IncrementalMajorityReward keeps its histograms up to date from only the stickers a move carries to another face.
+'''
+from functools import lru_cache
+
+import numpy as np
+
+from batched_sticker_cube import BatchedStickerCube
+from coordinates import coordinate_to_orientations, occupancy_to_slice, orientations_to_coordinate, rank_permutations, unrank_permutations
+from sticker_cube import StickerCube, sticker_colors
+from table_cache import load_or_build
+from two_phase_solver import build_flip_slice_table, build_twist_slice_table
+
+#Histograms count every sticker code, the 6 face colors and the masked ones
+_colors = len(sticker_colors)
+_slices = 495
+
+
+def face_color_counts(states):
+    '''
+    (N, 6, 8) int64 histogram: how many stickers of each code (see sticker_colors) are on each face of each cube.
+    '''
+    states = np.asarray(states, dtype = np.uint8).reshape(-1, 54)
+    #Bin of every sticker: its cube, its face and its color
+    bins = (np.arange(len(states))[:, None]*(6*_colors) + (np.arange(54)//9)*_colors) + states
+    return np.bincount(bins.ravel(), minlength = len(states)*6*_colors).reshape(-1, 6, _colors)
+
+def majority_colors(states, counts = None):
+    '''
+    The count of the most common face color on each face, summed over the faces, 9..54 (54 when solved). Pass counts from
+    face_color_counts to skip building them.
+    '''
+    if counts is None:
+        counts = face_color_counts(states)
+    #Pairwise maximums over the 6 colors, a lot quicker than max(axis = 2) over such a short axis
+    most = np.maximum(np.maximum(counts[:, :, 0], counts[:, :, 1]), np.maximum(counts[:, :, 2], counts[:, :, 3]))
+    return np.maximum(most, np.maximum(counts[:, :, 4], counts[:, :, 5])).sum(axis = 1)
+
+def stickers_in_place(states):
+    '''
+    Number of stickers with the color of their face's center, 6..54.
+    '''
+    states = np.asarray(states, dtype = np.uint8).reshape(-1, 6, 9)
+    return (states == states[:, :, 4:5]).sum(axis = (1, 2))
+
+def notebook_reward(states, solved, solved_bonus = 20):
+    '''
+    The reward of the ACTUALREINFORCE notebook: majority_colors plus solved_bonus for solved cubes.
+    '''
+    return (majority_colors(states) + solved_bonus*np.asarray(solved)).astype(np.float32)
+
+def weighted_reward(terms, solved_bonus = 0):
+    '''
+    A reward(states, solved) for an environment, the weighted sum of reward functions of the states plus solved_bonus when solved:
+
+        reward = weighted_reward([(1, stickers_in_place), (0.5, majority_colors)], solved_bonus = 20)
+    '''
+    def reward(states, solved):
+        total = solved_bonus*np.asarray(solved, dtype = np.float32)
+        for weight, function in terms:
+            total = total + weight*function(states)
+        return total.astype(np.float32)
+    return reward
+
+
+def group_coordinates(states):
+    '''
+    An (N, 46) array of group states into a dict of coordinate arrays: corner_twist, edge_flip, corner_permutation,
+    edge_permutation and ud_slice, the same numbers the GroupCube methods of those names give.
+    '''
+    states = np.asarray(states, dtype = np.int64).reshape(-1, 46)
+    corner_perm, edge_perm, corner_orient, edge_orient = states[:, 0:8], states[:, 8:20], states[:, 20:28], states[:, 28:40]
+    #Orientations are stored by cubie, the coordinates read them by position
+    return {"corner_twist": orientations_to_coordinate(np.take_along_axis(corner_orient, corner_perm, axis = 1), 3),
+            "edge_flip": orientations_to_coordinate(np.take_along_axis(edge_orient, edge_perm, axis = 1), 2),
+            "corner_permutation": rank_permutations(corner_perm),
+            "edge_permutation": rank_permutations(edge_perm),
+            "ud_slice": occupancy_to_slice((edge_perm >= 4) & (edge_perm < 8))}
+
+def _coordinates(batch):
+    return batch if isinstance(batch, dict) else group_coordinates(batch)
+
+def oriented_pieces(batch):
+    '''
+    Corners with no twist plus edges with no flip, 0..20, for coordinates with corner_twist and edge_flip (or group states).
+    '''
+    batch = _coordinates(batch)
+    twists = coordinate_to_orientations(np.atleast_1d(batch["corner_twist"]), 3, 8)
+    flips = coordinate_to_orientations(np.atleast_1d(batch["edge_flip"]), 2, 12)
+    return (twists == 0).sum(axis = 1) + (flips == 0).sum(axis = 1)
+
+def solved_cubies(batch):
+    '''
+    Corners and edges sitting in their home position without a twist or flip, 0..20. Needs all four of corner_twist, edge_flip,
+    corner_permutation and edge_permutation (or group states).
+    '''
+    batch = _coordinates(batch)
+    twists = coordinate_to_orientations(np.atleast_1d(batch["corner_twist"]), 3, 8)
+    flips = coordinate_to_orientations(np.atleast_1d(batch["edge_flip"]), 2, 12)
+    corners = unrank_permutations(np.atleast_1d(batch["corner_permutation"]), 8)
+    edges = unrank_permutations(np.atleast_1d(batch["edge_permutation"]), 12)
+    return ((corners == np.arange(8)) & (twists == 0)).sum(axis = 1) + ((edges == np.arange(12)) & (flips == 0)).sum(axis = 1)
+
+@lru_cache(maxsize = None)
+def _phase1_tables():
+    '''
+    The two-phase solver's phase 1 pruning tables, from the table cache (built the first time, a few seconds).
+    '''
+    return (np.asarray(load_or_build("two_phase_twist_slice", build_twist_slice_table)),
+            np.asarray(load_or_build("two_phase_flip_slice", build_flip_slice_table)))
+
+def phase1_distance(batch):
+    '''
+    Moves needed to fix every twist, flip and the E slice: a lower bound on the moves left to solve (up to 12), from corner_twist,
+    edge_flip and ud_slice (or group states). Use it negated as a reward.
+    '''
+    batch = _coordinates(batch)
+    twist_slice, flip_slice = _phase1_tables()
+    slice_position = np.atleast_1d(batch["ud_slice"]).astype(np.int64)
+    return np.maximum(twist_slice[np.atleast_1d(batch["corner_twist"]).astype(np.int64)*_slices + slice_position],
+                      flip_slice[np.atleast_1d(batch["edge_flip"]).astype(np.int64)*_slices + slice_position]).astype(np.int64)
+
+
+def _moved_stickers(move):
+    '''
+    Stickers a move carries from another face, for BatchedStickerCube.moves[move]. Basic turns read them off their turn_to_cycle
+    cycles, skipping cycles that stay on one face (those never change a face's colors). Every other move goes through its gather.
+    '''
+    letter = BatchedStickerCube.moves[move]
+    if letter in StickerCube.turn_to_cycle:
+        cycles = [x for x in StickerCube.turn_to_cycle[letter] if len(set(i//9 for i in x)) > 1]
+        return sorted(i for cycle in cycles for i in cycle)
+    gather = BatchedStickerCube.move_table[move]
+    return [i for i, x in enumerate(gather) if x//9 != i//9]
+
+@lru_cache(maxsize = None)
+def _moved_table():
+    '''
+    Every move carries the same number of stickers (3, 6 or 9) onto each of 4 faces. Returns a (moves, 3, 36) int32 table and that
+    number of stickers per face (moves,). Column slot*4 + j of a move is the slot-th sticker landing on its j-th face: row 0 is the
+    sticker to read after the move, row 1 the one to read before it (the same sticker) and row 2 the histogram bin of color 0 of the face.
+    With the slot first, the first 4*width columns cover every move carrying up to width stickers per face.
+
+    Moves carrying fewer than 9 are padded with a sticker p of the face read after the move and gather[p] read before it, which is the
+    same color, so the padding cancels out.
+    '''
+    number = len(BatchedStickerCube.moves)
+    table = np.zeros((number, 3, 9, 4), dtype = np.int32)
+    widths = np.zeros(number, dtype = np.intp)
+    for move in range(number):
+        gather = BatchedStickerCube.move_table[move]
+        moved = _moved_stickers(move)
+        widths[move] = len(moved)//4
+        for j, face in enumerate(sorted(set(i//9 for i in moved))):
+            stickers = [i for i in moved if i//9 == face]
+            padding = [face*9 + 4]*(9 - len(stickers))
+            table[move, 0, :, j] = stickers + padding
+            table[move, 1, :, j] = stickers + [gather[i] for i in padding]
+            table[move, 2, :, j] = face*_colors
+    return table.reshape(number, 3, 36), widths
+
+
+class IncrementalMajorityReward:
+    """
+    notebook_reward for an environment, keeping an (N, 6, 8) face_color_counts histogram that every move only updates in the bins of
+    the stickers it carried to another face (12 for a face turn) instead of recounting all 54. Opt in by passing it as the reward:
+
+        reward = IncrementalMajorityReward(number_of_cubes)
+        env = VecCubeEnv(number_of_cubes, reward = reward)
+
+    The environment calls update after every move and reset_rows, a full recount, after resetting or scrambling cubes.
+
+    The update is an index gather and a scatter (np.add.at) where the recount is one bincount over every sticker, so it only pays off
+    on mid-sized batches. Face turns, majority_colors included, measured with the benchmark below on one CPU:
+        256 cubes       recount 0.11ms, update 0.25ms (the update's fixed cost dominates)
+        1024 cubes      recount 0.6-0.75ms, update 0.44ms
+        4096 cubes      recount 1.85-2.0ms, update 1.55-1.6ms
+        16384 cubes     recount 7.0-8.0ms, update 8.1-9.0ms
+        65536 cubes     about 37ms either way
+    so below a few hundred and above about 10000 cubes notebook_reward is as fast or faster, without a histogram to keep in step.
+    Slice and wide moves carry 6 or 9 stickers a face instead of 3, which makes the update two or three times slower.
+    """
+    def __init__(self, number_of_cubes, solved_bonus = 20):
+        #Starts out as solved cubes, like a new BatchedStickerCube
+        self.counts = np.repeat(face_color_counts(BatchedStickerCube(1).current_state), number_of_cubes, axis = 0)
+        self.solved_bonus = solved_bonus
+        #Where each cube starts in the flat states and in the flat histograms
+        rows = np.arange(number_of_cubes, dtype = np.int32)[:, None]
+        self._state_rows = rows*54
+        self._count_rows = rows*(6*_colors)
+
+    def reset_rows(self, rows, states):
+        '''
+        Recounts the histograms of rows (indices or a mask, None for every cube) from the full states.
+        '''
+        if rows is None:
+            self.counts[:] = face_color_counts(states)
+        else:
+            self.counts[rows] = face_color_counts(states[rows])
+
+    def update(self, before, after, moves):
+        '''
+        Updates the histograms of every cube for moves (indices into BatchedStickerCube.moves, one per cube) taking before to after.
+        '''
+        table, widths = _moved_table()
+        moves = np.asarray(moves)
+        #Only as wide as the moves in this step need, 3 stickers a face when they are all face turns
+        width = 4*int(widths[moves].max())
+        rows = table[moves, :, :width]
+        bins = self._count_rows + rows[:, 2]
+        counts = self.counts.reshape(-1)
+        np.add.at(counts, bins + np.asarray(after).reshape(-1).take(self._state_rows + rows[:, 0]), 1)
+        np.subtract.at(counts, bins + np.asarray(before).reshape(-1).take(self._state_rows + rows[:, 1]), 1)
+
+    def __call__(self, states, solved):
+        return (majority_colors(None, self.counts) + self.solved_bonus*np.asarray(solved)).astype(np.float32)
+
+
+if __name__ == "__main__":
+    import time
+    from batched_sticker_cube import decode_stickers
+    from groupcube import GroupCube
+    from state_keys import group_state_array
+
+    #Recounting every step against IncrementalMajorityReward's update, on face turns (moves 0-17)
+    steps = 50
+    generator = np.random.default_rng(0)
+    for number in (256, 1024, 4096, 16384, 65536):
+        rubiks = BatchedStickerCube(number)
+        incremental = IncrementalMajorityReward(number)
+        recount = update = 0
+        for moves in generator.integers(0, 18, size = (steps, number)):
+            before = rubiks.current_state
+            rubiks.turn_each(moves)
+            start = time.perf_counter()
+            expected = majority_colors(rubiks.current_state)
+            recount += time.perf_counter() - start
+            start = time.perf_counter()
+            incremental.update(before, rubiks.current_state, moves)
+            kept = majority_colors(None, incremental.counts)
+            update += time.perf_counter() - start
+        print("majority_colors of " + str(number) + " cubes per step: recounted " + str(round(recount/steps*1e3, 3)) + "ms, updated "
+              + str(round(update/steps*1e3, 3)) + "ms, agrees: " + str(bool((expected == kept).all())))
+
+    #The notebook's _get_reward, one cube at a time
+    stickers = decode_stickers(rubiks.current_state)
+    start = time.perf_counter()
+    looped = []
+    for state in stickers:
+        faces = [state[(i*9):((i+1)*9)] for i in range(6)]
+        looped.append(sum(max(face.count(x) for x in set(face)) for face in faces))
+    single = (time.perf_counter() - start)/number
+    start = time.perf_counter()
+    batched = notebook_reward(rubiks.current_state, rubiks.is_solved())
+    elapsed = (time.perf_counter() - start)/number
+    print("notebook reward: " + str(round(single*1e6, 2)) + "us per cube one at a time, " + str(round(elapsed*1e9)) + "ns per cube batched, agrees: "
+          + str(looped == batched.astype(int).tolist()))
+
+    cubes = []
+    for i in range(1000):
+        cube = GroupCube()
+        cube(" ".join(generator.choice(["U", "U'", "R", "R'", "F", "F'", "L", "B", "D"], size = 8)))
+        cubes.append(cube)
+    states = group_state_array(cubes)
+    start = time.perf_counter()
+    coordinates = group_coordinates(states)
+    distance = phase1_distance(coordinates)
+    in_place = solved_cubies(coordinates)
+    elapsed = (time.perf_counter() - start)/len(cubes)
+    print("Cubie rewards of " + str(len(cubes)) + " group cubes: " + str(round(elapsed*1e6, 2)) + "us per cube, mean phase 1 distance "
+          + str(round(float(distance.mean()), 2)) + ", mean solved cubies " + str(round(float(in_place.mean()), 2)))
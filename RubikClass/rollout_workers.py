@@ -0,0 +1,171 @@
+'''
+Multiprocess rollouts over shared memory.
+
+The cube states live in worker processes, each stepping its own slice of the batch with a VecCubeEnv, while actions, observations,
+rewards and dones sit in multiprocessing.shared_memory blocks that the parent and every worker map as numpy arrays.
+A step only sends a one word command down each worker's pipe, nothing else is pickled or copied:
+
+    with RolloutPool(8192, workers = 4, seed = 0) as pool:
+        obs = pool.reset()
+        for i in range(1000):
+            obs, reward, done = pool.step(policy(obs))
+
+The returned arrays are views of the shared buffers, so they are overwritten by the next step (copy them to keep them).
+'''
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from vec_cube_env import VecCubeEnv
+
+
+def _layout(number_of_cubes, observation):
+    '''
+    (shape, dtype) of the shared actions, obs, reward and done arrays.
+    '''
+    if observation == "onehot":
+        obs = ((number_of_cubes, 54, 6), np.dtype(np.float32))
+    else:
+        obs = ((number_of_cubes, 54), np.dtype(np.uint8))
+    return [((number_of_cubes,), np.dtype(np.int64)), obs, ((number_of_cubes,), np.dtype(np.float32)), ((number_of_cubes,), np.dtype(np.bool_))]
+
+def _map_arrays(blocks, number_of_cubes, observation):
+    '''
+    The shared blocks as (actions, obs, reward, done) numpy arrays.
+    '''
+    return [np.ndarray(shape, dtype = dtype, buffer = block.buf) for (shape, dtype), block in zip(_layout(number_of_cubes, observation), blocks)]
+
+def _worker(connection, names, number_of_cubes, start, end, seed, env_kwargs):
+    '''
+    Steps cubes start:end of the batch whenever the parent asks, until it sends "close".
+    '''
+    blocks = [shared_memory.SharedMemory(name = x) for x in names]
+    actions, obs, reward, done = _map_arrays(blocks, number_of_cubes, env_kwargs["observation"])
+    env = VecCubeEnv(end - start, seed = seed, **env_kwargs)
+    try:
+        while True:
+            command = connection.recv()
+            if command == "step":
+                env.step(actions[start:end], obs[start:end], reward[start:end], done[start:end])
+            elif command == "reset":
+                env.reset(obs[start:end])
+            elif command == "close":
+                break
+            connection.send(command)
+    finally:
+        #The arrays have to let go of the buffers before the blocks can close
+        del actions, obs, reward, done
+        for block in blocks:
+            block.close()
+        connection.close()
+
+
+class RolloutPool:
+    """
+    Same interface as VecCubeEnv (reset and step on a whole batch), with the batch split evenly over worker processes.
+
+    Worker i is seeded from np.random.SeedSequence(seed).spawn, so a run with the same seed, batch size and worker count
+    produces the same scrambles and states every time. keyword arguments not listed here go to every worker's VecCubeEnv.
+    """
+    def __init__(self, number_of_cubes, workers = None, seed = None, observation = "onehot", **env_kwargs):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, number_of_cubes))
+        self.number_of_cubes = number_of_cubes
+        self.workers = workers
+        env_kwargs["observation"] = observation
+        self._blocks = [shared_memory.SharedMemory(create = True, size = int(np.prod(shape))*dtype.itemsize)
+                        for shape, dtype in _layout(number_of_cubes, observation)]
+        names = [x.name for x in self._blocks]
+        self.actions, self.obs, self.reward, self.done = _map_arrays(self._blocks, number_of_cubes, observation)
+        bounds = np.linspace(0, number_of_cubes, workers + 1).astype(int)
+        seeds = np.random.SeedSequence(seed).spawn(workers)
+        context = mp.get_context()
+        self._connections = []
+        self._processes = []
+        for i in range(workers):
+            parent, child = context.Pipe()
+            process = context.Process(target = _worker, args = (child, names, number_of_cubes, bounds[i], bounds[i + 1], seeds[i], env_kwargs),
+                                      daemon = True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+        self.closed = False
+
+    def __len__(self):
+        return self.number_of_cubes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _broadcast(self, command):
+        for connection in self._connections:
+            connection.send(command)
+        for connection in self._connections:
+            connection.recv()
+
+    def reset(self):
+        '''
+        Scrambles every cube, returns the shared observation array.
+        '''
+        self._broadcast("reset")
+        return self.obs
+
+    def step(self, actions = None):
+        '''
+        Steps every cube (see VecCubeEnv.step) and returns the shared (obs, reward, done) arrays.
+
+        actions is copied into the shared action array, or pass None after writing into pool.actions directly to skip that copy.
+        '''
+        if actions is not None:
+            self.actions[:] = actions
+        self._broadcast("step")
+        return self.obs, self.reward, self.done
+
+    def close(self):
+        '''
+        Stops the workers and frees the shared memory. Safe to call more than once.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        for connection in self._connections:
+            try:
+                connection.send("close")
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout = 5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for connection in self._connections:
+            connection.close()
+        del self.actions, self.obs, self.reward, self.done
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+
+
+if __name__ == "__main__":
+    import time
+
+    number = 16384
+    steps = 100
+    print("Machine has " + str(os.cpu_count()) + " cores")
+    for workers in sorted({1, 2, 4, 8, os.cpu_count() or 1}):
+        with RolloutPool(number, workers = workers, seed = 0) as pool:
+            pool.reset()
+            generator = np.random.default_rng(0)
+            actions = [generator.integers(0, len(VecCubeEnv.valid_turns), size = number) for x in range(steps)]
+            start = time.perf_counter()
+            for x in actions:
+                pool.step(x)
+            elapsed = time.perf_counter() - start
+        print(str(workers) + " workers: " + str(round(number*steps/elapsed)) + " cube steps per second")
@@ -0,0 +1,148 @@
+'''
+Batched versions of StickerCube.state_key and GroupCube.state_key.
+
+Keys come back as an (N,) numpy array of fixed size void scalars (21 bytes for stickers, 16 for GroupCube), which np.unique, np.isin
+and sorting all handle directly, so deduping millions of scrambles never touches Python objects:
+
+    keys = sticker_state_keys(rubiks.current_state)
+    unique_keys, first_seen = np.unique(keys, return_index = True)
+
+Every key is the big-endian bytes of the integer the single cube's state_key returns: int.from_bytes(keys[i].tobytes(), "big").
+'''
+from functools import lru_cache
+
+import numpy as np
+
+from coordinates import orientations_to_coordinate, rank_permutations
+from groupcube import GroupCube, oriented_goals as group_goals
+from sticker_cube import StickerCube, oriented_goals as sticker_goals, sticker_colors
+
+
+def sticker_state_keys(states):
+    '''
+    Keys of an (N, 54) array of sticker codes (see BatchedStickerCube), 3 bits per sticker packed into 21 bytes.
+    '''
+    states = np.asarray(states, dtype = np.uint8).reshape(-1, 54)
+    #The low 3 bits of every code, most significant first, behind 6 bits of padding to make 168 bits
+    bits = np.unpackbits(states[:, :, None], axis = 2)[:, :, 5:].reshape(len(states), 162)
+    padded = np.zeros((len(states), 168), dtype = np.uint8)
+    padded[:, 6:] = bits
+    return np.ascontiguousarray(np.packbits(padded, axis = 1)).view("V21").ravel()
+
+def group_state_array(cubes):
+    '''
+    Stacks GroupCubes into an (N, 46) uint8 array, each row is
+    corner perm (8), edge perm (12), corner orient (8), edge orient (12) and centers (6), the same as GroupCube.current_state.
+    '''
+    return np.frombuffer(b"".join(b"".join(cube.current_state) for cube in cubes), dtype = np.uint8).reshape(-1, 46)
+
+def group_state_keys(states):
+    '''
+    Keys of an (N, 46) array of GroupCube states (see group_state_array), 16 bytes each.
+    '''
+    states = np.asarray(states, dtype = np.int64).reshape(-1, 46)
+    corner_perm, edge_perm, corner_orient, edge_orient, center = np.split(states, [8, 20, 28, 40], axis = 1)
+    #Orientations are stored by cubie, the twist and flip coordinates read them by position.
+    twist = orientations_to_coordinate(np.take_along_axis(corner_orient, corner_perm, axis = 1), 3)
+    flip = orientations_to_coordinate(np.take_along_axis(edge_orient, edge_perm, axis = 1), 2)
+    high = rank_permutations(corner_perm)*2187 + twist
+    low = (rank_permutations(edge_perm)*2048 + flip)*720 + rank_permutations(center)
+    return np.ascontiguousarray(np.stack([high, low], axis = 1).astype(">u8")).view("V16").ravel()
+
+
+@lru_cache(maxsize = None)
+def _row_weights(width):
+    '''
+    Odd random 64 bit multipliers, one per 8 bytes of a row of the given width, for _row_hashes.
+    '''
+    return np.random.default_rng(width).integers(0, 2**62, size = (width + 7)//8, dtype = np.uint64)*np.uint64(2) + np.uint64(1)
+
+def _row_hashes(states):
+    weights = _row_weights(states.shape[1])
+    padded = np.zeros((len(states), len(weights)*8), dtype = np.uint8)
+    padded[:, :states.shape[1]] = states
+    return padded.view(np.uint64) @ weights
+
+def rows_in(states, rows):
+    '''
+    Boolean (N,) array, True where a row of states equals one of rows. Both are uint8 arrays of the same width,
+    e.g. an (N, 54) batch of sticker codes against the 24 oriented goals.
+
+    Every row is hashed into one 64 bit number, and only rows whose hash is also a goal's are compared in full.
+    '''
+    states = np.asarray(states, dtype = np.uint8)
+    states = states.reshape(len(states), -1)
+    rows = np.asarray(rows, dtype = np.uint8).reshape(-1, states.shape[1])
+    out = np.zeros(len(states), dtype = bool)
+    if len(rows) == 0:
+        return out
+    row_hashes = _row_hashes(rows)
+    order = np.argsort(row_hashes)
+    sorted_hashes = row_hashes[order]
+    hashes = _row_hashes(states)
+    index = np.minimum(np.searchsorted(sorted_hashes, hashes), len(rows) - 1)
+    candidates = np.flatnonzero(sorted_hashes[index] == hashes)
+    out[candidates] = (states[candidates] == rows[order[index[candidates]]]).all(axis = 1)
+    return out
+
+@lru_cache(maxsize = 64)
+def _sticker_goals(solved_state):
+    codes = dict((x, i) for i, x in enumerate(sticker_colors))
+    return np.array([[codes[x] for x in goal] for goal in sticker_goals(solved_state)], dtype = np.uint8)
+
+def solved_sticker_states(states, solved_state = None):
+    '''
+    Batched StickerCube.is_solved: a boolean (N,) array for an (N, 54) array of sticker codes (see BatchedStickerCube),
+    True where the row is solved_state (StickerCube.solved_state by default, masked stickers and all) in any of the 24 orientations.
+    '''
+    if solved_state is None:
+        solved_state = StickerCube.solved_state
+    return rows_in(states, _sticker_goals(tuple(solved_state)))
+
+def solved_group_states(states, solved_state = None):
+    '''
+    Batched GroupCube.is_solved: a boolean (N,) array for an (N, 46) array of GroupCube states (see group_state_array).
+    '''
+    if solved_state is None:
+        solved_state = GroupCube.solved_state
+    goals = group_goals(tuple(solved_state))
+    return rows_in(states, np.frombuffer(b"".join(goals), dtype = np.uint8).reshape(-1, 46))
+
+
+if __name__ == "__main__":
+    import time
+    from batched_sticker_cube import BatchedStickerCube
+
+    rubik = StickerCube()
+    rubik("R U R' U' x M2")
+    batch = BatchedStickerCube(1)
+    batch("R U R' U' x M2")
+    print("Sticker keys agree: " + str(int.from_bytes(batch.state_keys()[0].tobytes(), "big") == rubik.state_key()))
+    cube = GroupCube()
+    cube("R U R' U' x M2")
+    print("GroupCube keys agree: " + str(int.from_bytes(group_state_keys(group_state_array([cube]))[0].tobytes(), "big") == cube.state_key()))
+
+    #Dedupe a million short scrambles
+    number = 10**6
+    rubiks = BatchedStickerCube(number)
+    for i in range(4):
+        rubiks.turn_each(np.random.randint(0, 18, size = number))
+    start = time.perf_counter()
+    keys = rubiks.state_keys()
+    unique_keys = np.unique(keys)
+    print(str(number) + " four move scrambles hashed and deduped in " + str(round(time.perf_counter() - start, 2)) + "s, "
+          + str(len(unique_keys)) + " distinct states")
+
+    #Solved checks: a StickerCube at a time (24 precomputed goals in a set), against the whole batch at once
+    rubiks.reset(np.arange(0, number, 2))
+    cube = StickerCube()
+    start = time.perf_counter()
+    for row in rubiks.current_state[:10000].tolist():
+        cube.current_state = [sticker_colors[x] for x in row]
+        cube.is_solved()
+    single = (time.perf_counter() - start)/10000
+    start = time.perf_counter()
+    solved = solved_sticker_states(rubiks.current_state)
+    batched = (time.perf_counter() - start)/number
+    print("is_solved one cube at a time (decoding included): " + str(round(single*1e6, 2)) + "us per cube, solved_sticker_states: "
+          + str(round(batched*1e9)) + "ns per cube, " + str(int(solved.sum())) + " solved")
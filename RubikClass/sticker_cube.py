@@ -1,8 +1,41 @@
+from functools import lru_cache
+from operator import itemgetter
+
 from cyclic_permutation import permute_list_mutable #Used to turn cube
 from generate_cyclic_notation import generate_moves
-from visualize_stickered_cube import pixel_value_sticker
 
-from abstract_cube import AbstractCube
+from abstract_cube import AbstractCube, LazyClassAttribute, whole_cube_rotations
+
+#Every sticker a StickerCube can hold, the position in this list is the code used by packed and batched representations.
+#'e' and '' are the greyed out and blacked out stickers used when building masked solved states.
+sticker_colors = ['w', 'b', 'r', 'g', 'o', 'y', 'e', '']
+#Each sticker as an octal digit, for state_key
+_octal_digits = dict((x, str(i)) for i, x in enumerate(sticker_colors))
+
+@lru_cache(maxsize = None)
+def _generated_moves():
+    '''
+    generate_moves() runs the permutation parser over the whole notation, so it is only done once, the first time it's needed.
+    '''
+    return generate_moves()
+
+def _rotation_gather(cls, rotation):
+    index = list(range(54))
+    for letter in rotation:
+        index = list(cls._move_table[letter](index))
+    return tuple(index)
+
+@lru_cache(maxsize = 64)
+def oriented_goals(solved_state):
+    '''
+    The 24 whole cube orientations of a solved state (a tuple of 54 stickers, masked ones included) as tuples, in whole_cube_rotations order.
+    '''
+    return tuple(tuple(solved_state[i] for i in gather) for gather in StickerCube.rotation_gathers)
+
+@lru_cache(maxsize = 64)
+def _goal_keys(solved_state):
+    return frozenset(oriented_goals(solved_state))
+
 
 class StickerCube(AbstractCube): #Might actually be a representation of the abstract object.
     """
@@ -56,12 +89,16 @@ class StickerCube(AbstractCube): #Might actually be a representation of the abst
         *              |*51**52**53*|
         *              |************|
     """
-    #Both dictionaries. turn_to_cycle takes one of the 6*9 common moves and returns the cyclic permutation
-    turn_to_cycle, cubie_lookup = generate_moves()
+    #Both dictionaries, built on first use. turn_to_cycle takes one of the 6*9 common moves and returns the cyclic permutation
+    turn_to_cycle = LazyClassAttribute(lambda cls: _generated_moves()[0])
+    cubie_lookup = LazyClassAttribute(lambda cls: _generated_moves()[1])
+    #The sticker gather of each of the whole_cube_rotations, rotated_state[i] = state[gather[i]]
+    rotation_gathers = LazyClassAttribute(lambda cls: [_rotation_gather(cls, rotation) for rotation in whole_cube_rotations])
     solved_state = list('w'*9+'b'*9+"r"*9+"g"*9+'o'*9+'y'*9)
+    #A goals.Goal to check is_solved against instead of solved_state, per cube
+    goal = None
 
     def __init__(self):
-        self.history = ""
         #We could modify this for potentially learning to generate specific sub-steps, such as OLL/CMLL/etc
         self.current_state = StickerCube.solved_state.copy()
 
@@ -73,20 +110,66 @@ class StickerCube(AbstractCube): #Might actually be a representation of the abst
             out += str(self.current_state[i*9:(i+1)*9]) + "\n"
         return out
 
-    @AbstractCube.recursively_remap
     def turn(self, letter):
         '''
         Applies a single turn to the Rubik's cube object.
 
-        Moves all the stickers for a given turn.
+        Every legal move (rotations, wide moves and aliases included) was composed into one 54 sticker permutation by compile_moves,
+        so this moves all the stickers with a single lookup.
+        '''
+        self._apply(self._move_table[letter])
+
+    def _apply(self, transform):
+        '''
+        Performs a sticker gather built by _compose_moves.
+        '''
+        self.current_state = list(transform(self.current_state))
+
+    def snapshot(self):
+        '''
+        A copy of the stickers, for the history's checkpoints (see AbstractCube.seek).
+        '''
+        return self.current_state.copy()
+
+    def restore(self, snapshot):
+        self.current_state = snapshot.copy()
+
+    def _turn_basic(self, letter):
+        '''
+        Moves all the stickers for one of the basic turns in turn_to_cycle.
+        '''
+        permute_list_mutable(self.current_state, self.turn_to_cycle[letter])
+
+    @classmethod
+    def _trace_moves(cls, letters):
+        '''
+        Composes a list of basic turns into one gather over the stickers, as 54 bytes (new_state[i] = old_state[trace[i]]).
         '''
-        cycle = self.turn_to_cycle[letter]
-        permute_list_mutable(self.current_state, cycle)
+        index = list(range(54))
+        for letter in letters:
+            permute_list_mutable(index, cls.turn_to_cycle[letter])
+        return bytes(index)
+
+    @staticmethod
+    def _transform_from_trace(trace):
+        '''
+        The gather as an itemgetter (new_state = getter(old_state)).
+        '''
+        return itemgetter(*trace)
+
+    def state_key(self):
+        '''
+        Packs the stickers into one integer, 3 bits per sticker (its index in sticker_colors) with sticker 0 the most significant.
+
+        Two cubes have the same key exactly when they have the same stickers, so keys can be hashed, compared and stored in sets.
+        state_keys.sticker_state_keys computes the same keys (as 21 big-endian bytes) for a whole (N, 54) batch.
+        '''
+        return int("".join([_octal_digits[x] for x in self.current_state]), 8)
 
     #Would include basic_state_vector in here, but we already have the state represented as a vector.
     def reset(self):
-        self.history = ""
-        self.current_state = StickerCube.solved_state.copy()
+        del self.history
+        self.current_state = self.solved_state.copy()
 
     def visualize(self, compact = True, color =True):
         """
@@ -98,43 +181,22 @@ class StickerCube(AbstractCube): #Might actually be a representation of the abst
         Shape is (6, 9, 3) if color, else (6, 9)
         """
         bandw = not color
+        #numpy only gets imported when somebody wants a picture
+        from visualize_stickered_cube import pixel_value_sticker
         image_numpy_array = pixel_value_sticker(sticker_array = self.current_state, bandw = bandw)
         return image_numpy_array
 
     def is_solved(self):
         '''
-        Method to check if the cube is "solved".
+        Method to check if the cube is "solved": its stickers are solved_state in any of the 24 orientations.
 
-        Slow method is implemented if we ever want to redefine what a "solved" state to allow for blacked out stickers (such as CMLL).
-
-        Fast method checks the number of distinct colors on each side.
-        Slow method performs all 24 rotations to the cube. Only occurs if you redefine Cube class's global solved_state.
+        Works the same for a redefined solved_state (blacked out stickers for CMLL and such), where masked stickers have to match exactly.
+        The 24 oriented goals are built once per solved_state (see oriented_goals), after that this is a single hash lookup.
+        A cube with a goal (see goals.py) is checked against that instead.
         '''
-        #This is the boolean value that checks if we modified the Cube class from some other file. If this is the case we use the slow version.
-        slow = StickerCube.solved_state != list('w'*9+'b'*9+"r"*9+"g"*9+'o'*9+'y'*9)
-        #print(slow, " slow")
-        #print("SOLVED STATE:", StickerCube.solved_state)
-        if slow:
-            #We just generate each rotation. Make another cube object in the solved state, and rotate the solved cube until it matches with unsolved cube
-            first_rotation = {'','x', 'x2', "x'", 'z', "z'"}
-            second_rotation = {"","y", "y'", "y2"}
-            all_rotations = [x+y for x in first_rotation for y in second_rotation]
-            comparison_cube = StickerCube()
-            for rotation in all_rotations:
-                comparison_cube(rotation)
-                if comparison_cube.current_state == self.current_state:
-                    return True
-                comparison_cube.reset()
-            return False
-        else:
-            set_of_sticker_colors_per_side = [set(self.current_state[i*9:(i+1)*9]) for i in range(6)]
-            distinct_stickers_per_side = [len(x) for x in set_of_sticker_colors_per_side]
-            if sum(distinct_stickers_per_side) == 6: #Each side has only one distinct color
-                return True
-            else:
-                return False
-
-
+        if self.goal is not None:
+            return self.goal.is_reached(self.current_state)
+        return tuple(self.current_state) in _goal_keys(tuple(self.solved_state))
 
 
 if __name__  == "__main__":
@@ -158,3 +220,77 @@ U2 M U' U2' M U'M' U2' M' U2' M2'"""
     sus_string = " ".join(sys.argv[1:])
     rubik(sus_string)
     print(rubik)
+
+    #Benchmark the compiled move table against the old recursive remap dispatch
+    import random
+    import time
+    import timeit
+    from abstract_cube import make_turn_recursively_remap
+    recursive_turn = make_turn_recursively_remap(StickerCube._turn_basic)
+    moves = rubik.string_parse("x y' Rw2 u'")
+    def before():
+        rubik.reset()
+        for move in moves:
+            recursive_turn(rubik, move)
+    def after():
+        rubik.reset()
+        for move in moves:
+            rubik.turn(move)
+    before()
+    recursive_state = rubik.current_state
+    after()
+    print("Compiled table agrees with recursive remap: " + str(recursive_state == rubik.current_state))
+    number = 20000
+    print("x y' Rw2 u' turns, recursive remap: " + str(round(timeit.timeit(before, number = number)/number*1e6, 2)) + "us")
+    print("x y' Rw2 u' turns, compiled table:  " + str(round(timeit.timeit(after, number = number)/number*1e6, 2)) + "us")
+    print('rubik("x y\' Rw2 u\'") including parsing: ' + str(round(timeit.timeit(lambda: rubik("x y' Rw2 u'"), number = number)/number*1e6, 2)) + "us")
+
+    #Benchmark a compiled algorithm against turning it move by move. The history is cleared every time so its growth doesn't pollute the timing.
+    algorithm = "R U R' F' R U R' U' R' F R2 U' R' U' R U R'"
+    compiled = rubik.compile(algorithm)
+    rubik.reset()
+    rubik(algorithm)
+    turned_state = rubik.current_state
+    rubik.reset()
+    rubik.apply(compiled)
+    print("Compiled algorithm agrees with turning it: " + str(turned_state == rubik.current_state))
+    def timed(function):
+        def cleared():
+            del rubik.history
+            function()
+        return str(round(timeit.timeit(cleared, number = number)/number*1e6, 2)) + "us"
+    print("17 move algorithm, rubik(algorithm):           " + timed(lambda: rubik(algorithm)))
+    print("17 move algorithm, rubik.apply(compiled):      " + timed(lambda: rubik.apply(compiled)))
+    print("17 move algorithm, compile (cached) and apply: " + timed(lambda: rubik.apply(rubik.compile(algorithm))))
+    print("Single turn, rubik.turn('R'):                  " + timed(lambda: rubik.turn("R")))
+    print(StickerCube.compile_cache_info())
+
+    #Long episodes: the old string history (an attribute, so += copied the whole string on every call) against the MoveHistory's one byte append
+    class OldHistory:
+        history = ""
+    old = OldHistory()
+    episode = [random.choice(["R", "U'", "F2", "L", "D'", "B"]) for x in range(100000)]
+    rubik.reset()
+    start = time.perf_counter()
+    for move in episode:
+        old.history += " " + move
+        rubik.turn(move)
+    old_time = time.perf_counter() - start
+    old_history = old.history
+    rubik.reset()
+    start = time.perf_counter()
+    for move in episode:
+        rubik([move])
+    new_time = time.perf_counter() - start
+    print(str(len(episode)) + " single move calls, string history: " + str(round(old_time/len(episode)*1e6, 2)) + "us per move, MoveHistory: "
+          + str(round(new_time/len(episode)*1e6, 2)) + "us per move")
+    print("History renders the same: " + str(str(rubik.history) == old_history.strip()))
+    final_state = rubik.current_state
+    start = time.perf_counter()
+    points = list(range(0, len(episode), 997)) + [len(episode)]
+    for k in points:
+        rubik.seek(k)
+    print("seek to " + str(len(points)) + " points of the episode: " + str(round((time.perf_counter() - start)*1e3, 2)) + "ms, back at the end: " + str(rubik.current_state == final_state))
+    rubik.undo()
+    rubik.redo()
+    print("undo then redo leaves the cube alone: " + str(rubik.current_state == final_state))
@@ -0,0 +1,278 @@
+'''
+Canonical states under the 48 symmetries of the cube (24 rotations, each with or without a left-right mirror).
+
+A symmetry is a relabeling of sticker positions: symmetry_maps[k] is a 54 element gather index, built from the x, y and z rotations
+in AbstractCube._remap plus the mirror that swaps the L and R faces. Conjugating a state by it (gathering the stickers, then recoloring
+so every center is back to its solved color) gives the same position seen from another angle or in a mirror, at the same distance from solved.
+The canonical state is the smallest of the 48 conjugates, comparing the sticker codes (see sticker_colors) lexicographically:
+
+    codes, symmetry = canonical_sticker_states(rubiks.current_state)      #(N, 54) BatchedStickerCube codes
+    stickers, symmetry = canonical_stickers(rubik.current_state)          #one StickerCube
+    cube, symmetry = canonical_group_cube(cube)                           #one GroupCube, through its stickers
+
+symmetry_names[k] says which symmetry was used, e.g. "x y'" or "mirror z".
+Whole cube rotations of a state are conjugates too, so all 24 orientations of a position share one canonical state.
+'''
+from functools import lru_cache
+from itertools import product
+
+import numpy as np
+
+from abstract_cube import AbstractCube
+from groupcube import GroupCube
+from sticker_cube import StickerCube, sticker_colors
+
+_codes = dict((x, i) for i, x in enumerate(sticker_colors))
+_solved_codes = np.array([_codes[x] for x in StickerCube.solved_state], dtype = np.uint8)
+#Sticker index of the center of each face
+_centers = np.arange(6)*9 + 4
+
+
+def _rotation_map(letter):
+    '''
+    Gather index of a whole cube rotation, composed from its AbstractCube._remap definition.
+    '''
+    return np.array(StickerCube._compose_moves(AbstractCube.resolve_remap(letter))(range(54)), dtype = np.intp)
+
+def _mirror_map():
+    '''
+    Gather index of the left-right mirror: the U, B, F and D faces flip their columns, and R and L swap places (also flipping columns).
+    '''
+    index = np.arange(54)
+    for row, column in product(range(3), range(3)):
+        for face in (0, 1, 3, 5):
+            index[face*9 + 3*row + column] = face*9 + 3*row + 2 - column
+        index[2*9 + 3*row + column] = 4*9 + 3*row + 2 - column
+        index[4*9 + 3*row + column] = 2*9 + 3*row + 2 - column
+    return index
+
+def _build_symmetries():
+    '''
+    The 24 rotations, found by closing x, y and z under composition (shortest names first), then the same 24 after the mirror.
+    '''
+    generators = [(x, _rotation_map(x)) for x in ("x", "y", "z")]
+    identity = np.arange(54)
+    names, maps = [""], [identity]
+    seen = {identity.tobytes()}
+    frontier = [("", identity)]
+    while frontier:
+        next_frontier = []
+        for name, index in frontier:
+            for letter, generator in generators:
+                #Rotating by name and then by letter
+                composed = index[generator]
+                if composed.tobytes() not in seen:
+                    seen.add(composed.tobytes())
+                    names.append((name + " " + letter).strip())
+                    maps.append(composed)
+                    next_frontier.append((names[-1], composed))
+        frontier = next_frontier
+    #Write repeated rotations the usual way, "x x" as "x2" and "y y y" as "y'"
+    for i, name in enumerate(names):
+        letters = name.split()
+        runs = []
+        for letter in letters:
+            if runs and runs[-1][0] == letter:
+                runs[-1][1] += 1
+            else:
+                runs.append([letter, 1])
+        names[i] = " ".join(letter + ["", "", "2", "'"][count] for letter, count in runs)
+    mirror = _mirror_map()
+    names += [("mirror " + x).strip() for x in names]
+    maps += [x[mirror] for x in maps]
+    return names, np.array(maps, dtype = np.intp)
+
+symmetry_names, symmetry_maps = _build_symmetries()
+
+
+def conjugate_sticker_states(codes, symmetry):
+    '''
+    Applies symmetry (an index into symmetry_maps) to an (N, 54) array of sticker codes, recoloring so the centers are solved.
+    '''
+    codes = np.asarray(codes, dtype = np.uint8).reshape(-1, 54)
+    moved = np.take(codes, symmetry_maps[symmetry], axis = 1)
+    #Color relabeling, the color now on each center becomes that face's solved color. Masked colors stay as they are.
+    centers = moved[:, _centers]
+    if len(codes) and (centers == centers[0]).all():
+        #Every cube has its centers in the same place (the usual case), so one relabeling does for all of them
+        recolor = np.arange(len(sticker_colors), dtype = np.uint8)
+        recolor[centers[0]] = _solved_codes[_centers]
+        return recolor[moved]
+    recolor = np.tile(np.arange(len(sticker_colors), dtype = np.uint8), (len(codes), 1))
+    recolor[np.arange(len(codes))[:, None], centers] = _solved_codes[_centers]
+    return np.take_along_axis(recolor, moved, axis = 1)
+
+def canonical_sticker_states(codes):
+    '''
+    Canonical representative of every row of an (N, 54) array of sticker codes.
+    Returns (canonical codes (N, 54), symmetry used (N,)), conjugate_sticker_states(codes, symmetry) gives back the canonical codes.
+    '''
+    codes = np.asarray(codes, dtype = np.uint8).reshape(-1, 54)
+    rows = np.arange(len(codes))
+    best = conjugate_sticker_states(codes, 0)
+    used = np.zeros(len(codes), dtype = np.intp)
+    for symmetry in range(1, len(symmetry_maps)):
+        candidate = conjugate_sticker_states(codes, symmetry)
+        #Lexicographic comparison, decided by the first sticker where the two differ
+        different = candidate != best
+        first = np.argmax(different, axis = 1)
+        smaller = different[rows, first] & (candidate[rows, first] < best[rows, first])
+        best[smaller] = candidate[smaller]
+        used[smaller] = symmetry
+    return best, used
+
+def canonical_stickers(stickers):
+    '''
+    Canonical representative of one StickerCube state (a list of 54 sticker colors), returned as (sticker list, symmetry).
+    '''
+    codes, used = canonical_sticker_states([[_codes[x] for x in stickers]])
+    return [sticker_colors[x] for x in codes[0]], int(used[0])
+
+
+#Where every GroupCube position is on the sticker cube (see the GroupCube and StickerCube docstrings)
+corner_names = ["ULB", "URB", "URF", "ULF", "DLB", "DRB", "DRF", "DLF"]
+edge_names = ["UB", "UR", "UF", "UL", "LB", "RB", "RF", "LF", "DB", "DR", "DF", "DL"]
+
+def _traced_turns(perm, orient):
+    '''
+    Every face turn as (move, source position, target position, orientation change, sticker gather), traced once on a solved GroupCube
+    (the cubie that starts in position q ends up in the target position) and a StickerCube.
+    '''
+    traced = []
+    for move in GroupCube.face_turns:
+        cube = GroupCube()
+        cube(move)
+        gather = StickerCube._move_table[move](range(54))
+        for target, source in enumerate(getattr(cube, perm)):
+            traced.append((move, source, target, getattr(cube, orient)[source], gather))
+    return traced
+
+@lru_cache(maxsize = None)
+def facelet_tables():
+    '''
+    How GroupCube's cubies show up on the stickers. The sticker positions of every cubie come from StickerCube.cubie_lookup,
+    and how far a cubie's colors are turned depends on where it is, which cubie it is and its orientation. Starting from the solved cube
+    (every cubie home, unturned) this follows every face turn from every combination found so far until all of them are known,
+    so each one is worked out from a single traced turn (once, on first use). Raises if the two representations ever disagree.
+
+    Returns (corner slots (8, 3), corner turns (8, 8, 3), edge slots (12, 2), edge turns (12, 12, 2)), where turns[position, cubie, orientation] = k
+    means sticker slots[position][i] shows sticker (i + k) % n of the cubie.
+    '''
+    result = []
+    for names, perm, orient in ((corner_names, "_corner_perm", "_corner_orient"), (edge_names, "_edge_perm", "_edge_orient")):
+        slots = [list(StickerCube.cubie_lookup[x].default_value) for x in names]
+        size = len(slots[0])
+        traced = _traced_turns(perm, orient)
+        turns = -np.ones((len(names), len(names), size), dtype = np.intp)
+        found = [(position, position, 0) for position in range(len(names))]
+        for position in range(len(names)):
+            turns[position, position, 0] = 0
+        while found:
+            position, cubie, orientation = found.pop()
+            shown = turns[position, cubie, orientation]
+            for move, source, target, change, gather in traced:
+                if source != position:
+                    continue
+                #Slot i of the target shows what slot j of the source showed, which is sticker (j + shown) % size of the cubie
+                shifts = set((slots[source].index(gather[x]) - i + shown) % size for i, x in enumerate(slots[target]))
+                moved = (target, cubie, (orientation + change) % size)
+                if len(shifts) != 1 or turns[moved] not in (-1, min(shifts)):
+                    raise RuntimeError("GroupCube and StickerCube disagree about " + names[target] + " after " + move)
+                if turns[moved] == -1:
+                    turns[moved] = shifts.pop()
+                    found.append(moved)
+        result += [np.array(slots, dtype = np.intp), turns]
+    return tuple(result)
+
+def group_to_sticker_states(states):
+    '''
+    (N, 46) GroupCube states (see state_keys.group_state_array) into (N, 54) sticker codes.
+    '''
+    corner_slots, corner_turns, edge_slots, edge_turns = facelet_tables()
+    states = np.asarray(states, dtype = np.intp).reshape(-1, 46)
+    corner_perm, edge_perm, corner_orient, edge_orient, center = np.split(states, [8, 20, 28, 40], axis = 1)
+    rows = np.arange(len(states))[:, None]
+    codes = np.empty((len(states), 54), dtype = np.uint8)
+    #Centers: face f shows the center of face center[f]
+    codes[:, _centers] = _solved_codes[_centers[center]]
+    for perm, orient, slots, turns in ((corner_perm, corner_orient, corner_slots, corner_turns),
+                                       (edge_perm, edge_orient, edge_slots, edge_turns)):
+        size = slots.shape[1]
+        turn = turns[np.arange(len(slots)), perm, orient[rows, perm]]
+        for i in range(size):
+            codes[:, slots[:, i]] = _solved_codes[slots[perm, (i + turn) % size]]
+    return codes
+
+def sticker_to_group_states(codes):
+    '''
+    Inverse of group_to_sticker_states, for sticker codes of real cube states (no masked stickers).
+    '''
+    corner_slots, corner_turns, edge_slots, edge_turns = facelet_tables()
+    codes = np.asarray(codes, dtype = np.uint8).reshape(-1, 54)
+    out = [None]*5
+    for index, slots, turns in ((0, corner_slots, corner_turns), (1, edge_slots, edge_turns)):
+        size = slots.shape[1]
+        #Every way a cubie's colors can be read off a slot, as a number in base 8, gives back (cubie, turn)
+        lookup_cubie = np.zeros(8**size, dtype = np.intp)
+        lookup_turn = np.zeros(8**size, dtype = np.intp)
+        for cubie, k in product(range(len(slots)), range(size)):
+            colors = np.roll(_solved_codes[slots[cubie]], -k)
+            key = sum(int(x)*8**(size - 1 - i) for i, x in enumerate(colors))
+            lookup_cubie[key], lookup_turn[key] = cubie, k
+        shown = codes[:, slots].astype(np.intp)
+        keys = (shown*(8**np.arange(size - 1, -1, -1))).sum(axis = 2)
+        perm, turn = lookup_cubie[keys], lookup_turn[keys]
+        #orientation_of_turn[position, cubie, k] is the orientation that turns the cubie's colors by k there
+        orientation_of_turn = np.argsort(turns, axis = 2)
+        orient = orientation_of_turn[np.arange(len(slots)), perm, turn]
+        #Stored by cubie
+        by_cubie = np.empty_like(orient)
+        np.put_along_axis(by_cubie, perm, orient, axis = 1)
+        out[index], out[index + 2] = perm, by_cubie
+    center_of_color = np.argsort(_solved_codes[_centers])
+    out[4] = center_of_color[codes[:, _centers]]
+    return np.concatenate(out, axis = 1).astype(np.uint8)
+
+def canonical_group_states(states):
+    '''
+    Canonical representative of every row of an (N, 46) array of GroupCube states, returned as (states, symmetry used).
+    '''
+    codes, used = canonical_sticker_states(group_to_sticker_states(states))
+    return sticker_to_group_states(codes), used
+
+def canonical_group_cube(cube):
+    '''
+    Canonical representative of a GroupCube, returned as (new GroupCube, symmetry). Its coordinates() are the canonical coordinates.
+    '''
+    states, used = canonical_group_states(np.frombuffer(b"".join(cube.current_state), dtype = np.uint8))
+    canonical = GroupCube()
+    for array, start, end in zip(canonical.current_state, (0, 8, 20, 28, 40), (8, 20, 28, 40, 46)):
+        array[:] = bytes(states[0, start:end])
+    return canonical, int(used[0])
+
+
+if __name__ == "__main__":
+    import time
+    from batched_sticker_cube import BatchedStickerCube
+
+    #A position, its mirror image and a rotated copy all have the same canonical state
+    first, second, third = StickerCube(), StickerCube(), StickerCube()
+    first("R U R' F2 D'")
+    second("L' U' L F2 D")
+    third("y R U R' F2 D' z2")
+    print("Mirror and rotation share the canonical state: " + str(canonical_stickers(first.current_state)[0]
+          == canonical_stickers(second.current_state)[0] == canonical_stickers(third.current_state)[0]))
+    cube = GroupCube()
+    cube("R U R' F2 D'")
+    print("GroupCube through stickers and back: " + str(sticker_to_group_states(group_to_sticker_states(
+          np.frombuffer(b"".join(cube.current_state), dtype = np.uint8))).tobytes() == b"".join(cube.current_state)))
+
+    number = 100000
+    rubiks = BatchedStickerCube(number)
+    for i in range(6):
+        rubiks.turn_each(np.random.randint(0, 18, size = number))
+    start = time.perf_counter()
+    codes, used = canonical_sticker_states(rubiks.current_state)
+    elapsed = time.perf_counter() - start
+    print(str(number) + " six move scrambles canonicalized in " + str(round(elapsed, 2)) + "s, "
+          + str(len(np.unique(rubiks.state_keys()))) + " distinct states, " + str(len(np.unique(codes, axis = 0))) + " up to symmetry")
@@ -0,0 +1,95 @@
+'''
+On-disk cache for precomputed tables (pattern databases, pruning tables, move tables).
+
+Tables are saved in the tables/ directory next to this file (or in ~/.cache/RubikReconstruction when that isn't writable) and opened
+memory-mapped, so after the first build a process only pages in the parts of a table it actually reads and startup is instant.
+load_or_build keeps numpy arrays as .npy files, load_or_build_bytes keeps raw bytes (for the cubes' move tables, which load without numpy).
+'''
+import mmap
+import os
+
+table_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tables")
+user_table_directory = os.path.join(os.path.expanduser("~"), ".cache", "RubikReconstruction")
+
+
+def table_path(name, extension = ".npy"):
+    '''
+    Where the table called name is stored, or will be stored if it isn't cached yet.
+    '''
+    for directory in (table_directory, user_table_directory):
+        path = os.path.join(directory, name + extension)
+        if os.path.exists(path):
+            return path
+    return os.path.join(table_directory, name + extension)
+
+def _save(path, write):
+    '''
+    Calls write(file) on a temporary file renamed into place at path, so an interrupted build never leaves a half written table behind.
+    Falls back to the user cache directory when path's directory can't be written to, returns where the table ended up.
+    '''
+    for directory in (os.path.dirname(path), user_table_directory):
+        path = os.path.join(directory, os.path.basename(path))
+        temporary = path + "." + str(os.getpid()) + ".tmp"
+        try:
+            os.makedirs(directory, exist_ok = True)
+            with open(temporary, "wb") as f:
+                write(f)
+            os.replace(temporary, path)
+            return path
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+    raise OSError("Could not write " + os.path.basename(path) + " to " + table_directory + " or " + user_table_directory)
+
+def load_or_build(name, builder):
+    '''
+    Memory maps the cached numpy table called name, calling builder() to make (and save) it first if it isn't cached yet.
+    '''
+    #Imported here so that the cubes can use the cache without importing numpy
+    import numpy as np
+    path = table_path(name)
+    if not os.path.exists(path):
+        table = builder()
+        path = _save(path, lambda f: np.save(f, table))
+    return np.load(path, mmap_mode = "r")
+
+def load_or_build_bytes(name, builder):
+    '''
+    Read only memoryview of the cached bytes called name (memory-mapped), calling builder() to make (and save) them first if they aren't cached yet.
+    '''
+    path = table_path(name, ".bin")
+    if not os.path.exists(path):
+        data = bytes(builder())
+        path = _save(path, lambda f: f.write(data))
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+
+
+if __name__ == "__main__":
+    #Import time of the cubes in a fresh process, up to their first turn, with and without the move tables cached
+    import glob
+    import subprocess
+    import sys
+
+    def fresh_process(code, repeats = 5):
+        timed = "import time; start = time.perf_counter(); " + code + "; print(time.perf_counter() - start)"
+        return min(float(subprocess.run([sys.executable, "-c", timed], capture_output = True, text = True, check = True,
+                                        cwd = os.path.dirname(os.path.abspath(__file__))).stdout) for x in range(repeats))
+
+    def remove_move_tables():
+        for directory in (table_directory, user_table_directory):
+            for path in glob.glob(os.path.join(directory, "*_moves_v*.bin")):
+                os.remove(path)
+
+    imports = "from sticker_cube import StickerCube; from groupcube import GroupCube"
+    first_turns = imports + "; StickerCube()('R'); GroupCube()('R')"
+    print("Import only:                     " + str(round(fresh_process(imports)*1000, 1)) + "ms")
+    print("Building every table (no cache): " + str(round(fresh_process(imports + "; StickerCube.compile_moves(); GroupCube.compile_moves()")*1000, 1)) + "ms")
+    cold = []
+    for x in range(5):
+        remove_move_tables()
+        cold.append(fresh_process(first_turns, repeats = 1))
+    print("First turn, cold cache:          " + str(round(min(cold)*1000, 1)) + "ms")
+    print("First turn, warm cache:          " + str(round(fresh_process(first_turns)*1000, 1)) + "ms")
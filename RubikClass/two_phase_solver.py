@@ -0,0 +1,297 @@
+'''
+Two-phase (Kociemba) solver for GroupCube, near optimal solutions fast enough to label large numbers of states.
+
+Phase 1 brings the cube into the subgroup <U, D, R2, L2, F2, B2>: every corner twist and edge flip solved and the E slice edges (4-7)
+back in the E slice. Phase 2 then solves the cube with only those moves. Both phases are IDA* over coordinates (see coordinates.py),
+pruned with tables of exact distances:
+    - phase 1: corner twist x ud slice and edge flip x ud slice
+    - phase 2: corner permutation x slice edge permutation and UD edge permutation x slice edge permutation
+Once a solution is found the search keeps going for shorter ones (longer phase 1, shorter phase 2) until one is at most max_length moves
+long or the time budget runs out.
+
+The pruning tables are built on first use (a few seconds) and stored in the table cache (see table_cache.py).
+
+    solver = TwoPhaseSolver()
+    solution = solver.solve("R U2 F' D L2 B", max_length = 21, time_budget = 1.0)
+    solutions = solver.solve_batch(scrambles)
+'''
+import time
+from itertools import product
+
+import numpy as np
+
+from coordinates import coordinate_sizes, face_turns, face_turn_transforms, move_tables, rank_permutations, unrank_permutations
+from groupcube import GroupCube, rank_permutation
+from optimal_solver import breadth_first_depths
+from table_cache import load_or_build
+
+#Indices into face_turns of the moves that stay in the phase 2 subgroup
+phase2_moves = [face_turns.index(x) for x in ("U", "U2", "U'", "D", "D2", "D'", "R2", "L2", "F2", "B2")]
+#Edge positions outside the E slice, the UD edge permutation coordinate ranks the edges in these positions
+ud_edge_positions = (0, 1, 2, 3, 8, 9, 10, 11)
+#The 24 whole cube orientations, used to bring rotated cubes back to solved centers before solving
+rotations = [" ".join(x).strip() for x in product(["", "x", "x2", "x'", "z", "z'"], ["", "y", "y2", "y'"])]
+#The face of move m is m // 3, faces in face_turns are ordered U R L F B D
+_opposite = (5, 2, 1, 4, 3, 0)
+#Phase 2 never needs more than 18 moves, and phase 1 never more than 12
+_phase2_diameter = 18
+_longest = 12 + _phase2_diameter
+
+def _successors(allowed_moves):
+    '''
+    For every last face (at index last_face + 1, 0 for no last move) the (column, move, face) of the allowed moves that can follow it:
+    never the same face again, and opposite faces only in one order.
+    '''
+    return [[(column, move, move // 3) for column, move in enumerate(allowed_moves)
+             if move // 3 != last_face and not (_opposite[move // 3] == last_face and move // 3 < last_face)]
+            for last_face in range(-1, 6)]
+
+_phase1_successors = _successors(range(len(face_turns)))
+_phase2_successors = _successors(phase2_moves)
+
+
+def build_phase2_move_tables():
+    '''
+    (corner permutation, UD edge permutation, slice edge permutation) move tables over phase2_moves, shapes (40320, 10), (40320, 10), (24, 10).
+    '''
+    edge_source = face_turn_transforms()[2]
+    ud_edges = unrank_permutations(np.arange(40320), 8)
+    slice_edges = unrank_permutations(np.arange(24), 4)
+    corner_table = np.ascontiguousarray(move_tables()["corner_permutation"][:, phase2_moves])
+    ud_table = np.empty((40320, len(phase2_moves)), dtype = np.uint16)
+    slice_table = np.empty((24, len(phase2_moves)), dtype = np.uint16)
+    for column, move in enumerate(phase2_moves):
+        source = edge_source[move]
+        #Phase 2 moves keep UD edges among the UD positions and slice edges in the slice
+        ud_table[:, column] = rank_permutations(ud_edges[:, [ud_edge_positions.index(source[x]) for x in ud_edge_positions]])
+        slice_table[:, column] = rank_permutations(slice_edges[:, [source[x] - 4 for x in range(4, 8)]])
+    return corner_table, ud_table, slice_table
+
+def _pruning_table(first, second, moves):
+    '''
+    Distances for the pair coordinate first*len(second) + second, given the two (size, moves) move tables.
+    '''
+    first = first.astype(np.int64)
+    second = second.astype(np.int64)
+    def neighbours(indices, move):
+        a, b = np.divmod(indices, len(second))
+        return first[a, move]*len(second) + second[b, move]
+    return breadth_first_depths(len(first)*len(second), 0, neighbours, moves)
+
+def build_twist_slice_table():
+    tables = move_tables()
+    return _pruning_table(tables["corner_twist"], tables["ud_slice"], len(face_turns))
+
+def build_flip_slice_table():
+    tables = move_tables()
+    return _pruning_table(tables["edge_flip"], tables["ud_slice"], len(face_turns))
+
+def build_corner_slice_table():
+    corner_table, ud_table, slice_table = build_phase2_move_tables()
+    return _pruning_table(corner_table, slice_table, len(phase2_moves))
+
+def build_edge_slice_table():
+    corner_table, ud_table, slice_table = build_phase2_move_tables()
+    return _pruning_table(ud_table, slice_table, len(phase2_moves))
+
+
+class TwoPhaseSolver:
+    """
+    Kociemba's two-phase algorithm over GroupCube's face turns.
+
+    After a solve, nodes (positions generated in both phases) and search_time (seconds) describe the last search.
+    """
+    def __init__(self):
+        tables = move_tables()
+        #Flat lists index straight to python ints, table[coordinate*moves + move]
+        self._twist_moves = tables["corner_twist"].ravel().tolist()
+        self._flip_moves = tables["edge_flip"].ravel().tolist()
+        self._slice_moves = tables["ud_slice"].ravel().tolist()
+        self._corner_moves = tables["corner_permutation"].ravel().tolist()
+        self._phase2_tables = [x.ravel().tolist() for x in build_phase2_move_tables()]
+        self._twist_slice = bytes(load_or_build("two_phase_twist_slice", build_twist_slice_table))
+        self._flip_slice = bytes(load_or_build("two_phase_flip_slice", build_flip_slice_table))
+        self._corner_slice = bytes(load_or_build("two_phase_corner_slice", build_corner_slice_table))
+        self._edge_slice = bytes(load_or_build("two_phase_edge_slice", build_edge_slice_table))
+        #Compiled edge permutation of every face turn, to carry the edges through a phase 1 solution
+        self._edge_getters = [GroupCube._move_table[x][2] for x in face_turns]
+        self.nodes = 0
+        self.search_time = 0.0
+
+    @staticmethod
+    def _oriented(cube):
+        '''
+        Returns (rotation, cube) where rotation (possibly "") turns the given cube or scramble into a copy with solved centers.
+        '''
+        if isinstance(cube, str):
+            scramble = cube
+            cube = GroupCube()
+            cube(scramble)
+        elif not isinstance(cube, GroupCube):
+            #A row of group_state_array (see state_keys.py), or the five arrays of GroupCube.current_state
+            state = bytes(np.concatenate([np.asarray(x, dtype = np.uint8).ravel() for x in cube]))
+            cube = GroupCube()
+            for array, start, end in zip(cube.current_state, (0, 8, 20, 28, 40), (8, 20, 28, 40, 46)):
+                array[:] = state[start:end]
+        for rotation in rotations:
+            copy = GroupCube()
+            for array, original in zip(copy.current_state, cube.current_state):
+                array[:] = original
+            if rotation:
+                copy(rotation)
+            if bytes(copy._center) == GroupCube.solved_state[4]:
+                return rotation, copy
+        raise ValueError("The centers are not a whole cube orientation.")
+
+    def solve(self, cube, max_length = 21, time_budget = 1.0):
+        '''
+        Returns a solution for a GroupCube, scramble string or state (see _oriented) in the notation AbstractCube.__call__ accepts,
+        starting with a rotation when the cube isn't in its original orientation (the rotation isn't counted as a move).
+
+        Returns as soon as a solution of at most max_length face turns is found, otherwise the shortest one found within time_budget seconds
+        (None if there was none).
+        '''
+        start = time.perf_counter()
+        deadline = start + time_budget
+        nodes = 0
+        rotation, cube = self._oriented(cube)
+        twist_moves, flip_moves, slice_moves, corner_moves = self._twist_moves, self._flip_moves, self._slice_moves, self._corner_moves
+        corner2_moves, edge2_moves, slice2_moves = self._phase2_tables
+        twist_slice, flip_slice, corner_slice, edge_slice = self._twist_slice, self._flip_slice, self._corner_slice, self._edge_slice
+        edge_getters = self._edge_getters
+        moves, moves2 = len(face_turns), len(phase2_moves)
+        slices = coordinate_sizes["ud_slice"]
+        phase2_set = set(phase2_moves)
+        phase1_successors, phase2_successors = _phase1_successors, _phase2_successors
+        start_edges = bytes(cube._edge_perm)
+        path = []
+        #Solutions have to be shorter than limit[0], which drops every time one is found
+        limit = [_longest + 1]
+        best = [None]
+        out_of_time = [False]
+
+        def phase2(corner, edges, slice_edges, togo, last_face):
+            #The pruning bound of the position is at most togo, children are pruned before the call
+            nonlocal nodes
+            if togo == 0:
+                #Both pruning tables are 0 only on the solved cube
+                return True
+            togo -= 1
+            corner, edges, slice_edges = corner*moves2, edges*moves2, slice_edges*moves2
+            for column, move, face in phase2_successors[last_face + 1]:
+                nodes += 1
+                if not nodes & 4095 and time.perf_counter() > deadline:
+                    #Unwinds the whole search, start_phase2 tells this apart from a solution
+                    out_of_time[0] = True
+                    return True
+                corner2 = corner2_moves[corner + column]
+                slice2 = slice2_moves[slice_edges + column]
+                if corner_slice[corner2*24 + slice2] > togo:
+                    continue
+                edges2 = edge2_moves[edges + column]
+                if edge_slice[edges2*24 + slice2] > togo:
+                    continue
+                path.append(move)
+                if phase2(corner2, edges2, slice2, togo, face):
+                    return True
+                path.pop()
+            return False
+
+        def start_phase2(corner, last_face):
+            '''
+            Runs phase 2 from the end of the phase 1 solution in path, returns True when the search can stop.
+            '''
+            edges = start_edges
+            for move in path:
+                edges = edge_getters[move](edges)
+            ud = rank_permutation([ud_edge_positions.index(edges[x]) for x in ud_edge_positions])
+            slice_edges = rank_permutation([edges[x] - 4 for x in range(4, 8)])
+            length = len(path)
+            #Only phase 2 solutions that beat the best one so far are worth finding, and none is longer than _phase2_diameter
+            for depth in range(max(corner_slice[corner*24 + slice_edges], edge_slice[ud*24 + slice_edges]),
+                               min(limit[0] - length, _phase2_diameter + 1)):
+                if phase2(corner, ud, slice_edges, depth, last_face):
+                    if out_of_time[0]:
+                        del path[length:]
+                        return True
+                    best[0] = list(path)
+                    limit[0] = len(path)
+                    del path[length:]
+                    return limit[0] <= max_length
+            return time.perf_counter() > deadline
+
+        def phase1(twist, flip, slice_position, corner, togo, last_face):
+            #Returns True when the whole search should stop, the pruning bound of the position is at most togo
+            nonlocal nodes
+            if togo == 0:
+                return start_phase2(corner, last_face)
+            togo -= 1
+            twist, flip, slice_position = twist*moves, flip*moves, slice_position*moves
+            for column, move, face in phase1_successors[last_face + 1]:
+                #A last phase 1 move that is also a phase 2 move only repeats a shorter phase 1 solution
+                if togo == 0 and move in phase2_set:
+                    continue
+                nodes += 1
+                slice2 = slice_moves[slice_position + move]
+                twist2 = twist_moves[twist + move]
+                if twist_slice[twist2*slices + slice2] > togo:
+                    continue
+                flip2 = flip_moves[flip + move]
+                if flip_slice[flip2*slices + slice2] > togo:
+                    continue
+                path.append(move)
+                if phase1(twist2, flip2, slice2, corner_moves[corner*moves + move], togo, face):
+                    return True
+                path.pop()
+            return time.perf_counter() > deadline
+
+        twist, flip, slice_position, corner = cube.corner_twist(), cube.edge_flip(), cube.ud_slice(), cube.corner_permutation()
+        if twist == flip == slice_position == 0:
+            #Already in the phase 2 subgroup, a phase 1 of length 0
+            start_phase2(corner, -1)
+        depth = max(1, twist_slice[twist*slices + slice_position], flip_slice[flip*slices + slice_position])
+        while depth < limit[0] and (best[0] is None or len(best[0]) > max_length) and time.perf_counter() <= deadline:
+            if phase1(twist, flip, slice_position, corner, depth, -1):
+                break
+            depth += 1
+        self.nodes = nodes
+        self.search_time = time.perf_counter() - start
+        if best[0] is None:
+            return None
+        return " ".join([rotation] + [face_turns[x] for x in best[0]]).strip()
+
+    def solve_batch(self, cubes, max_length = 21, time_budget = 1.0):
+        '''
+        solve for every cube in a list of GroupCubes, scramble strings or states (time_budget is per cube).
+        Returns the list of solutions, their lengths are distance estimates.
+        '''
+        return [self.solve(cube, max_length, time_budget) for cube in cubes]
+
+
+if __name__ == "__main__":
+    import random
+    start = time.perf_counter()
+    solver = TwoPhaseSolver()
+    print("Tables ready in " + str(round(time.perf_counter() - start, 2)) + "s")
+
+    #Fixed benchmark set of random 25 move scrambles
+    generator = random.Random(2020)
+    scrambles = [" ".join(generator.choice(face_turns) for x in range(25)) for y in range(10)]
+    for max_length in (30, 23, 21):
+        start = time.perf_counter()
+        solutions = solver.solve_batch(scrambles, max_length = max_length, time_budget = 5.0)
+        elapsed = time.perf_counter() - start
+        correct = 0
+        for scramble, solution in zip(scrambles, solutions):
+            rubik = GroupCube()
+            rubik(scramble)
+            rubik(solution)
+            correct += rubik.is_solved()
+        lengths = [len(x.split()) for x in solutions]
+        print("max_length " + str(max_length) + ": " + str(correct) + "/" + str(len(scrambles)) + " solved, average length "
+              + str(round(sum(lengths)/len(lengths), 2)) + ", longest " + str(max(lengths)) + ", "
+              + str(round(elapsed/len(scrambles)*1000, 1)) + "ms per cube")
+
+    rubik = GroupCube()
+    rubik("R U F' x y2")
+    print("Rotated cube: " + solver.solve(rubik))
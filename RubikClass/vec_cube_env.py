@@ -0,0 +1,169 @@
+import numpy as np
+
+from batched_sticker_cube import BatchedStickerCube
+from goals import goal_id
+from rewards import notebook_reward
+
+#Color codes 0-5 are the six face colors (see sticker_colors)
+_face_colors = np.arange(6, dtype = np.uint8)
+
+
+class VecCubeEnv:
+    """
+    A batch of B cube environments stepped together, the vectorized replacement for the Environment in ACTUALREINFORCE.ipynb.
+
+    Same rules as that Environment: actions index into valid_turns, the reward is the sum over the faces of the count of the most common
+    color on the face plus 20 when solved, and an episode ends when the cube is solved or after max_steps steps.
+    Cubes whose episode ended are reset to a fresh scramble inside step, so every call returns the first observation of their next episode.
+
+        env = VecCubeEnv(1024, seed = 0)
+        obs = env.reset()
+        obs, reward, done = env.step(np.random.randint(0, len(env.valid_turns), size = 1024))
+
+    Observations are contiguous arrays of shape (B, 54, 6) float32 one-hot colors (observation = "onehot"),
+    or the (B, 54) uint8 color codes of BatchedStickerCube (observation = "codes").
+
+    goals picks what counts as solved (see goals.py): one Goal, goal name or id for every cube, or a sequence of them with one per cube,
+    so a single batch can mix full solves with F2L or cross episodes. By default every cube has to be fully solved.
+
+    reward replaces the notebook reward with any reward(states, solved) -> (B,) function of the (B, 54) color codes (see rewards.py),
+    e.g. weighted_reward([(1, stickers_in_place)], solved_bonus = 20). If it also has update(before, after, moves) and
+    reset_rows(rows, states), like IncrementalMajorityReward, it is told about every move and every reset.
+    """
+    valid_turns = ["U", "U'", "R", "R'", "L", "L'", "F", "F'", "B", "B'", "D", "D'"]
+    solved_reward = 20
+
+    def __init__(self, number_of_cubes, scramble_length = 20, max_steps = 50, valid_turns = None, observation = "onehot", seed = None, goals = None,
+                 reward = None):
+        if observation not in ("onehot", "codes"):
+            raise ValueError("observation has to be 'onehot' or 'codes', not " + str(observation))
+        if valid_turns is not None:
+            self.valid_turns = list(valid_turns)
+        self.number_of_cubes = number_of_cubes
+        self.scramble_length = scramble_length
+        self.max_steps = max_steps
+        self.observation = observation
+        self.random = np.random.default_rng(seed)
+        self.cubes = BatchedStickerCube(number_of_cubes)
+        if goals is not None:
+            if isinstance(goals, (list, tuple, np.ndarray)):
+                self.cubes.goal_ids = np.array([goal_id(x) for x in goals], dtype = np.intp)
+            else:
+                self.cubes.goal_ids = np.full(number_of_cubes, goal_id(goals), dtype = np.intp)
+        #Action i is the move BatchedStickerCube.moves[self._actions[i]]
+        self._actions = np.array([BatchedStickerCube.move_index[x] for x in self.valid_turns], dtype = np.intp)
+        self.steps = np.zeros(number_of_cubes, dtype = np.int64)
+        self.reward = reward
+
+    def __len__(self):
+        return self.number_of_cubes
+
+    def _scramble(self, rows = None):
+        '''
+        Resets the cubes in rows (every cube when None) and turns each of them scramble_length random valid turns.
+        '''
+        if rows is None:
+            rows = np.arange(self.number_of_cubes)
+        self.cubes.reset(rows)
+        self.steps[rows] = 0
+        if not len(rows):
+            return
+        turns = self._actions[self.random.integers(0, len(self._actions), size = (self.scramble_length, len(rows)))]
+        state = self.cubes.current_state[rows]
+        for moves in turns:
+            state = np.take_along_axis(state, BatchedStickerCube.move_table[moves], axis = 1)
+        self.cubes.current_state[rows] = state
+        if hasattr(self.reward, "reset_rows"):
+            self.reward.reset_rows(rows, self.cubes.current_state)
+
+    def reset(self, obs_out = None):
+        '''
+        Scrambles every cube and returns the observation.
+        '''
+        self._scramble()
+        return self.observations(obs_out)
+
+    def observations(self, out = None):
+        '''
+        Encodes the current states, writing into out when given.
+        '''
+        codes = self.cubes.current_state
+        if self.observation == "codes":
+            if out is None:
+                return codes.copy()
+            out[:] = codes
+            return out
+        if out is None:
+            out = np.empty((len(codes), 54, len(_face_colors)), dtype = np.float32)
+        np.equal(codes[:, :, None], _face_colors, out = out)
+        return out
+
+    def solved(self):
+        '''
+        Boolean array, True for every cube that is solved (reached its goal).
+        '''
+        return self.cubes.is_solved()
+
+    def rewards(self, solved = None, out = None):
+        '''
+        The reward of every cube, by default the notebook reward: the count of the most common color on each face summed over the faces,
+        plus 20 when solved.
+        '''
+        if solved is None:
+            solved = self.solved()
+        if self.reward is None:
+            reward = notebook_reward(self.cubes.current_state, solved, self.solved_reward)
+        else:
+            reward = self.reward(self.cubes.current_state, solved)
+        if out is None:
+            return np.asarray(reward, dtype = np.float32)
+        np.copyto(out, reward, casting = "unsafe")
+        return out
+
+    def step(self, actions, obs_out = None, reward_out = None, done_out = None):
+        '''
+        Turns cube i by valid_turns[actions[i]] and returns (obs, reward, done).
+
+        reward and done are for the step just taken, obs is already the start of the next episode for every cube that is done.
+        Pass preallocated arrays as obs_out, reward_out and done_out to avoid allocating every step.
+        '''
+        moves = self._actions[np.asarray(actions)]
+        before = self.cubes.current_state
+        self.cubes.turn_each(moves)
+        if hasattr(self.reward, "update"):
+            self.reward.update(before, self.cubes.current_state, moves)
+        self.steps += 1
+        solved = self.solved()
+        reward = self.rewards(solved, reward_out)
+        if done_out is None:
+            done_out = np.empty(self.number_of_cubes, dtype = bool)
+        np.logical_or(solved, self.steps >= self.max_steps, out = done_out)
+        self._scramble(np.flatnonzero(done_out))
+        return self.observations(obs_out), reward, done_out
+
+
+if __name__ == "__main__":
+    import time
+
+    number = 4096
+    env = VecCubeEnv(number, seed = 0)
+    obs = env.reset()
+    reward = np.empty(number, dtype = np.float32)
+    done = np.empty(number, dtype = bool)
+    steps = 200
+    start = time.perf_counter()
+    for i in range(steps):
+        env.step(env.random.integers(0, len(env.valid_turns), size = number), obs, reward, done)
+    elapsed = time.perf_counter() - start
+    print("Stepped " + str(number) + " cubes " + str(steps) + " times: " + str(round(number*steps/elapsed)) + " cube steps per second")
+
+    #The same loop one cube at a time, the way the notebook Environment does it (without building the image)
+    from sticker_cube import StickerCube
+    cubes = [StickerCube() for x in range(number)]
+    start = time.perf_counter()
+    for cube in cubes:
+        cube.turn("R")
+        faces = [cube.current_state[(i*9):((i+1)*9)] for i in range(6)]
+        sum(max(face.count(x) for x in set(face)) for face in faces) + 20*cube.is_solved()
+    elapsed = time.perf_counter() - start
+    print("One cube at a time: " + str(round(number/elapsed)) + " cube steps per second")
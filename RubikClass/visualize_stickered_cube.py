@@ -1,5 +1,43 @@
 import numpy as np
 
+#Pixel value of every sticker, colorful (3 channels) and black and white (1 channel)
+color_palette = {"w":[255,255,255],"b":[0,0,255],"r":[255,0,0],"g":[0,255,0],
+                 "o":[255,165,0],"y":[255,255,0],"e":[128,128,128],"":[0,0,0]}
+bandw_palette = {"w":[1],"b":[2/7],"r":[3/7],"g":[4/7],"o":[5/7],"y":[6/7],"e":[1/7],"":[0]}
+#The sticker shown by each pixel of the (6, 9) image: the top three rows are the U, B and R faces side by side, the bottom three F, L and D.
+sticker_layout = [[face*9 + 3*row + column for face in faces for column in range(3)] for faces in ((0, 1, 2), (3, 4, 5)) for row in range(3)]
+#Same order as sticker_cube.sticker_colors, so row i of a lookup table is the pixel for sticker code i
+_palette_order = ['w', 'b', 'r', 'g', 'o', 'y', 'e', '']
+_layout_index = np.array(sticker_layout, dtype = np.intp)
+
+
+def color_lookup_table(bandw = False, dtype = np.uint8):
+    '''
+    (8, C) table of the pixel for every sticker code. float32 keeps the values pixel_value_sticker uses,
+    uint8 black and white is scaled from 0-1 up to 0-255.
+    '''
+    palette = bandw_palette if bandw else color_palette
+    table = np.array([palette[x] for x in _palette_order], dtype = np.float64)
+    if bandw and np.dtype(dtype) == np.uint8:
+        table = np.round(table*255)
+    return table.astype(dtype)
+
+_lookup_tables = {}
+
+def render_stickers(codes, bandw = False, dtype = np.uint8, out = None):
+    '''
+    Batched pixel_value_sticker: an (N, 54) array of sticker codes (see BatchedStickerCube) becomes (N, 6, 9, C) images,
+    C = 3 in color and 1 in black and white, with one gather through the sticker layout and one through the color lookup table.
+
+    Pass out (an (N, 6, 9, C) array of the requested dtype) to render into it instead of allocating.
+    '''
+    key = (bandw, np.dtype(dtype))
+    if key not in _lookup_tables:
+        _lookup_tables[key] = color_lookup_table(bandw, dtype)
+    table = _lookup_tables[key]
+    codes = np.asarray(codes).reshape(-1, 54)
+    return np.take(table, np.take(codes, _layout_index, axis = 1), axis = 0, out = out)
+
 
 def pixel_value_sticker(sticker_array = None, bandw = False):
     if sticker_array is None:
@@ -8,11 +46,10 @@ def pixel_value_sticker(sticker_array = None, bandw = False):
         stickers = sticker_array
     #Get the whole thingy majig
     if bandw:
-        color_remap= {"w":[1],"b":[2/7],"r":[3/7],"g":[4/7],"o":[5/7],"y":[6/7],"e":[1/7],"":[0]}
+        color_remap = bandw_palette
         channels = 1
     else:
-        color_remap = {"w":[255,255,255],"b":[0,0,255],"r":[255,0,0],"g":[0,255,0],
-                       "o":[255,165,0],"y":[255,255,0],"e":[128,128,128],"":[0,0,0]}
+        color_remap = color_palette
         channels = 3
     #stickies = [color_remap[x] for x in stickers]
     out = []
@@ -30,3 +67,17 @@ def pixel_value_sticker(sticker_array = None, bandw = False):
                 hmm.extend(stickies[(18+3*j):(21+j*3)])
                 out.append(hmm)
     return np.array(out)
+
+
+if __name__ == "__main__":
+    import timeit
+    number = 1024
+    codes = np.random.randint(0, 8, size = (number, 54)).astype(np.uint8)
+    stickers = [[_palette_order[x] for x in row] for row in codes]
+    print("Same pixels as pixel_value_sticker: " + str(all((render_stickers(codes, dtype = np.float32)[i] == pixel_value_sticker(stickers[i])).all()
+                                                          and np.allclose(render_stickers(codes, True, np.float32)[i], pixel_value_sticker(stickers[i], True))
+                                                          for i in range(number))))
+    looped = timeit.timeit(lambda: [pixel_value_sticker(x) for x in stickers], number = 5)/5
+    out = np.empty((number, 6, 9, 3), dtype = np.uint8)
+    batched = timeit.timeit(lambda: render_stickers(codes, out = out), number = 100)/100
+    print("Rendering " + str(number) + " cubes: " + str(round(looped*1000, 2)) + "ms with pixel_value_sticker, " + str(round(batched*1000, 3)) + "ms batched")
@@ -0,0 +1,223 @@
+"""
+Experience replay for DQNAgent, stored in preallocated ring arrays instead of a deque of tuples.
+
+Experiences (s, a, r, s', done) go into fixed size numpy arrays (uint8 states by default, int8 actions, float32 rewards, bool dones),
+the oldest being overwritten once the buffer is full. Sampling a minibatch is a handful of fancy-index gathers, O(batch) no matter
+how full the buffer is, and comes back as arrays ready for model.predict.
+
+Optionally samples proportionally to priorities kept in a sum tree (prioritized experience replay), and optionally keeps every array in
+memory-mapped .npy files in a directory so a training run can pick its memory back up:
+
+    memory = ReplayBuffer(100_000, directory = "replay")   #reopens replay/ if it is already there
+    memory.add(state, action, reward, new_state, done)
+    states, actions, rewards, new_states, dones = memory.sample(64)
+    memory.flush()                                           #before quitting
+"""
+import json
+import os
+
+import numpy as np
+
+
+class SumTree:
+    '''
+    Binary tree over a power of two number of leaves where every node holds the sum of its children, stored flat (node i has
+    children 2i and 2i+1, the root is node 1 and leaf j is node leaves + j). Updating and sampling a batch are both O(batch log n).
+    '''
+    def __init__(self, capacity, tree = None):
+        self.leaves = 1 << max(0, int(capacity - 1).bit_length())
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2*self.leaves, dtype = np.float64) if tree is None else tree
+
+    def total(self):
+        return float(self.tree[1])
+
+    def get(self, indices):
+        return self.tree[self.leaves + np.asarray(indices)]
+
+    def update(self, indices, values):
+        '''
+        Sets the leaves at indices to values and fixes the sums above them.
+        '''
+        nodes = self.leaves + np.asarray(indices, dtype = np.int64)
+        self.tree[nodes] = values
+        for level in range(self.depth):
+            #Repeated nodes just get the same sum written twice
+            nodes = nodes >> 1
+            self.tree[nodes] = self.tree[2*nodes] + self.tree[2*nodes + 1]
+
+    def find(self, values):
+        '''
+        Index of the leaf where each value falls in the running sum of the leaves.
+        '''
+        values = np.array(values, dtype = np.float64)
+        nodes = np.ones(len(values), dtype = np.int64)
+        for level in range(self.depth):
+            left = self.tree[2*nodes]
+            right = values >= left
+            values -= left*right
+            nodes = 2*nodes + right
+        return nodes - self.leaves
+
+
+class ReplayBuffer:
+    '''
+    Ring buffer of experiences. See the module docstring.
+
+    Parameters:
+        - capacity: how many experiences to hold on to
+        - state_shape: shape of one state, (54,) for BatchedStickerCube / VecCubeEnv color codes
+        - state_dtype: dtype states are stored as, uint8 holds color codes and 0-255 pixels without loss
+        - prioritized: sample in proportion to priority**alpha and return importance sampling weights (with exponent beta)
+        - directory: keep the arrays in memory-mapped .npy files there, resuming from them when they already exist
+    '''
+    def __init__(self, capacity, state_shape = (54,), state_dtype = np.uint8, prioritized = False, alpha = 0.6, beta = 0.4, epsilon = 1e-6, directory = None, seed = None):
+        self.capacity = capacity
+        self.state_shape = tuple(state_shape)
+        self.state_dtype = np.dtype(state_dtype)
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.directory = directory
+        self.random = np.random.default_rng(seed)
+        #Where the next experience goes, and how many are stored
+        self.position = 0
+        self.size = 0
+        self.max_priority = 1.0
+        meta = None
+        if directory is not None:
+            os.makedirs(directory, exist_ok = True)
+            if os.path.exists(os.path.join(directory, "meta.json")):
+                with open(os.path.join(directory, "meta.json")) as f:
+                    meta = json.load(f)
+                if (meta["capacity"] != capacity or tuple(meta["state_shape"]) != self.state_shape
+                        or meta.get("state_dtype", "uint8") != self.state_dtype.name or meta["prioritized"] != prioritized):
+                    raise ValueError("The buffer in " + directory + " was made with different settings: " + str(meta))
+                self.position, self.size, self.max_priority = meta["position"], meta["size"], meta["max_priority"]
+        self.states = self._array("states", (capacity,) + self.state_shape, self.state_dtype, meta)
+        self.actions = self._array("actions", (capacity,), np.int8, meta)
+        self.rewards = self._array("rewards", (capacity,), np.float32, meta)
+        self.new_states = self._array("new_states", (capacity,) + self.state_shape, self.state_dtype, meta)
+        self.dones = self._array("dones", (capacity,), np.bool_, meta)
+        self.tree = None
+        if prioritized:
+            leaves = SumTree(capacity).leaves
+            self.tree = SumTree(capacity, self._array("priorities", (2*leaves,), np.float64, meta))
+
+    def _array(self, name, shape, dtype, meta):
+        '''
+        A zeroed array, or a memory-mapped .npy file in directory (reopened when resuming).
+        '''
+        if self.directory is None:
+            return np.zeros(shape, dtype = dtype)
+        path = os.path.join(self.directory, name + ".npy")
+        if meta is not None:
+            return np.load(path, mmap_mode = "r+")
+        return np.lib.format.open_memmap(path, mode = "w+", dtype = dtype, shape = shape)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, new_state, done):
+        '''
+        Stores one experience, same order as the (s, a, r, s', done) tuples DQNAgent used to append.
+        '''
+        self.add_batch(np.asarray(state)[None], [action], [reward], np.asarray(new_state)[None], [done])
+
+    def add_batch(self, states, actions, rewards, new_states, dones):
+        '''
+        Stores one experience per row, e.g. straight from a VecCubeEnv step.
+        '''
+        number = len(actions)
+        indices = (self.position + np.arange(number)) % self.capacity
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.new_states[indices] = new_states
+        self.dones[indices] = dones
+        if self.prioritized:
+            #New experiences get the highest priority so far, so they are all seen at least once
+            self.tree.update(indices[-self.capacity:], self.max_priority**self.alpha)
+        self.position = (self.position + number) % self.capacity
+        self.size = min(self.size + number, self.capacity)
+
+    def sample(self, batch_size):
+        '''
+        Returns (states, actions, rewards, new_states, dones) arrays of batch_size random experiences.
+
+        In prioritized mode, returns (states, actions, rewards, new_states, dones, indices, weights) instead, where weights are the
+        importance sampling weights to scale the loss by and indices go back into update_priorities.
+        '''
+        if self.prioritized:
+            #One sample from each of batch_size equal slices of the total priority
+            total = self.tree.total()
+            values = (np.arange(batch_size) + self.random.random(batch_size))*(total/batch_size)
+            indices = np.minimum(self.tree.find(values), self.size - 1)
+            probabilities = self.tree.get(indices)/total
+            weights = (self.size*probabilities)**-self.beta
+            weights = (weights/weights.max()).astype(np.float32)
+        else:
+            indices = self.random.integers(0, self.size, size = batch_size)
+        batch = (self.states[indices], self.actions[indices], self.rewards[indices], self.new_states[indices], self.dones[indices])
+        if self.prioritized:
+            return batch + (indices, weights)
+        return batch
+
+    def update_priorities(self, indices, priorities):
+        '''
+        New priorities (usually the absolute TD errors) for the experiences sampled at indices. Only for a prioritized buffer.
+        '''
+        if self.tree is None:
+            raise ValueError("update_priorities needs a buffer made with prioritized = True")
+        priorities = np.abs(np.asarray(priorities, dtype = np.float64)) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities**self.alpha)
+
+    def flush(self):
+        '''
+        Writes everything to directory, so a new ReplayBuffer on the same directory resumes from here.
+        '''
+        if self.directory is None:
+            return
+        arrays = [self.states, self.actions, self.rewards, self.new_states, self.dones] + ([self.tree.tree] if self.prioritized else [])
+        for array in arrays:
+            array.flush()
+        meta = {"capacity": self.capacity, "state_shape": list(self.state_shape), "state_dtype": self.state_dtype.name,
+                "prioritized": self.prioritized, "position": self.position, "size": self.size, "max_priority": self.max_priority}
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from collections import deque
+
+    capacity = 100_000
+    batch = 64
+    states = np.random.randint(0, 6, size = (capacity, 54), dtype = np.uint8)
+
+    memory = deque(maxlen = capacity)
+    for i in range(capacity):
+        memory.append((states[i], i % 12, 1.0, states[i], False))
+    start = time.perf_counter()
+    for i in range(1000):
+        minibatch = random.sample(memory, batch)
+        current_states = np.array([experience[0] for experience in minibatch])
+        new_states = np.array([experience[3] for experience in minibatch])
+    deque_time = (time.perf_counter() - start)/1000
+
+    for prioritized in (False, True):
+        buffer = ReplayBuffer(capacity, prioritized = prioritized, seed = 0)
+        buffer.add_batch(states, np.arange(capacity) % 12, np.ones(capacity), states, np.zeros(capacity, dtype = bool))
+        start = time.perf_counter()
+        for i in range(1000):
+            sampled = buffer.sample(batch)
+            if prioritized:
+                buffer.update_priorities(sampled[5], np.random.random(batch))
+        buffer_time = (time.perf_counter() - start)/1000
+        print("Minibatch of " + str(batch) + ": deque " + str(round(deque_time*1e6)) + "us, ring buffer" + (" (prioritized)" if prioritized else "")
+              + " " + str(round(buffer_time*1e6)) + "us")
+    print("Memory for " + str(capacity) + " experiences: ring buffer " + str(round(sum(x.nbytes for x in
+          (buffer.states, buffer.actions, buffer.rewards, buffer.new_states, buffer.dones))/2**20, 1)) + "MB")